@@ -0,0 +1,93 @@
+import argparse
+import json
+import subprocess
+import sys
+
+'''
+Import-time benchmark for pyrlap and demoteaching. Each module is imported
+in a fresh interpreter (so nothing is already cached in sys.modules), the
+best of several runs is compared against a time budget, and the modules
+that the import should not pull in (heavy optional dependencies that are
+only needed for planning, discretization or plotting) are checked.
+
+    python benchmarks/import_time.py [--repeats 5] [--scale 1.0] [--json]
+
+Exits with status 1 if any budget is exceeded.
+'''
+
+HEAVY_MODULES = ('scipy', 'sklearn', 'matplotlib', 'torch', 'pandas')
+
+# module: seconds
+IMPORT_BUDGETS = {
+    'pyrlap.core.mdp': .5,
+    'pyrlap.domains.gridworld': .5,
+    'pyrlap.domains.taxicab': .5,
+    'pyrlap.algorithms.valueiteration': .5,
+    'pyrlap.algorithms.soft_vi': .5,
+    'pyrlap.algorithms.freeenergy_vi': .5,
+    'demoteaching.mdps.obs_belief_mdp': .5,
+    'demoteaching.mdps.discretizedobmdp': .5,
+}
+
+_PROBE = '''
+import sys, time, json
+start = time.perf_counter()
+import pyrlap.core.mdp
+import %s
+elapsed = time.perf_counter() - start
+print(json.dumps({
+    'seconds': elapsed,
+    'loaded': [m for m in %r if m in sys.modules]
+}))
+'''
+
+def time_import(module, repeats=5):
+    """
+    Best time (in seconds) to import module in a fresh interpreter, and
+    the heavy modules that it loaded
+    """
+    # pyrlap.core.mdp is imported first because importing some pyrlap
+    # submodules directly hits a circular import
+    runs = []
+    for _ in range(repeats):
+        out = subprocess.check_output(
+            [sys.executable, '-c', _PROBE % (module, HEAVY_MODULES)])
+        runs.append(json.loads(out.decode().strip().split('\n')[-1]))
+    return min(r['seconds'] for r in runs), runs[0]['loaded']
+
+def run_benchmark(budgets=None, repeats=5, scale=1.0):
+    if budgets is None:
+        budgets = IMPORT_BUDGETS
+    results = []
+    for module, budget in sorted(budgets.items()):
+        seconds, loaded = time_import(module, repeats=repeats)
+        results.append({
+            'module': module,
+            'seconds': seconds,
+            'budget': budget*scale,
+            'heavy_modules': loaded,
+            'ok': seconds <= budget*scale and len(loaded) == 0
+        })
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Check import times of pyrlap and demoteaching modules")
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help="multiplier on every budget (e.g. for slow "
+                             "machines)")
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    results = run_benchmark(repeats=args.repeats, scale=args.scale)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for r in results:
+            print("%-40s %6.3fs (budget %.2fs) %s %s" % (
+                r['module'], r['seconds'], r['budget'],
+                ' '.join(r['heavy_modules']),
+                'ok' if r['ok'] else 'FAIL'))
+    if not all(r['ok'] for r in results):
+        sys.exit(1)
@@ -0,0 +1,360 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from itertools import product
+
+import numpy as np
+
+from pyrlap.domains.gridworld import GridWorld
+from pyrlap.algorithms.valueiteration import ValueIteration
+from pyrlap.algorithms.soft_vi import SoftValueIteration
+from pyrlap.core.rollouts import RolloutSimulator
+from demoteaching.mdps.discretizedobmdp import \
+    DiscretizedObserverBeliefMDPApproximation
+
+'''
+Time and peak-memory benchmarks for the pyrlap planners, OBMDP
+construction, trajectory simulation and OBMDP trajectory scoring.
+
+    python benchmarks/planners.py results.json [--quick]
+    python benchmarks/planners.py new.json --compare old.json
+
+Each case is run once to warm up and then `repeats` times, and the best
+wall time is kept. Peak memory is measured (with tracemalloc) on one
+additional run so that tracing does not slow down the timed runs.
+Results are stored as JSON along with the commit and library versions,
+and --compare reports the cases that got slower than a previous results
+file.
+'''
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARK_DIR)
+EXP1_DIR = os.path.join(REPO_DIR, 'experiments', 'exp1a-analysis')
+EXP1_TRAJS = os.path.join(REPO_DIR, 'experiments', 'data',
+                          'exp1-demon_trajs.pd.pkl')
+
+GRID_SIZES = (5, 10, 20)
+N_MDPS = (2, 4, 8)
+N_BINS = (3, 5, 8)
+
+QUICK_GRID_SIZES = (5, 10)
+QUICK_N_MDPS = (2, 4)
+QUICK_N_BINS = (3, 5)
+
+def measure(run, setup=None, repeats=3, warmup=True):
+    """
+    Best wall time (seconds) of run(setup()) over repeats calls and the
+    peak memory (bytes) allocated during one more call. setup is not
+    timed. With warmup, run is called once first so that lazy imports and
+    caches are not counted.
+    """
+    if setup is None:
+        setup = lambda: None
+    if warmup:
+        run(setup())
+    times = []
+    for _ in range(repeats):
+        arg = setup()
+        gc.collect()
+        start = time.perf_counter()
+        run(arg)
+        times.append(time.perf_counter() - start)
+
+    arg = setup()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        run(arg)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'seconds': min(times), 'all_seconds': times, 'peak_bytes': peak}
+
+# ================================= #
+#            Test problems          #
+# ================================= #
+
+def feature_gridworld(size, feature_rewards=None, seed=0, **kwargs):
+    """
+    size x size grid of randomly placed 'a', 'b' and 'c' tiles (and blank
+    '.' tiles), starting in the bottom left with the goal 'y' in the top
+    right
+    """
+    if feature_rewards is None:
+        feature_rewards = {'a': -1, 'b': 0, 'c': 0}
+    rng = np.random.RandomState(seed)
+    tiles = rng.choice(list('.abc'), size=(size, size))
+    tiles[0, -1] = 'y'
+    tiles[-1, 0] = '.'
+    feature_rewards = dict(feature_rewards)
+    feature_rewards.update({'y': 10, '.': 0})
+    return GridWorld(
+        gridworld_array=[''.join(row) for row in tiles],
+        feature_rewards=feature_rewards,
+        absorbing_states=[(size - 1, size - 1), ],
+        init_state=(0, 0),
+        **kwargs)
+
+def hypothesis_planners(size, n_mdps, seed=0):
+    """
+    Solved planners for n_mdps (<= 8) gridworlds that share a layout but
+    differ in which of the features are dangerous
+    """
+    planners = {}
+    for rs in list(product([0, -2], repeat=3))[:n_mdps]:
+        code = ''.join('o' if r == 0 else 'x' for r in rs)
+        mdp = feature_gridworld(size, dict(zip('abc', rs)), seed=seed,
+                                include_intermediate_terminal=True)
+        planners[code] = mdp.solve(discount_rate=.99,
+                                   softmax_temp=.5,
+                                   randchoose=.1)
+    return planners
+
+def seed_trajectories(planner, n_trajs=10, seed=0):
+    np.random.seed(seed)
+    trajs = []
+    for _ in range(n_trajs):
+        traj = planner.run(softmax_temp=.5, randchoose=.1)
+        trajs.append(tuple((s, a) for s, a, ns, r in traj))
+    return trajs
+
+# ================================= #
+#             Benchmarks            #
+# ================================= #
+
+def bench_gridworld_solve(size, repeats):
+    return measure(
+        setup=lambda: feature_gridworld(size),
+        run=lambda mdp: mdp.solve(discount_rate=.99, softmax_temp=.5),
+        repeats=repeats)
+
+def bench_value_iteration(size, repeats):
+    mdp = feature_gridworld(size)
+    return measure(
+        setup=lambda: ValueIteration(mdp, discount_rate=.99),
+        run=lambda planner: planner.solve(),
+        repeats=repeats)
+
+def bench_soft_value_iteration(size, repeats, sparse=False):
+    mdp = feature_gridworld(size)
+    mdp.get_compiled_model(sparse=sparse)
+    return measure(
+        setup=lambda: SoftValueIteration(mdp, discount_rate=.99,
+                                         softmax_temp=1.0, sparse=sparse),
+        run=lambda planner: planner.solve(),
+        repeats=repeats)
+
+def bench_rollouts(size, repeats, n_trajs=200):
+    planner = feature_gridworld(size).solve(discount_rate=.99,
+                                            softmax_temp=.5,
+                                            randchoose=.1)
+    result = measure(
+        run=lambda _: [planner.run() for _ in range(n_trajs)],
+        repeats=repeats)
+    result['n_trajs'] = n_trajs
+    return result
+
+def bench_rollout_simulator(size, repeats, n_trajs=200):
+    planner = feature_gridworld(size).solve(discount_rate=.99,
+                                            softmax_temp=.5,
+                                            randchoose=.1)
+    simulator = RolloutSimulator(planner)
+    result = measure(
+        run=lambda _: simulator.run(n_trajs),
+        repeats=repeats)
+    result['n_trajs'] = n_trajs
+    return result
+
+def bench_obmdp_build(size, n_mdps, n_bins, repeats):
+    planners = hypothesis_planners(size, n_mdps)
+    true_name = sorted(planners)[-1]
+    seed_trajs = seed_trajectories(planners[true_name])
+    return measure(
+        run=lambda _: DiscretizedObserverBeliefMDPApproximation(
+            n_probability_bins=n_bins,
+            seed_trajs=seed_trajs,
+            planners=planners,
+            true_planner_name=true_name,
+            belief_reward=5),
+        repeats=repeats)
+
+def _exp1_model(n_bins, trajs):
+    if EXP1_DIR not in sys.path:
+        sys.path.insert(0, EXP1_DIR)
+    from models import OBMDPModel
+    model = OBMDPModel(true_mdp_code='xoo',
+                       do_discount=.99, do_randchoose=.05, do_temp=.5,
+                       show_discount=.9, show_reward=5,
+                       show_randchoose=.05, show_temp=.1,
+                       n_bins=n_bins,
+                       seed_trajs=trajs,
+                       tf_cache=None)
+    model.get_planner()
+    return model
+
+def _exp1_trajectories():
+    import pandas as pd
+    demon_data = pd.read_pickle(EXP1_TRAJS)
+    return [tuple(t) for t in demon_data['traj']]
+
+def bench_obmdp_loglikelihood(n_bins, repeats, trajs=None):
+    """
+    Scores the Experiment 1 demonstrations under an OBMDPModel (built and
+    solved outside of the timing)
+    """
+    if trajs is None:
+        trajs = _exp1_trajectories()
+    model = _exp1_model(n_bins, list(set(trajs)))
+    result = measure(
+        run=lambda _: [model.trajectory_loglikelihood(t) for t in trajs],
+        repeats=repeats)
+    result['n_trajs'] = len(trajs)
+    return result
+
+def bench_obmdp_batch_loglikelihood(n_bins, repeats, trajs=None):
+    """
+    Scores the Experiment 1 demonstrations as one batch with
+    OBMDPModel.trajectories_loglikelihood. The log-policy table is built
+    during the warmup call, so only scoring is timed.
+    """
+    if trajs is None:
+        trajs = _exp1_trajectories()
+    model = _exp1_model(n_bins, list(set(trajs)))
+    result = measure(
+        run=lambda _: model.trajectories_loglikelihood(trajs),
+        repeats=repeats)
+    result['n_trajs'] = len(trajs)
+    return result
+
+# ================================= #
+#               Suite               #
+# ================================= #
+
+def benchmark_cases(sizes=GRID_SIZES, n_mdps=N_MDPS, n_bins=N_BINS,
+                    obmdp_size=5):
+    """
+    (name, params, function) for every case. OBMDP cases scale the number
+    of hypothesis MDPs and probability bins on an obmdp_size grid.
+    """
+    cases = []
+    for size in sizes:
+        cases.append(('GridWorld.solve', {'size': size},
+                      bench_gridworld_solve))
+        cases.append(('ValueIteration.solve', {'size': size},
+                      bench_value_iteration))
+        cases.append(('SoftValueIteration.solve', {'size': size},
+                      bench_soft_value_iteration))
+        cases.append(('SoftValueIteration.solve',
+                      {'size': size, 'sparse': True},
+                      bench_soft_value_iteration))
+        cases.append(('Agent.run', {'size': size}, bench_rollouts))
+        cases.append(('RolloutSimulator.run', {'size': size},
+                      bench_rollout_simulator))
+    for n, bins in product(n_mdps, n_bins):
+        cases.append(('DiscretizedObserverBeliefMDPApproximation.build',
+                      {'size': obmdp_size, 'n_mdps': n, 'n_bins': bins},
+                      bench_obmdp_build))
+    if os.path.exists(EXP1_TRAJS):
+        for bins in n_bins:
+            cases.append(('OBMDPModel.trajectory_loglikelihood',
+                          {'n_bins': bins},
+                          bench_obmdp_loglikelihood))
+            cases.append(('OBMDPModel.trajectories_loglikelihood',
+                          {'n_bins': bins},
+                          bench_obmdp_batch_loglikelihood))
+    return cases
+
+def case_key(result):
+    return result['name'] + json.dumps(result['params'], sort_keys=True)
+
+def run_suite(cases, repeats=3, log=None):
+    results = []
+    for name, params, bench in cases:
+        result = bench(repeats=repeats, **params)
+        result.update({'name': name, 'params': params})
+        results.append(result)
+        if log is not None:
+            log(result)
+    return results
+
+def environment_info():
+    try:
+        commit = subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], cwd=REPO_DIR,
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (subprocess.CalledProcessError, OSError):
+        commit = None
+    return {
+        'commit': commit,
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+    }
+
+def compare(results, baseline, tolerance=1.25):
+    """
+    Cases whose time (or peak memory) is more than tolerance times that of
+    the same case in baseline, as (key, metric, old, new)
+    """
+    old = {case_key(r): r for r in baseline}
+    regressions = []
+    for r in results:
+        key = case_key(r)
+        if key not in old:
+            continue
+        for metric in ('seconds', 'peak_bytes'):
+            if r[metric] > tolerance*old[key][metric]:
+                regressions.append((key, metric, old[key][metric], r[metric]))
+    return regressions
+
+def _print_result(r):
+    params = ' '.join('%s=%s' % kv for kv in sorted(r['params'].items()))
+    print("%-48s %-28s %9.4fs %9.1fMB" % (
+        r['name'], params, r['seconds'], r['peak_bytes']/2**20))
+    sys.stdout.flush()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Benchmark pyrlap planners and OBMDP construction")
+    parser.add_argument('results', help="json file to write results to")
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--quick', action='store_true',
+                        help="only the smaller problem sizes")
+    parser.add_argument('--sizes', type=int, nargs='+', default=None)
+    parser.add_argument('--n-mdps', type=int, nargs='+', default=None)
+    parser.add_argument('--n-bins', type=int, nargs='+', default=None)
+    parser.add_argument('--filter', default=None,
+                        help="only run cases whose name contains this")
+    parser.add_argument('--compare', default=None,
+                        help="previous results file to check against")
+    parser.add_argument('--tolerance', type=float, default=1.25)
+    args = parser.parse_args()
+
+    sizes = args.sizes or (QUICK_GRID_SIZES if args.quick else GRID_SIZES)
+    n_mdps = args.n_mdps or (QUICK_N_MDPS if args.quick else N_MDPS)
+    n_bins = args.n_bins or (QUICK_N_BINS if args.quick else N_BINS)
+    cases = benchmark_cases(sizes, n_mdps, n_bins)
+    if args.filter is not None:
+        cases = [c for c in cases if args.filter in c[0]]
+
+    results = run_suite(cases, repeats=args.repeats, log=_print_result)
+    with open(args.results, 'w') as f:
+        json.dump({'environment': environment_info(),
+                   'results': results}, f, indent=2)
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.tolerance)
+        for key, metric, old, new in regressions:
+            print("REGRESSION %s %s: %g -> %g" % (key, metric, old, new))
+        if regressions:
+            sys.exit(1)
@@ -0,0 +1,321 @@
+import argparse
+import json
+import logging
+import math
+import numbers
+import os
+import time
+from collections import defaultdict, deque
+from itertools import product
+from multiprocessing import Pool, cpu_count
+
+import numpy as np
+import pandas as pd
+
+from pyrlap.core.instrumentation import Metrics
+
+from . import tfcache
+from .obmdpmodel import OBMDPModel
+from .standardmodel import StandardPlanningModel
+
+logger = logging.getLogger(__name__)
+
+'''
+Grid search over model parameters, scored by the summed log-likelihood of
+each participant's demonstrations. Every parameter combination is scored
+in a worker process and written to a results file (one JSON line per
+combination) as soon as it finishes, so an interrupted search can be
+resumed by running it again with the same results file.
+
+With warm starting, combinations are ordered so that neighbors in
+parameter space are scored one after the other, and each worker starts
+every solve from the value function of the nearest combination it has
+already solved. Warm-started solves only agree with cold ones up to the
+planners' converge_delta, which can noticeably move log-likelihoods at
+low softmax temperatures, so it is off by default.
+'''
+
+MODELS = {
+    'obmdp': OBMDPModel,
+    'standard': StandardPlanningModel
+}
+
+# per-process state set up by _init_worker
+_worker = {}
+
+# number of solved value functions each worker keeps for warm starts
+WARM_START_HISTORY = 8
+
+def expand_grid(param_grid):
+    """
+    Takes a dictionary mapping parameter names to lists of values (or a
+    list of such dictionaries) and returns a list of parameter dictionaries
+    """
+    if isinstance(param_grid, dict):
+        param_grid = [param_grid, ]
+    combinations = []
+    for grid in param_grid:
+        names = sorted(grid.keys())
+        for vals in product(*[grid[n] for n in names]):
+            combinations.append(dict(zip(names, vals)))
+    return combinations
+
+def _combination_key(params):
+    return tuple(sorted(params.items()))
+
+def param_scales(combinations):
+    """
+    Range of each numeric parameter over combinations (1 if it does not
+    vary). Parameters that are missing here are compared as categories.
+    """
+    values = defaultdict(list)
+    for params in combinations:
+        for name, val in params.items():
+            values[name].append(val)
+    scales = {}
+    for name, vals in values.items():
+        if all(isinstance(v, numbers.Real) and not isinstance(v, bool)
+               for v in vals):
+            scales[name] = (max(vals) - min(vals)) or 1.0
+    return scales
+
+def param_distance(a, b, scales):
+    dist = 0.0
+    for name in set(a) | set(b):
+        va, vb = a.get(name), b.get(name)
+        if name in scales and va is not None and vb is not None:
+            dist += ((va - vb)/scales[name])**2
+        else:
+            dist += float(va != vb)
+    return math.sqrt(dist)
+
+def order_by_neighbors(combinations, scales=None):
+    """
+    Orders combinations into a greedy nearest-neighbor chain (starting
+    from the first one), so that consecutive combinations differ as little
+    as possible
+    """
+    if len(combinations) == 0:
+        return []
+    if scales is None:
+        scales = param_scales(combinations)
+    names = sorted(set([n for params in combinations for n in params]))
+    numeric = [n for n in names if n in scales]
+    categorical = [n for n in names if n not in scales]
+    x_num = np.array([[params.get(n, 0)/scales[n] for n in numeric]
+                      for params in combinations], dtype=float)
+    x_num = x_num.reshape((len(combinations), len(numeric)))
+    codes = {}
+    x_cat = np.array([[codes.setdefault((n, repr(params.get(n))), len(codes))
+                       for n in categorical] for params in combinations],
+                     dtype=int)
+    x_cat = x_cat.reshape((len(combinations), len(categorical)))
+
+    remaining = np.ones(len(combinations), dtype=bool)
+    order = [0, ]
+    remaining[0] = False
+    for _ in range(len(combinations) - 1):
+        last = order[-1]
+        dist = ((x_num - x_num[last])**2).sum(axis=1) + \
+            (x_cat != x_cat[last]).sum(axis=1)
+        dist[~remaining] = np.inf
+        nearest = int(np.argmin(dist))
+        order.append(nearest)
+        remaining[nearest] = False
+    return [combinations[i] for i in order]
+
+def _init_worker(model_name, trajs, seed_trajs, tf_cache_dir,
+                 warm_start=False, scales=None, collect_metrics=False):
+    if tf_cache_dir is not None:
+        tfcache.set_default_cache(
+            tfcache.DiscretizedTFCache(cache_dir=tf_cache_dir))
+    _worker['model_class'] = MODELS[model_name]
+    _worker['trajs'] = trajs
+    _worker['seed_trajs'] = seed_trajs
+    _worker['warm_start'] = warm_start
+    _worker['scales'] = scales if scales is not None else {}
+    _worker['solved'] = deque(maxlen=WARM_START_HISTORY)
+    _worker['collect_metrics'] = collect_metrics
+
+def _nearest_solved(params):
+    solved = _worker.get('solved')
+    if not _worker.get('warm_start') or not solved:
+        return None
+    dists = [param_distance(params, p, _worker['scales'])
+             for p, vf in solved]
+    return solved[int(np.argmin(dists))][1]
+
+def _solved_value_function(model):
+    if isinstance(model, OBMDPModel):
+        return model.obmdp_planner.value_function
+    return model.planner.value_function
+
+def score_combination(params):
+    model_class = _worker['model_class']
+    trajs = _worker['trajs']
+    start = time.time()
+    metrics = None
+    if _worker.get('collect_metrics'):
+        metrics = Metrics(keep_iterations=False)
+    loglikes = defaultdict(float)
+    for rf, block in trajs.groupby('rf'):
+        model_params = dict(params, true_mdp_code=rf)
+        init_vf = _nearest_solved(model_params)
+        if model_class is OBMDPModel:
+            # models for different ground rfs share one discretized
+            # transition function through the tf cache
+            model_params['seed_trajs'] = _worker['seed_trajs']
+        model_params['init_value_function'] = init_vf
+        model_params['metrics'] = metrics
+        model = model_class(**model_params)
+        block_loglikes = model.trajectories_loglikelihood(block['traj'])
+        for participant, logl in zip(block['participant'], block_loglikes):
+            loglikes[participant] += float(logl)
+        if _worker.get('warm_start'):
+            _worker['solved'].append((dict(params, true_mdp_code=rf),
+                                      _solved_value_function(model)))
+    record = {
+        'params': params,
+        'loglikelihood': dict(loglikes),
+        'seconds': time.time() - start
+    }
+    if metrics is not None:
+        record['metrics'] = metrics.summary()
+    return record
+
+def read_results(results_file):
+    """
+    Returns the completed records in a results file. A partially written
+    last line (e.g. from a killed run) is ignored.
+    """
+    records = []
+    if not os.path.exists(results_file):
+        return records
+    with open(results_file, 'r') as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                break
+    return records
+
+def results_to_dataframe(records):
+    """
+    One row per (parameter combination, participant), with the same
+    columns as the participant fit tables in gridsearch-results/
+    """
+    rows = []
+    for rec in records:
+        for participant, logl in rec['loglikelihood'].items():
+            row = dict(rec['params'])
+            row['participant'] = participant
+            row['loglikelihood'] = logl
+            rows.append(row)
+    return pd.DataFrame(rows)
+
+def best_fits(results):
+    """
+    The maximum likelihood parameter combination for each participant
+    """
+    best = results.groupby('participant')['loglikelihood'].idxmax()
+    return results.loc[best].reset_index(drop=True)
+
+def _truncate_to_complete_lines(results_file, n_lines):
+    with open(results_file, 'r') as f:
+        lines = f.readlines()
+    if len(lines) == n_lines:
+        return
+    with open(results_file, 'w') as f:
+        f.writelines([l if l.endswith('\n') else l + '\n'
+                      for l in lines[:n_lines]])
+
+def run_gridsearch(param_grid,
+                   trajs : "dataframe with 'participant', 'rf' and 'traj' "
+                           "columns",
+                   results_file,
+                   model='obmdp',
+                   seed_trajs=None,
+                   processes=None,
+                   chunksize : "combinations sent to a worker at a time; "
+                               "by default 1, or enough for each worker "
+                               "to get a few contiguous runs of neighbors "
+                               "when warm starting" = None,
+                   tf_cache_dir : "directory where workers share "
+                                  "discretized transition functions" = None,
+                   warm_start : "order combinations by nearest neighbor "
+                                "and warm start each solve from the "
+                                "nearest one already solved" = False,
+                   collect_metrics : "add phase times, iteration and "
+                                     "backup counts and cache hit rates "
+                                     "(Metrics.summary) to each result"
+                                     = False):
+    """
+    Scores every combination in param_grid on trajs across a process pool
+    and appends each result to results_file as it finishes. Combinations
+    that are already in results_file are skipped.
+
+    :return: dataframe of all results (see results_to_dataframe)
+    """
+    trajs = trajs[['participant', 'rf', 'traj']].copy()
+    trajs['traj'] = [tuple(t) for t in trajs['traj']]
+    if seed_trajs is None and model == 'obmdp':
+        seed_trajs = list(set(trajs['traj']))
+
+    combinations = expand_grid(param_grid)
+    records = read_results(results_file)
+    if len(records) > 0:
+        _truncate_to_complete_lines(results_file, len(records))
+    done = set([_combination_key(r['params']) for r in records])
+    todo = [p for p in combinations if _combination_key(p) not in done]
+    logger.info('%d of %d combinations left to run' %
+                (len(todo), len(combinations)))
+
+    scales = param_scales(combinations)
+    if warm_start:
+        todo = order_by_neighbors(todo, scales)
+    if chunksize is None:
+        chunksize = 1
+        if warm_start:
+            n_workers = processes if processes is not None else cpu_count()
+            chunksize = max(1, len(todo)//(4*n_workers))
+
+    with open(results_file, 'a') as f, \
+            Pool(processes=processes,
+                 initializer=_init_worker,
+                 initargs=(model, trajs, seed_trajs, tf_cache_dir,
+                           warm_start, scales, collect_metrics)) as pool:
+        for i, rec in enumerate(pool.imap_unordered(score_combination, todo,
+                                                    chunksize=chunksize)):
+            f.write(json.dumps(rec) + '\n')
+            f.flush()
+            records.append(rec)
+            logger.info('%d/%d done (%.1fs)' %
+                        (i + 1, len(todo), rec['seconds']))
+    return results_to_dataframe(records)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Run a model grid search over participant trajectories")
+    parser.add_argument('grid', help="json file with a parameter grid")
+    parser.add_argument('trajs', help="pickled trajectory dataframe")
+    parser.add_argument('results', help="results file (json lines)")
+    parser.add_argument('--model', default='obmdp', choices=list(MODELS))
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--chunksize', type=int, default=None)
+    parser.add_argument('--tf-cache-dir', default=None)
+    parser.add_argument('--warm-start', action='store_true')
+    parser.add_argument('--metrics', action='store_true')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    with open(args.grid, 'r') as f:
+        grid = json.load(f)
+    run_gridsearch(param_grid=grid,
+                   trajs=pd.read_pickle(args.trajs),
+                   results_file=args.results,
+                   model=args.model,
+                   processes=args.processes,
+                   chunksize=args.chunksize,
+                   tf_cache_dir=args.tf_cache_dir,
+                   warm_start=args.warm_start,
+                   collect_metrics=args.metrics)
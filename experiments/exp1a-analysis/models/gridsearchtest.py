@@ -0,0 +1,55 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import pandas as pd
+
+from .gridsearch import run_gridsearch, read_results, _combination_key
+
+class GridSearchResumeTestCase(unittest.TestCase):
+    def setUp(self):
+        demon_data = pd.read_pickle('../data/exp1-demon_trajs.pd.pkl')
+        self.trajs = demon_data[demon_data['participant'].isin(['S1', 'S2'])]
+        self.grid = {
+            'do_discount': [.9, .99],
+            'do_temp': [.5],
+            'do_randchoose': [.05]
+        }
+        self.tmpdir = tempfile.mkdtemp()
+        self.results_file = os.path.join(self.tmpdir, 'results.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def run_grid(self, grid):
+        return run_gridsearch(grid, self.trajs, self.results_file,
+                              model='standard', processes=1)
+
+    def test_resume(self):
+        self.run_grid(self.grid)
+        records = read_results(self.results_file)
+        self.assertEqual(len(records), 2)
+
+        # mark a finished combination and leave a partially written line,
+        # as if the run was killed while writing the next result
+        records[0]['loglikelihood'] = {'S1': 1.0, 'S2': 2.0}
+        with open(self.results_file, 'w') as f:
+            for rec in records:
+                f.write(json.dumps(rec) + '\n')
+            f.write('{"params": {"do_disc')
+
+        grid = dict(self.grid, do_discount=[.9, .95, .99])
+        results = self.run_grid(grid)
+        resumed = read_results(self.results_file)
+        self.assertEqual(len(resumed), 3)
+        self.assertEqual(resumed[:2], records)
+        self.assertEqual(
+            set([_combination_key(r['params']) for r in resumed]),
+            set([_combination_key({'do_discount': d, 'do_temp': .5,
+                                   'do_randchoose': .05})
+                 for d in [.9, .95, .99]]))
+        self.assertEqual(len(results), 3*2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+
+'''
+Dense log-policy tables for scoring many trajectories at once. States and
+actions are encoded as integers once, the log-policy for each
+(softmax_temp, randchoose) is computed once for all states, and the
+log-likelihood of a batch of trajectories is then a gather and a sum.
+'''
+
+class LogPolicyTable(object):
+    def __init__(self, policy_table):
+        """
+        :param policy_table: a pyrlap PolicyTable (e.g. from a solved
+        planner's get_policy_table())
+        """
+        self.policy_table = policy_table
+        self.state_index = policy_table.state_index
+        self.action_index = policy_table.action_index
+        self._log_policies = {}
+
+    def log_policy(self, softmax_temp=0.0, randchoose=0.0):
+        """
+        |S| x |A| array of log action probabilities
+        """
+        key = (softmax_temp, randchoose)
+        if key not in self._log_policies:
+            pi = self.policy_table.policy_matrix(softmax_temp, randchoose)
+            with np.errstate(divide='ignore'):
+                self._log_policies[key] = np.log(pi)
+        return self._log_policies[key]
+
+    def encode(self, traj):
+        """
+        :param traj: sequence of (s, a) pairs
+        :return: arrays of state and action indices
+        """
+        s_ind = [self.state_index[s] for s, a in traj]
+        a_ind = [self.action_index[a] for s, a in traj]
+        return np.array(s_ind, dtype=int), np.array(a_ind, dtype=int)
+
+    def loglikelihoods(self, trajs, softmax_temp=0.0, randchoose=0.0):
+        """
+        :param trajs: sequence of trajectories of (s, a) pairs
+        :return: array with the log-likelihood of each trajectory
+        """
+        log_pi = self.log_policy(softmax_temp, randchoose)
+        encoded = [self.encode(traj) for traj in trajs]
+        if len(encoded) == 0:
+            return np.zeros(0)
+        s_ind = np.concatenate([s for s, a in encoded])
+        a_ind = np.concatenate([a for s, a in encoded])
+        traj_ind = np.repeat(np.arange(len(encoded)),
+                             [len(s) for s, a in encoded])
+        return np.bincount(traj_ind, weights=log_pi[s_ind, a_ind],
+                           minlength=len(encoded))
+
+def as_trajectories(trajs):
+    """
+    Trajectories from a dataframe with a 'traj' column, or any other
+    sequence of trajectories
+    """
+    if isinstance(trajs, pd.DataFrame):
+        trajs = trajs['traj']
+    return list(trajs)
@@ -1,10 +1,16 @@
 import math
 from itertools import product
 
+from pyrlap.core.instrumentation import phase
+
 from pyrlap.domains.gridworld import GridWorld
+from pyrlap.algorithms.batch_vi import BatchValueIteration
 from demoteaching.mdps.discretizedobmdp import \
     DiscretizedObserverBeliefMDPApproximation
 
+from . import tfcache
+from .loglikelihood import LogPolicyTable, as_trajectories
+
 class OBMDPModel(object):
     def __init__(self,
                  true_mdp_code,
@@ -18,10 +24,21 @@ class OBMDPModel(object):
                  n_bins=8,
                  seed_trajs=None,
                  disc_tf=None, 
-                 solved_planner=None):
+                 solved_planner=None,
+                 init_value_function : "value function of a previously "
+                                       "solved, similar OBMDP to warm start "
+                                       "the solve from" = None,
+                 tf_cache : "a tfcache.DiscretizedTFCache, 'default' for "
+                            "the module-wide cache or None to always "
+                            "rebuild" = 'default',
+                 metrics : "a pyrlap.core.instrumentation.Metrics; the "
+                           "ground planners record under 'ground/' and the "
+                           "OBMDP under 'obmdp/'" = None):
         self.show_discount = show_discount
         self.show_randchoose = show_randchoose
         self.show_temp = show_temp
+        self.init_value_function = init_value_function
+        self.metrics = metrics
         
         #=============================#
 
@@ -30,6 +47,7 @@ class OBMDPModel(object):
         if solved_planner is not None:
             self.obmdp_planner = solved_planner
             self.obmdp = solved_planner.mdp
+            self.log_policy_table = None
             return
         
                 
@@ -54,8 +72,10 @@ class OBMDPModel(object):
             fr['y'] = goal_reward
             fr['.'] = 0
         
-        planners = {}
-        for mdpc, frewards in zip(mdp_codes, feature_rewards):
+        # the ground MDPs only differ in their rewards, so they are
+        # solved together in one batched value iteration
+        mdps = []
+        for frewards in feature_rewards:
             params = {
                 'gridworld_array': ['.oooo.',
                                     '.oppp.',
@@ -70,16 +90,32 @@ class OBMDPModel(object):
                 'wait_action': False,
                 'include_intermediate_terminal': True
             }
-            mdp = GridWorld(**params)
-            planner = mdp.solve(
-                softmax_temp=do_temp, 
-                randchoose=do_randchoose, 
-                discount_rate=do_discount)
-            planners[mdpc] = planner
+            mdps.append(GridWorld(**params))
+        batch_planner = BatchValueIteration(
+            mdps,
+            discount_rates=do_discount,
+            softmax_temp=do_temp,
+            randchoose=do_randchoose,
+            policy_tables=True,
+            metrics=self._scoped_metrics('ground'))
+        planners = dict(zip(mdp_codes, batch_planner.solve()))
             
         #===========================================#
         #   Build Observer Belief MDP and support   #
         #===========================================#
+        if tf_cache == 'default':
+            tf_cache = tfcache.get_default_cache()
+        tf_key = None
+        if disc_tf is None and tf_cache is not None and seed_trajs is not None:
+            tf_key = tf_cache.key(do_discount=do_discount,
+                                  do_temp=do_temp,
+                                  do_randchoose=do_randchoose,
+                                  seed_trajs=seed_trajs,
+                                  n_bins=n_bins)
+            disc_tf = tf_cache.get(tf_key)
+            if metrics is not None:
+                metrics.cache_access('tf cache', hit=disc_tf is not None)
+
         obmdp = DiscretizedObserverBeliefMDPApproximation(
             n_probability_bins=n_bins,
             seed_trajs=seed_trajs,
@@ -90,10 +126,19 @@ class OBMDPModel(object):
             belief_reward_type='true_gain',
             only_belief_reward=False,
             belief_reward=show_reward,
-            update_includes_intention=True)
+            update_includes_intention=True,
+            metrics=self._scoped_metrics('obmdp'))
+        if tf_key is not None and disc_tf is None:
+            tf_cache.put(tf_key, obmdp.get_discretized_tf())
         self.obmdp = obmdp
         self.obmdp_planner = None
+        self.log_policy_table = None
 
+
+    def _scoped_metrics(self, prefix):
+        if self.metrics is None:
+            return None
+        return self.metrics.scoped(prefix)
     
     def get_disc_tf(self):
         return self.obmdp.get_discretized_tf()
@@ -101,7 +146,10 @@ class OBMDPModel(object):
     def get_planner(self):
         self.obmdp_planner = self.obmdp.solve(
             discount_rate=self.show_discount,
-            max_iterations=1000)
+            max_iterations=1000,
+            init_value_function=self.init_value_function,
+            policy_tables=True)
+        self.log_policy_table = None
         return self.obmdp_planner
     
     def trajectory_loglikelihood(self, wtraj):
@@ -117,3 +165,27 @@ class OBMDPModel(object):
                 randchoose=self.show_randchoose)
             logl += math.log(adist[a])
         return logl
+
+    def trajectories_loglikelihood(self, wtrajs):
+        """
+        Log-likelihoods of a batch of ground trajectories, scored against
+        one precomputed log-policy table.
+
+        :param wtrajs: dataframe with a 'traj' column or a sequence of
+        trajectories
+        :return: array with the log-likelihood of each trajectory
+        """
+        if self.obmdp_planner is None:
+            self.get_planner()
+        if self.log_policy_table is None:
+            self.log_policy_table = LogPolicyTable(
+                self.obmdp_planner.get_policy_table())
+
+        with phase(self.metrics, 'loglikelihood'):
+            init_state = self.obmdp.get_init_state()
+            btrajs = [self.obmdp._wtraj_to_btraj(wtraj, init_state)
+                      for wtraj in as_trajectories(wtrajs)]
+            return self.log_policy_table.loglikelihoods(
+                btrajs,
+                softmax_temp=self.show_temp,
+                randchoose=self.show_randchoose)
@@ -68,5 +68,23 @@ class MyTestCase(unittest.TestCase):
         self.assertTrue(sum(max_show_fits) > sum(med_show_fits))
         self.assertTrue(sum(med_show_fits) > sum(min_show_fits))
 
+    def test_batch_loglikelihood(self):
+        model = OBMDPModel(
+            true_mdp_code='xoo',
+            do_discount=.99,
+            do_randchoose=.05,
+            do_temp=.5,
+            show_discount=.9,
+            show_reward=5,
+            show_randchoose=.05,
+            show_temp=.1,
+            n_bins=5,
+            seed_trajs=self.seed_trajs
+        )
+        trajs = self.trajs_by_condrf['show']['xoo']
+        loglikes = [model.trajectory_loglikelihood(t) for t in trajs]
+        batch_loglikes = model.trajectories_loglikelihood(trajs)
+        self.assertTrue(np.allclose(loglikes, batch_loglikes))
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,10 +1,15 @@
 import math, time
 import numpy as np
 from pyrlap.domains.gridworld import GridWorld
+from pyrlap.core.instrumentation import phase
+
+from .loglikelihood import LogPolicyTable, as_trajectories
 
 
 class StandardPlanningModel(object):
-    def __init__(self, true_mdp_code, do_discount, do_randchoose, do_temp):
+    def __init__(self, true_mdp_code, do_discount, do_randchoose, do_temp,
+                 init_value_function=None,
+                 metrics=None):
         danger_r = -2
         goal_reward = 10
         init_ground = (0, 2)
@@ -30,11 +35,30 @@ class StandardPlanningModel(object):
         self.planner = self.gw.solve(
             discount_rate=do_discount,
             softmax_temp=do_temp,
-            randchoose=do_randchoose)
+            randchoose=do_randchoose,
+            init_value_function=init_value_function,
+            policy_tables=True,
+            metrics=metrics)
+        self.log_policy_table = None
+        self.metrics = metrics
 
     def trajectory_loglikelihood(self, wtraj):
         logl = 0
         for s, a in wtraj:
             adist = self.planner.act_dist(s)
             logl += math.log(adist[a])
-        return logl
\ No newline at end of file
+        return logl
+
+    def trajectories_loglikelihood(self, wtrajs):
+        """
+        Log-likelihoods of a batch of trajectories (a dataframe with a 'traj'
+        column or a sequence of trajectories) as an array
+        """
+        if self.log_policy_table is None:
+            self.log_policy_table = LogPolicyTable(
+                self.planner.get_policy_table())
+        with phase(self.metrics, 'loglikelihood'):
+            return self.log_policy_table.loglikelihoods(
+                as_trajectories(wtrajs),
+                softmax_temp=self.planner.softmax_temp,
+                randchoose=self.planner.randchoose)
@@ -0,0 +1,90 @@
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+'''
+Content-addressed cache of discretized observer-belief transition
+functions. The discretized transition function only depends on the
+ground planners (do_discount, do_temp, do_randchoose), the seed
+trajectories and the number of probability bins, so models that differ
+only in their show_* parameters can share one build.
+'''
+
+class DiscretizedTFCache(object):
+    def __init__(self, maxsize=8, cache_dir=None):
+        """
+        :param maxsize: number of transition functions kept in memory
+        (least recently used ones are evicted first)
+        :param cache_dir: if given, transition functions are also pickled
+        to this directory and loaded from it on a memory miss
+        """
+        self.maxsize = maxsize
+        self.cache_dir = cache_dir
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+        self._cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(do_discount, do_temp, do_randchoose, seed_trajs, n_bins):
+        seed_trajs = sorted(set([repr(tuple(t)) for t in seed_trajs]))
+        content = repr((
+            float(do_discount),
+            float(do_temp),
+            float(do_randchoose),
+            int(n_bins),
+            tuple(seed_trajs)
+        ))
+        return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, 'disc_tf-%s.pkl' % key)
+
+    def get(self, key):
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return self._cache[key]
+        if self.cache_dir is not None and os.path.exists(self._path(key)):
+            logger.debug("Loading discretized tf %s from disk" % key)
+            with open(self._path(key), 'rb') as f:
+                disc_tf = pickle.load(f)
+            self._remember(key, disc_tf)
+            self.hits += 1
+            return disc_tf
+        self.misses += 1
+        return None
+
+    def put(self, key, disc_tf):
+        self._remember(key, disc_tf)
+        if self.cache_dir is not None and not os.path.exists(self._path(key)):
+            # write then rename so concurrent readers never see a
+            # partially written file
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir)
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(disc_tf, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self._path(key))
+
+    def _remember(self, key, disc_tf):
+        self._cache[key] = disc_tf
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.maxsize:
+            self._cache.popitem(last=False)
+
+    def clear(self):
+        self._cache.clear()
+
+default_cache = DiscretizedTFCache()
+
+def set_default_cache(cache):
+    global default_cache
+    default_cache = cache
+
+def get_default_cache():
+    return default_cache
@@ -0,0 +1,78 @@
+import os
+import shutil
+import tempfile
+import unittest
+import pandas as pd
+
+from .obmdpmodel import OBMDPModel
+from .tfcache import DiscretizedTFCache
+
+class DiscretizedTFCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        demon_data = pd.read_pickle('../data/exp1-demon_trajs.pd.pkl')
+        self.seed_trajs = list(set([tuple(t) for t in demon_data['traj']]))
+        self.params = {
+            'true_mdp_code': 'xoo',
+            'do_discount': .99,
+            'do_randchoose': .05,
+            'do_temp': .5,
+            'show_discount': .9,
+            'show_reward': 5,
+            'show_randchoose': .05,
+            'show_temp': .1,
+            'n_bins': 5,
+            'seed_trajs': self.seed_trajs
+        }
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_key(self):
+        key = DiscretizedTFCache.key(.99, .5, .05, self.seed_trajs, 5)
+        self.assertEqual(
+            key,
+            DiscretizedTFCache.key(.99, .5, .05,
+                                   self.seed_trajs[::-1]*2, 5))
+        self.assertNotEqual(
+            key, DiscretizedTFCache.key(.99, .5, .05, self.seed_trajs, 6))
+        self.assertNotEqual(
+            key, DiscretizedTFCache.key(.99, .5, .05, self.seed_trajs[1:], 5))
+
+    def test_reuse_and_rebuild(self):
+        cache = DiscretizedTFCache(cache_dir=self.tmpdir)
+        model = OBMDPModel(tf_cache=cache, **self.params)
+        self.assertEqual((cache.hits, cache.misses), (0, 1))
+
+        # only the show_* parameters and the true rf differ
+        shown = OBMDPModel(tf_cache=cache,
+                           **dict(self.params, show_reward=4,
+                                  show_discount=.95, true_mdp_code='oxx'))
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        self.assertIs(shown.get_disc_tf(), model.get_disc_tf())
+
+        rebuilt = OBMDPModel(tf_cache=cache,
+                             **dict(self.params, do_temp=.3))
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+        self.assertIsNot(rebuilt.get_disc_tf(), model.get_disc_tf())
+        self.assertNotEqual(rebuilt.get_disc_tf(), model.get_disc_tf())
+
+        # a new process sharing the directory loads builds from disk
+        self.assertEqual(len(os.listdir(self.tmpdir)), 2)
+        disk_cache = DiscretizedTFCache(cache_dir=self.tmpdir)
+        OBMDPModel(tf_cache=disk_cache, **self.params)
+        self.assertEqual((disk_cache.hits, disk_cache.misses), (1, 0))
+
+    def test_lru_eviction(self):
+        cache = DiscretizedTFCache(maxsize=2)
+        for key in 'abc':
+            cache.put(key, {key: 1})
+        cache.get('b')
+        cache.put('d', {'d': 1})
+        self.assertIsNone(cache.get('a'))
+        self.assertIsNone(cache.get('c'))
+        self.assertEqual(cache.get('b'), {'b': 1})
+        self.assertEqual(cache.get('d'), {'d': 1})
+
+if __name__ == '__main__':
+    unittest.main()
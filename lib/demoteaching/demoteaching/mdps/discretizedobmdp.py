@@ -3,10 +3,10 @@ from itertools import combinations_with_replacement
 import logging
 
 import numpy as np
-from sklearn.neighbors import BallTree
 
 from .obs_belief_mdp import ObserverBeliefMDP
 from pyrlap.algorithms.valueiteration import ValueIteration
+from pyrlap.core.instrumentation import phase
 
 logger = logging.getLogger(__name__)
 
@@ -16,9 +16,16 @@ class DiscretizedObserverBeliefMDPApproximation(ObserverBeliefMDP):
                  seed_trajs=None,
                  branch_steps=0,
                  discretized_tf=None,
+                 discretizer : "'balltree' searches all belief points, "
+                               "'lattice' rounds to the probability grid "
+                               "and only searches the seed beliefs"
+                               = 'balltree',
                  **kwargs):
         ObserverBeliefMDP.__init__(self, **kwargs)
         self.n_pbins = n_probability_bins
+        if discretizer not in ('balltree', 'lattice'):
+            raise ValueError("Unknown discretizer: %s" % discretizer)
+        self.discretizer = discretizer
 
         self.seed_trajs = seed_trajs
         self.branch_steps = branch_steps
@@ -26,9 +33,12 @@ class DiscretizedObserverBeliefMDPApproximation(ObserverBeliefMDP):
         if discretized_tf is not None:
             logger.debug("Discretized Transition Function Provided")
             self.disc_tf = discretized_tf
-            self.belief_points = np.array(list(set([b for b, _ in self.disc_tf.keys()])))
-            bp_nbrs = BallTree(self.belief_points, leaf_size=40)
-            self.bp_nbrs = bp_nbrs
+            # first-seen order, so that belief point indices do not depend
+            # on hashing
+            self.belief_points = np.array(list(dict.fromkeys(
+                [b for b, _ in self.disc_tf.keys()])))
+            with phase(self.metrics, 'belief indexing'):
+                self._index_belief_points()
         else:
             self.build()
         self._create_start_state()
@@ -39,32 +49,71 @@ class DiscretizedObserverBeliefMDPApproximation(ObserverBeliefMDP):
 
     def build(self):
         #create belief points and build transition function
-        self.belief_points = []
-        self._add_grid_beliefs()
-        self._add_seedtraj_beliefs()
-        self.belief_points = np.array(self.belief_points)
-        bp_nbrs = BallTree(self.belief_points, leaf_size=40)
-        self.bp_nbrs = bp_nbrs
+        with phase(self.metrics, 'belief points'):
+            self.belief_points = []
+            self._add_grid_beliefs()
+            self._add_seedtraj_beliefs()
+            self.belief_points = np.array(self.belief_points)
+        with phase(self.metrics, 'belief indexing'):
+            self._index_belief_points()
 
-        self._build_transition_function()
+        with phase(self.metrics, 'tf discretization'):
+            self._build_transition_function()
 
         # create start state
         self._create_start_state()
 
+    def _index_belief_points(self):
+        if self.discretizer == 'balltree':
+            from sklearn.neighbors import BallTree
+            self.bp_nbrs = BallTree(self.belief_points, leaf_size=40)
+        else:
+            self._index_lattice_points()
+
+        # memo of beliefs that have already been snapped to a belief point;
+        # belief points are their own nearest neighbors
+        self._disc_memo = {tuple(b): tuple(b) for b in self.belief_points}
+
     def _create_start_state(self):
         init_state = ObserverBeliefMDP.get_init_state(self)
         init_state = self.discretize_bstate(s=init_state)
         self.init_state = init_state
 
-    def _add_grid_beliefs(self):
-        belief_grid_points = []
+    def _index_lattice_points(self):
+        # grid beliefs are looked up by their bin counts; every other belief
+        # point (i.e. from the seed trajectories) goes in a fallback tree
+        bp_i = {tuple(b): i for i, b in enumerate(self.belief_points)}
+        self._lattice_index = {}
+        for counts, b in self._grid_beliefs():
+            if b in bp_i:
+                self._lattice_index[counts] = bp_i.pop(b)
+        self._offgrid_bp_ind = np.array(sorted(bp_i.values()), dtype=int)
+        self._offgrid_nbrs = None
+        self._offgrid_bound = np.inf
+        if len(self._offgrid_bp_ind) > 0:
+            from sklearn.neighbors import BallTree
+            offgrid = self.belief_points[self._offgrid_bp_ind]
+            self._offgrid_nbrs = BallTree(offgrid, leaf_size=40)
+
+            # every off-grid point is at least m from the lattice, so a
+            # belief within m/2 of a lattice point is at least m/2 from every
+            # off-grid point and the tree does not need to be searched
+            counts = simplex_lattice_round(offgrid, self.n_pbins)
+            m = np.linalg.norm(offgrid - counts/self.n_pbins, axis=1).min()
+            self._offgrid_bound = m/2
+
+    def _grid_beliefs(self):
         for divs in combinations_with_replacement(
                 range(self.n_pbins + 1),
                 r=len(self.planner_order) - 1):
             b = [0, ] + list(divs) + [self.n_pbins, ]
             b = np.ediff1d(b)
+            counts = tuple(int(c) for c in b)
             b = b / np.sum(b)
-            belief_grid_points.append(tuple(b))
+            yield counts, tuple(b)
+
+    def _add_grid_beliefs(self):
+        belief_grid_points = [b for _, b in self._grid_beliefs()]
         self.belief_points.extend(belief_grid_points)
 
     def _add_seedtraj_beliefs(self):
@@ -108,17 +157,20 @@ class DiscretizedObserverBeliefMDPApproximation(ObserverBeliefMDP):
 
         logger.debug("Building Discrete TF "+
                      "(S = %d belief points)" % len(self.belief_points))
+
+        # belief updates for every belief point at once, for each (w, a)
+        updates = {}
         next_beliefs = []
-        for b in self.belief_points:
-            b = tuple(b)
-            for w in true_mdp.get_states():
-                s = (b, w)
-                for a in self.available_actions(s):
-                    for ns in self.transition_dist(s, a).keys():
-                        nb, nw = ns
-                        next_beliefs.append(nb)
+        n_next = 0
+        for w in true_mdp.get_states():
+            for a in true_mdp.available_actions(w):
+                nw_p, nbs = self.update_beliefs(self.belief_points, w, a)
+                updates[(w, a)] = (nw_p, n_next)
+                n_next += nbs.shape[0]*nbs.shape[1]
+                next_beliefs.append(nbs.reshape((-1, nbs.shape[-1])))
+        next_beliefs = np.concatenate(next_beliefs)
 
-        disc_b_ind = self.bp_nbrs.query(next_beliefs, return_distance=False)
+        disc_b_ind = self._nearest_belief_points(next_beliefs)
 
         # make it so the next belief is a mixture of closest beliefs?
         # disc_b_dist, disc_b_ind = self.bp_nbrs.query(next_beliefs, k=1)
@@ -128,35 +180,90 @@ class DiscretizedObserverBeliefMDPApproximation(ObserverBeliefMDP):
         #     neighbor = belief_points[nearest_idx]
         #     dists = disc_b_dist[nb_i]
 
-        nb_to_disc_nb = dict(zip(next_beliefs,
-                                 self.belief_points[disc_b_ind].squeeze()))
+        disc_beliefs = [tuple(b) for b in self.belief_points]
         disc_tf = {}
-        for b in self.belief_points:
-            b = tuple(b)
+        for bi, b in enumerate(disc_beliefs):
             for w in true_mdp.get_states():
                 s = (b, w)
                 disc_tf[s] = {}
-                for a in self.available_actions(s):
-                    disc_tf[s][a] = {}
+                for a in true_mdp.available_actions(w):
+                    nw_p, start = updates[(w, a)]
+                    start += bi*len(nw_p)
+                    tdist = {}
                     p_norm = 0
-                    for ns, p in self.transition_dist(s, a).items():
-                        nb, nw = ns
-                        ns = (tuple(nb_to_disc_nb[nb]), nw)
-                        disc_tf[s][a][ns] = disc_tf[s][a].get(ns, 0.0) + p
+                    for nwi, (nw, p) in enumerate(nw_p):
+                        disc_nb = disc_beliefs[disc_b_ind[start + nwi]]
+                        ns = (disc_nb, nw)
+                        tdist[ns] = tdist.get(ns, 0.0) + p
                         p_norm += p
-                    tdist = {ns: p / p_norm for ns, p in disc_tf[s][a].items()}
+                    tdist = {ns: p / p_norm for ns, p in tdist.items()}
                     disc_tf[s][a] = tdist
         self.disc_tf = disc_tf
 
     def discretize_bstate(self, s=None, b=None):
         if b is not None:
-            dist, ind = self.bp_nbrs.query([b])
-            return tuple(self.belief_points[ind[0][0]])
+            return self.discretize_beliefs([b, ])[0]
         elif s is not None:
             b, w = s
             b = self.discretize_bstate(b=b)
             return (b, w)
 
+    def discretize_beliefs(self, beliefs):
+        """
+        Snaps a sequence of beliefs to their nearest belief points, querying
+        the tree once for all beliefs that have not been snapped before.
+
+        :return: list of belief point tuples
+        """
+        keys = [tuple(b) for b in beliefs]
+        misses = list(set([b for b in keys if b not in self._disc_memo]))
+        if self.metrics is not None:
+            self.metrics.cache_access('belief discretization', hit=True,
+                                      n=len(keys) - len(misses))
+            self.metrics.cache_access('belief discretization', hit=False,
+                                      n=len(misses))
+        if len(misses) > 0:
+            ind = self._nearest_belief_points(np.array(misses))
+            for b, bi in zip(misses, ind):
+                self._disc_memo[b] = tuple(self.belief_points[bi])
+        return [self._disc_memo[b] for b in keys]
+
+    def _nearest_belief_points(self, beliefs):
+        """
+        Indices of the belief points nearest to each row of beliefs
+        """
+        if self.discretizer == 'balltree':
+            ind = self.bp_nbrs.query(beliefs, return_distance=False)
+            return ind[:, 0]
+
+        counts = simplex_lattice_round(beliefs, self.n_pbins)
+        lattice_dist = np.linalg.norm(beliefs - counts/self.n_pbins, axis=1)
+        ind = np.zeros(len(beliefs), dtype=int)
+        for i, c in enumerate(map(tuple, counts.tolist())):
+            if c in self._lattice_index:
+                ind[i] = self._lattice_index[c]
+            else:
+                lattice_dist[i] = np.inf
+        if self._offgrid_nbrs is not None:
+            query = np.flatnonzero(lattice_dist >= self._offgrid_bound)
+            if len(query) > 0:
+                offgrid_dist, offgrid_ind = \
+                    self._offgrid_nbrs.query(beliefs[query])
+                use_offgrid = offgrid_dist[:, 0] < lattice_dist[query]
+                ind[query[use_offgrid]] = \
+                    self._offgrid_bp_ind[offgrid_ind[use_offgrid, 0]]
+        elif np.isinf(lattice_dist).any():
+            raise ValueError("Belief is not near any belief point")
+        return ind
+
+    def discretize_bstates(self, states):
+        """
+        Batched version of discretize_bstate for a sequence of (b, w) states
+        """
+        states = list(states)
+        disc_bs = self.discretize_beliefs([b for b, w in states])
+        return [(b, w) for b, (_, w) in zip(disc_bs, states)]
+
     # =====================================#
     #                                     #
     #   MDP Interface Methods             #
@@ -189,6 +296,7 @@ class DiscretizedObserverBeliefMDPApproximation(ObserverBeliefMDP):
               softmax_temp=0.0,
               randchoose=0.0,
               **kwargs):
+        kwargs.setdefault('metrics', self.metrics)
         planner = ValueIteration(mdp=self,
                                  transition_function=self.disc_tf,
                                  softmax_temp=softmax_temp,
@@ -196,4 +304,23 @@ class DiscretizedObserverBeliefMDPApproximation(ObserverBeliefMDP):
                                  discount_rate=discount_rate,
                                  **kwargs)
         planner.solve()
-        return planner
\ No newline at end of file
+        return planner
+
+def simplex_lattice_round(beliefs, n_bins):
+    """
+    Nearest points (in euclidean distance) on the simplex lattice with
+    n_bins divisions, returned as integer bin counts that sum to n_bins.
+
+    Each belief is scaled by n_bins and rounded; if the rounded counts do
+    not sum to n_bins, the coordinates that were rounded furthest in the
+    wrong direction are moved back by one.
+    """
+    x = np.asarray(beliefs, dtype=np.float64)*n_bins
+    counts = np.rint(x)
+    resid = x - counts
+    delta = (counts.sum(axis=-1) - n_bins).astype(int)[..., None]
+    rank = np.argsort(np.argsort(resid, axis=-1), axis=-1)
+    n_dims = x.shape[-1]
+    counts -= (delta > 0) & (rank < delta)
+    counts += (delta < 0) & (rank >= n_dims + delta)
+    return counts.astype(int)
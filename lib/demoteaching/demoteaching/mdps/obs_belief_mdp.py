@@ -1,7 +1,6 @@
 #!/usr/bin/env python
 
 import numpy as np
-from scipy.special import softmax
 
 from pyrlap.core.mdp import MDP as MDPClass
 from pyrlap.core.agent import Agent
@@ -26,7 +25,10 @@ class ObserverBeliefMDP(MDPClass):
                                       "the task.'" = 'true_gain',
                  only_belief_reward=False,
                  belief_reward=None,
-                 update_includes_intention=True):
+                 update_includes_intention=True,
+                 metrics : "a pyrlap.core.instrumentation.Metrics that "
+                           "records build phase times and cache hits"
+                           = None):
         '''
         Handles observer belief-MDP
         '''
@@ -44,6 +46,8 @@ class ObserverBeliefMDP(MDPClass):
         self.update_includes_intention = update_includes_intention
 
         self.init_ground_state = self.true_planner.mdp.get_init_state()
+        self._lhood_tables = {}
+        self.metrics = metrics
 
     def get_init_state(self):
         b = tuple(np.ones(len(self.planners))/len(self.planners))
@@ -85,36 +89,74 @@ class ObserverBeliefMDP(MDPClass):
     def reward(self, s, a, ns):
         return self._calc_reward(s, a, ns)
 
-    def transition_reward_dist(self, s, a):
-        b, w = s
+    def likelihood_table(self, w, a):
+        """
+        Per-(w, a) quantities needed to update beliefs, stacked across the
+        K planners (in planner_order) and computed once:
+
+        nw_p : list of (nw, p), the true mdp's next world state distribution
+        a_lhood : (K, ) probability of each planner taking action a in w
+        nw_lhood : (len(nw_p), K) probability of each next world state
+        under each planner
+        """
+        table = self._lhood_tables.get((w, a))
+        if self.metrics is not None:
+            self.metrics.cache_access('likelihood table',
+                                      hit=table is not None)
+        if table is not None:
+            return table
 
         # what is the probability of each planner taking action a?
         # i.e. the action likelihood
         a_lhood = np.array([pol.act_dist(w)[a] for pol in self.planners])
-        nsr_dist = {} #next belief-world state, reward distribution
 
-        # iterate over all possible next world and reward states in the
-        # true planner's mdp
+        # what is the probability of transitioning to nw under each possible
+        # planner? i.e. the transition likelihood term
         nwr_p = self.true_planner.mdp.transition_reward_dist(w, a)
-        for (nw, wr), p in nwr_p.items():
-
-            # calculate the belief transition
-            if p == 0:
-                continue
-            # what is the probability of transitioning to nw under each possible
-            # planner? i.e. the transition likelihood term
-            nw_lhood = []
-            for pl in self.planners:
-                tprob = pl.mdp.transition_dist(w, a).get(nw, 0)
-                nw_lhood.append(tprob)
-            nw_lhood = np.array(nw_lhood)
-
+        nw_p = [(nw, p) for (nw, wr), p in nwr_p.items() if p != 0]
+        pl_tdists = [pl.mdp.transition_dist(w, a) for pl in self.planners]
+        nw_lhood = np.array([[tdist.get(nw, 0) for tdist in pl_tdists]
+                             for nw, _ in nw_p], dtype=np.float64)
+        nw_lhood = nw_lhood.reshape((len(nw_p), len(self.planners)))
+
+        table = (nw_p, a_lhood, nw_lhood)
+        self._lhood_tables[(w, a)] = table
+        return table
+
+    def update_beliefs(self, beliefs, w, a):
+        """
+        Batched belief update for observing a in w.
+
+        :param beliefs: (N, K) array of beliefs over planners
+        :return: (nw_p, next_beliefs) where next_beliefs is an
+        (N, len(nw_p), K) array of posterior beliefs for each next world
+        state in nw_p
+        """
+        nw_p, a_lhood, nw_lhood = self.likelihood_table(w, a)
+        beliefs = np.asarray(beliefs, dtype=np.float64)
+
+        # zero likelihoods/beliefs become -inf log probabilities
+        with np.errstate(divide='ignore', invalid='ignore'):
             if self.update_includes_intention:
-                nb = np.log(a_lhood)+ np.log(nw_lhood) + np.log(b)
+                lhood = np.log(a_lhood) + np.log(nw_lhood)
             else:
-                nb = np.log(nw_lhood) + np.log(b)
-            nb = tuple(softmax(nb))
-            # nb = tuple(nb / np.sum(nb))
+                lhood = np.log(nw_lhood)
+            nb = lhood[None, :, :] + np.log(beliefs)[:, None, :]
+
+            # softmax over planners
+            nb = np.exp(nb - np.max(nb, axis=-1, keepdims=True))
+            nb = nb / np.sum(nb, axis=-1, keepdims=True)
+        return nw_p, nb
+
+    def transition_reward_dist(self, s, a):
+        b, w = s
+        nsr_dist = {} #next belief-world state, reward distribution
+
+        # iterate over all possible next world and reward states in the
+        # true planner's mdp and calculate the belief transitions
+        nw_p, nbs = self.update_beliefs([b, ], w, a)
+        for (nw, p), nb in zip(nw_p, nbs[0]):
+            nb = tuple(nb)
 
             # calculate belief reward
             r = self._calc_reward(s, a, (nb, nw))
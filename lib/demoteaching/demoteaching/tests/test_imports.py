@@ -0,0 +1,20 @@
+import unittest
+import subprocess
+import sys
+
+class LazyImportTestCase(unittest.TestCase):
+    def test_heavy_dependencies_not_loaded(self):
+        # importing the mdps should not pull in the dependencies that are
+        # only needed for discretizing, sparse solves or plotting
+        heavy = ('scipy', 'sklearn', 'matplotlib', 'torch')
+        probe = (
+            "import sys\n"
+            "import pyrlap.domains.gridworld\n"
+            "import demoteaching.mdps.discretizedobmdp\n"
+            "print(' '.join(m for m in %r if m in sys.modules))" % (heavy, )
+        )
+        loaded = subprocess.check_output([sys.executable, '-c', probe])
+        self.assertEqual(loaded.decode().strip(), '')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -9,6 +9,9 @@ from demoteaching.mdps.discretizedobmdp import \
 # from ped_irl.goalobmdp_heuristic import TerminalGoalObserverBeliefHeuristic
 from itertools import product
 
+import numpy as np
+from scipy.special import softmax
+
 class ObservationBeliefSmallMDPTestCase(unittest.TestCase):
     def setUp(self):
         det_planners = {}
@@ -74,6 +77,41 @@ class ObservationBeliefSmallMDPTestCase(unittest.TestCase):
         total_r = sum([r for s, a, ns, r in traj])
         self.assertTrue(total_r > 5)
 
+    def _reference_beliefs(self, obmdp, b, w, a, nw):
+        # per-planner belief update of the original transition_reward_dist
+        a_lhood = np.array([pol.act_dist(w)[a] for pol in obmdp.planners])
+        nw_lhood = np.array([pl.mdp.transition_dist(w, a).get(nw, 0)
+                             for pl in obmdp.planners])
+        with np.errstate(divide='ignore'):
+            if obmdp.update_includes_intention:
+                nb = np.log(a_lhood) + np.log(nw_lhood) + np.log(b)
+            else:
+                nb = np.log(nw_lhood) + np.log(b)
+        return softmax(nb)
+
+    def test_batched_belief_update(self):
+        beliefs = [(.5, .5), (.9, .1), (0, 1)]
+        w, a = (0, 1), '^'
+        for intention in [True, False]:
+            obmdp = ObserverBeliefMDP(self.sto_planners,
+                                      true_planner_name='s',
+                                      belief_reward=5,
+                                      belief_reward_type='true_gain',
+                                      update_includes_intention=intention)
+            nw_p, nbs = obmdp.update_beliefs(beliefs, w, a)
+            self.assertEqual(nbs.shape, (len(beliefs), len(nw_p), 2))
+            self.assertEqual(
+                dict(nw_p),
+                {nw: p for (nw, _), p in
+                 obmdp.true_planner.mdp.transition_reward_dist(w, a).items()
+                 if p != 0})
+            for b, b_nbs in zip(beliefs, nbs):
+                for (nw, p), nb in zip(nw_p, b_nbs):
+                    expected = self._reference_beliefs(obmdp, b, w, a, nw)
+                    self.assertTrue(np.allclose(nb, expected, rtol=0,
+                                                atol=1e-12))
+            self.assertTrue(all(nbs[2, :, 1] == 1))
+
     def test_discretizedobmdp_simple_gridworld(self):
         seed_trajs = []
         for planner in self.det_planners.values():
@@ -103,6 +141,71 @@ class ObservationBeliefSmallMDPTestCase(unittest.TestCase):
         total_r = sum([r for s, a, ns, r in traj])
         self.assertTrue(total_r > 8.5)
 
+    def test_batched_discretization(self):
+        dobmdp = DiscretizedObserverBeliefMDPApproximation(
+            planners=self.det_planners,
+            true_planner_name='oo',
+            belief_reward=5,
+            belief_reward_type='true_gain',
+            n_probability_bins=5,
+            seed_trajs=[]
+        )
+        states = [((.3, .3, .2, .2), (0, 0)),
+                  ((.97, .01, .01, .01), (1, 0)),
+                  ((.3, .3, .2, .2), (1, 1))]
+        disc_states = dobmdp.discretize_bstates(states)
+        for s, ds in zip(states, disc_states):
+            dist, ind = dobmdp.bp_nbrs.query([s[0]])
+            nearest_b = tuple(dobmdp.belief_points[ind[0][0]])
+            self.assertEqual(ds, (nearest_b, s[1]))
+            self.assertEqual(dobmdp.discretize_bstate(s=s), ds)
+        self.assertEqual(disc_states[0][0], disc_states[2][0])
+
+    def test_lattice_discretization(self):
+        seed_trajs = [planner.run(softmax_temp=1, randchoose=.05)
+                      for planner in self.det_planners.values()]
+        dobmdps = {}
+        for discretizer in ['balltree', 'lattice']:
+            dobmdps[discretizer] = DiscretizedObserverBeliefMDPApproximation(
+                planners=self.det_planners,
+                true_planner_name='oo',
+                belief_reward=5,
+                belief_reward_type='true_gain',
+                n_probability_bins=5,
+                seed_trajs=seed_trajs,
+                discretizer=discretizer
+            )
+        beliefs = np.random.RandomState(0).dirichlet(np.ones(4), size=200)
+        dists = {}
+        for discretizer, dobmdp in dobmdps.items():
+            disc_bs = np.array(dobmdp.discretize_beliefs(beliefs))
+            dists[discretizer] = np.linalg.norm(beliefs - disc_bs, axis=1)
+        self.assertTrue(np.allclose(dists['balltree'], dists['lattice']))
+        self.assertFalse(hasattr(dobmdps['lattice'], 'bp_nbrs'))
+
+    def test_precomputed_tf_belief_order(self):
+        seed_trajs = [planner.run(softmax_temp=1, randchoose=.05)
+                      for planner in self.det_planners.values()]
+        kwargs = dict(planners=self.det_planners,
+                      true_planner_name='oo',
+                      belief_reward=5,
+                      belief_reward_type='true_gain',
+                      n_probability_bins=5,
+                      discretizer='lattice')
+        dobmdp = DiscretizedObserverBeliefMDPApproximation(
+            seed_trajs=seed_trajs, **kwargs)
+        rebuilt = DiscretizedObserverBeliefMDPApproximation(
+            discretized_tf=dobmdp.get_discretized_tf(), **kwargs)
+        first_seen = []
+        for b, _ in dobmdp.get_discretized_tf().keys():
+            if b not in first_seen:
+                first_seen.append(b)
+        self.assertEqual([tuple(b) for b in rebuilt.belief_points],
+                         first_seen)
+        beliefs = np.random.RandomState(1).dirichlet(np.ones(4), size=50)
+        self.assertEqual(rebuilt.discretize_beliefs(beliefs),
+                         dobmdp.discretize_beliefs(beliefs))
+
     def test_discretizedobmdp_stochastic_gridworld(self):
         seed_trajs = []
         non_std_t_features = {'g': {
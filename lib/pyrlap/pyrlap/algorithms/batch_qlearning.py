@@ -0,0 +1,236 @@
+import logging
+
+import numpy as np
+
+from pyrlap.core.sampling import CompiledTransitions, get_sampler
+from pyrlap.core.util import calc_esoftmax_matrix
+
+logger = logging.getLogger(__name__)
+
+class BatchQlearning(object):
+    """
+    Trains n_runs independent Q-learners (with the updates of Qlearning) on
+    the same MDP in lockstep, e.g. to simulate learning curves over many
+    seeds. Q-values and eligibility traces are (n_runs, |S|, |A|) arrays
+    over the states and actions of the MDP's compiled model, actions are
+    sampled from calc_esoftmax_matrix and next states from the compiled
+    transition function (see CompiledTransitions), so each step is a
+    handful of array operations for all of the runs.
+
+    train() returns the same run_data records as calling Learner.train on
+    each run with its run_id.
+    """
+    def __init__(self, mdp,
+                 n_runs : "number of independent learners" = 10,
+                 randchoose=.2,
+                 softmax_temp=1,
+                 discount_rate=.99,
+                 learning_rate=.1,
+                 eligibility_trace_method='replacement',
+                 eligibility_trace_decay=0,
+                 initial_qvalue=0,
+
+                 init_state=None):
+        if eligibility_trace_method not in ('replacement', 'cumulative'):
+            raise ValueError("Unknown eligibility_trace_method: %s"
+                             % eligibility_trace_method)
+        self.mdp = mdp
+        self.n_runs = n_runs
+        self.randchoose = randchoose
+        self.softmax_temp = softmax_temp
+        self.learning_rate = learning_rate
+        self.eligibility_trace_method = eligibility_trace_method
+        self.eligibility_trace_decay = eligibility_trace_decay
+        self.initial_qvalue = initial_qvalue
+
+        if init_state is None:
+            init_state = mdp.get_init_state()
+        self.init_state = init_state
+        if discount_rate is None:
+            discount_rate = mdp.discount_rate
+        self.discount_rate = discount_rate
+
+        self._build_tables()
+        self._q = np.broadcast_to(
+            self._initial_q, (n_runs, ) + self._initial_q.shape).copy()
+        self._traces = np.zeros(self._q.shape)
+
+    @classmethod
+    def from_learner(cls, learner, n_runs=10):
+        """
+        n_runs fresh copies of a Qlearning (or ArrayQlearning) learner's
+        settings
+        """
+        return cls(learner.mdp,
+                   n_runs=n_runs,
+                   randchoose=learner.randchoose,
+                   softmax_temp=learner.softmax_temp,
+                   discount_rate=learner.discount_rate,
+                   learning_rate=learner.learning_rate,
+                   eligibility_trace_method=learner.eligibility_trace_method,
+                   eligibility_trace_decay=learner.eligiblity_trace_decay,
+                   initial_qvalue=learner.initial_qvalue,
+                   init_state=learner.init_state)
+
+    def _build_tables(self):
+        mdp = self.mdp
+        model = mdp.get_compiled_model(sparse=True)
+        self.states = model.ss
+        self.state_index = model.ss_i
+        self.actions = model.aa
+        self.action_index = model.aa_i
+        n_states, n_actions = len(model.ss), len(model.aa)
+
+        # unavailable actions have a q-value of -inf so that row maxima
+        # are over available actions only
+        self.available = np.zeros((n_states, n_actions), dtype=bool)
+        self._initial_q = np.full((n_states, n_actions), -np.inf)
+        for si, s in enumerate(model.ss):
+            for a in mdp.available_actions(s):
+                ai = model.aa_i[a]
+                self.available[si, ai] = True
+                if mdp.is_terminal_action(a):
+                    self._initial_q[si, ai] = 0
+                else:
+                    self._initial_q[si, ai] = self.initial_qvalue
+        self.terminal = np.array([mdp.is_terminal(s) for s in model.ss])
+
+        self.transitions = CompiledTransitions(mdp)
+
+    # ================================= #
+    #              Sampling             #
+    # ================================= #
+
+    def _sample_actions(self, runs, s, softmax_temp, randchoose):
+        a_p = calc_esoftmax_matrix(self._q[runs, s], self.available[s],
+                                   temp=softmax_temp, randchoose=randchoose)
+        cum = np.cumsum(a_p, axis=-1)
+        u = get_sampler().random_n(len(runs))*cum[:, -1]
+        a = (cum <= u[:, None]).sum(axis=-1)
+        # guard against rounding at the top of the cdf
+        a = np.minimum(a, a_p.shape[1] - 1)
+        bad = ~self.available[s, a]
+        if bad.any():
+            a[bad] = np.argmax(a_p[bad], axis=-1)
+        return a
+
+    # ================================= #
+    #              Updates              #
+    # ================================= #
+
+    def _process(self, runs, s, a, ns, r):
+        q = self._q
+        q_sa = q[runs, s, a]
+        pred_error = r + self.discount_rate*q[runs, ns].max(axis=-1) - q_sa
+
+        if self.eligibility_trace_decay == 0:
+            q[runs, s, a] += self.learning_rate*pred_error
+            return
+
+        #traces of runs that took a non-greedy action are cleared (since
+        #we're off policy), the others decay
+        a_is_max = q_sa == q[runs, s].max(axis=-1)
+        traces = self._traces
+        with np.errstate(under='ignore'):
+            traces[runs[a_is_max]] *= \
+                self.discount_rate*self.eligibility_trace_decay
+        traces[runs[~a_is_max]] = 0
+        original_trace_val = traces[runs, s, a]
+        traces[runs, s] = 0
+        if self.eligibility_trace_method == 'replacement':
+            traces[runs, s, a] = 1
+        else:
+            traces[runs, s, a] = original_trace_val + 1
+
+        update = (self.learning_rate*pred_error)[:, None, None]
+        with np.errstate(under='ignore'):
+            q[runs] += update*traces[runs]
+
+    def episode_reset(self):
+        self._traces[:] = 0
+
+    def change_learning_rate(self, new):
+        self.learning_rate = new
+
+    # ================================= #
+    #              Training             #
+    # ================================= #
+
+    def train(self,
+              episodes=20, max_steps=100,
+              init_state=None,
+              run_ids : "one id per run for the records' run_id "
+                        "(defaults to 0, ..., n_runs - 1)" = None,
+              softmax_temp=None, randchoose=None,
+              run_data=None,
+              return_run_data=False):
+        """
+        Runs episodes episodes of every learner. The returned run_data is
+        grouped by run (in run order) and within each run has the records
+        that Learner.train would have returned for it.
+        """
+        if init_state is None:
+            init_state = self.init_state
+        if run_ids is None:
+            run_ids = list(range(self.n_runs))
+        if len(run_ids) != self.n_runs:
+            raise ValueError("Expected %d run_ids" % self.n_runs)
+        if softmax_temp is None:
+            softmax_temp = self.softmax_temp
+        if randchoose is None:
+            randchoose = self.randchoose
+
+        start_ep = 0
+        if run_data is None:
+            run_data = []
+        if len(run_data) > 0:
+            start_ep = run_data[-1]['episode'] + 1
+
+        steps = []
+        init_si = self.state_index[init_state]
+        for e in range(start_ep, episodes + start_ep):
+            runs = np.arange(self.n_runs)
+            s = np.full(self.n_runs, init_si)
+            for t in range(max_steps):
+                a = self._sample_actions(runs, s, softmax_temp, randchoose)
+                ns, r = self.transitions.sample(s, a)
+                if return_run_data:
+                    steps.append((e, t, runs, s, a, ns, r))
+                self._process(runs, s, a, ns, r)
+                running = ~self.terminal[ns]
+                runs, s = runs[running], ns[running]
+                if len(runs) == 0:
+                    break
+            if e % 100 == 0:
+                logger.debug('run: %d ; steps: %d' % (e, t))
+
+            self.episode_reset()
+
+        if return_run_data:
+            run_data.extend(self._run_records(steps, run_ids))
+            return run_data
+        return
+
+    def _run_records(self, steps, run_ids):
+        ss, aa = self.states, self.actions
+        records = [[] for _ in range(self.n_runs)]
+        for e, t, runs, s, a, ns, r in steps:
+            for n, si, ai, nsi, r_ in zip(runs.tolist(), s.tolist(),
+                                          a.tolist(), ns.tolist(),
+                                          r.tolist()):
+                records[n].append({
+                    'episode': e, 'timestep': t,
+                    's': ss[si], 'a': aa[ai], 'ns': ss[nsi], 'r': r_,
+                    'run_id': run_ids[n]
+                })
+        return [record for run in records for record in run]
+
+    def qvalues(self, run):
+        """
+        {s: {a: q}} copy of the Q-values of one run
+        """
+        q = self._q[run].tolist()
+        available = self.available.tolist()
+        return {s: {a: q[si][ai] for ai, a in enumerate(self.actions)
+                    if available[si][ai]}
+                for si, s in enumerate(self.states)}
@@ -0,0 +1,143 @@
+import copy
+import logging
+import warnings
+import time
+
+import numpy as np
+
+from pyrlap.algorithms.valueiteration import ValueIteration, initial_values
+from pyrlap.core.instrumentation import phase
+from pyrlap.core.sparse_model import SparseTransitionModel
+
+logger = logging.getLogger(__name__)
+
+class BatchValueIteration(object):
+    """
+    Solves K MDPs that share a transition structure but differ in their
+    rewards and discount rates (e.g. GridWorlds that only differ in
+    feature_rewards) with a single vectorized value iteration over a
+    (K, |S|, |A|) array of action values.
+
+    The transition structure is compiled once from the first MDP (or from
+    transition_function) and each MDP only contributes its rewards on those
+    transitions. solve() returns one sparse-engine ValueIteration planner per
+    MDP, with the same results as solving each of them on its own.
+    """
+    def __init__(self, mdps,
+                 discount_rates=.99,
+                 transition_function=None,
+                 converge_delta=.001,
+                 max_iterations=100,
+                 softmax_temp=0.0,
+                 randchoose=0.0,
+                 init_val=0.0,
+                 init_value_functions : "one {s: v} or {s: {a: q}} per MDP "
+                                        "(or None) to warm start from"
+                                        = None,
+                 policy_tables=False,
+                 metrics : "a pyrlap.core.instrumentation.Metrics that "
+                           "records phase times and per-iteration Bellman "
+                           "errors and backups" = None):
+        self.mdps = list(mdps)
+        self.discount_rates = \
+            np.broadcast_to(discount_rates, (len(self.mdps), )).astype(float)
+        self.tf = transition_function
+        self.converge_delta = converge_delta
+        self.max_iterations = max_iterations
+        self.softmax_temp = softmax_temp
+        self.randchoose = randchoose
+        self.init_val = init_val
+        if init_value_functions is None:
+            init_value_functions = [None for _ in self.mdps]
+        self.init_value_functions = list(init_value_functions)
+        self.policy_tables = policy_tables
+        self.sparse_model = None
+        self.metrics = metrics
+
+    def build_model(self):
+        logger.debug('Compiling shared transition model')
+        start = time.time()
+        with phase(self.metrics, 'model build'):
+            self._build_model()
+        logger.debug('Model compiled: %.2fs' % (time.time() - start))
+
+    def _build_model(self):
+        if self.tf is None:
+            self.tf, _ = \
+                self.mdps[0].get_reachable_transition_reward_functions()
+        model = SparseTransitionModel.from_transition_function(
+            self.tf, self.mdps[0].reward)
+        self.rewards = np.array(
+            [model.rewards] +
+            [model.transition_rewards(mdp.reward) for mdp in self.mdps[1:]]
+        )
+        self.sparse_model = model
+
+    def solve(self):
+        if self.sparse_model is None:
+            self.build_model()
+        with phase(self.metrics, 'solve'):
+            return self._solve()
+
+    def _solve(self):
+        model = self.sparse_model
+        n_mdps = len(self.mdps)
+        v = np.array([initial_values(model.states, self.init_val, init_vf)
+                      for init_vf in self.init_value_functions],
+                     dtype=np.float64)
+        q = np.zeros((n_mdps, model.n_state_actions))
+        change = np.full(n_mdps, np.inf)
+        iterations_run = np.zeros(n_mdps, dtype=int)
+        active = np.arange(n_mdps)
+        logger.debug('Running Batch Value Iteration (K = %d)' % n_mdps)
+
+        # MDPs drop out of the batch as they converge so that each one
+        # stops at the same iteration it would have stopped at on its own
+        for i in range(self.max_iterations):
+            q_act = model.backup(v[active], self.discount_rates[active],
+                                 rewards=self.rewards[active])
+            v_act = model.state_max(q_act)
+            change[active] = np.max(np.abs(v_act - v[active]), axis=-1)
+            q[active] = q_act
+            v[active] = v_act
+            iterations_run[active] = i
+            logger.debug('iteration: %d   max change: %.2f' %
+                         (i, change[active].max()))
+            if self.metrics is not None:
+                self.metrics.iteration('BatchValueIteration', i,
+                                       change[active].max(),
+                                       len(active)*model.n_states)
+            active = active[change[active] >= self.converge_delta]
+            if len(active) == 0:
+                break
+        for k in active:
+            warnings.warn(
+                "VI did not converge after %d iterations (delta=%.2f)" \
+                % (iterations_run[k], change[k]))
+
+        planners = []
+        for k, mdp in enumerate(self.mdps):
+            planner = ValueIteration(
+                mdp,
+                transition_function=self.tf,
+                discount_rate=float(self.discount_rates[k]),
+                converge_delta=self.converge_delta,
+                max_iterations=self.max_iterations,
+                softmax_temp=self.softmax_temp,
+                randchoose=self.randchoose,
+                init_val=self.init_val,
+                init_value_function=self.init_value_functions[k],
+                engine='sparse',
+                policy_tables=self.policy_tables,
+                metrics=self.metrics)
+            planner.sparse_model = copy.copy(model)
+            planner.sparse_model.rewards = self.rewards[k]
+            max_rows = model.state_argmax(q[k], v[k])
+            planner.optimal_policy = dict(zip(
+                model.states, [model.sa_action[r] for r in max_rows]))
+            planner.value_function = model.to_state_dict(v[k])
+            planner.action_value_function = model.to_state_action_dict(q[k])
+            planner.iterations_run = int(iterations_run[k])
+            planner.backups_run = (planner.iterations_run + 1)*model.n_states
+            planners.append(planner)
+        return planners
@@ -1,11 +1,11 @@
-import torch
+import logging
+
+import numpy as np
 from pyrlap.core.agent import Planner
+from pyrlap.core.backend import get_backend
+from pyrlap.algorithms.soft_vi import _expected_reward_and_backup
 
-def softmax(vals, temp, min_energy=.01):
-    norm_vals = (vals.t() - torch.max(vals, dim=1)[0]).t()
-    energy = torch.exp((norm_vals.t()*temp).t()) + torch.tensor(min_energy)
-    norm_energy = energy.sum(dim=1)
-    return (energy.t()/norm_energy).t()
+logger = logging.getLogger(__name__)
 
 class FreeEnergyValueIteration(Planner):
     """
@@ -21,7 +21,11 @@ class FreeEnergyValueIteration(Planner):
                  randchoose=0.0,
                  default_policy=None,
                  info_cost_weight=.01,
-                 init_val=0.0):
+                 init_val=0.0,
+                 sparse=False,
+                 backend : "'numpy', 'torch' (only imported when used) or "
+                           "a backend object from pyrlap.core.backend"
+                           = 'numpy'):
         Planner.__init__(self, mdp)
         self.discount_rate = discount_rate
         self.converge_delta = converge_delta
@@ -30,54 +34,61 @@ class FreeEnergyValueIteration(Planner):
         self.randchoose = randchoose
         self.init_val = init_val
         self.device = 'cpu'
+        self.sparse = sparse
         self.default_policy = default_policy
         self.info_cost_weight = info_cost_weight
+        if backend == 'torch':
+            self.backend = get_backend(backend, device=self.device)
+        else:
+            self.backend = get_backend(backend)
 
     def solve(self):
-        mats = self.mdp.as_matrices()
-        tf = torch.from_numpy(mats['tf']).to(self.device)
-        rf = torch.from_numpy(mats['rf']).to(self.device)
-        ss = mats['ss']
-        aa = mats['aa']
+        mats = self.mdp.get_compiled_model(sparse=self.sparse)
+        bk = self.backend
+        er, next_sa_val = _expected_reward_and_backup(mats, bk)
+        ss = mats.ss
+        aa = mats.aa
         if self.default_policy is None:
-            pi0 = torch.ones((len(ss), len(aa)), device=self.device)
-            pi0 = torch.einsum("sa,s->sa", pi0, 1 / pi0.sum(dim=1))
+            pi0 = bk.ones((len(ss), len(aa)))
+            pi0 = bk.einsum("sa,s->sa", pi0, 1 / bk.sum(pi0, axis=1))
         else:
-            pi0 = torch.from_numpy(self.default_policy).to(self.device)
+            pi0 = bk.asarray(self.default_policy)
 
-        er = torch.einsum("san,san->sa", tf, rf)
-        fev = torch.zeros(len(ss))
+        fev = bk.zeros(len(ss))
 
         pi_eps = 1e-15 #tiny prob of taking any action prevents infinite cost
 
-        for i in range(self.max_iterations):
-            fut_fq = torch.einsum("san,n->sa",tf,fev)
-            fq = er + self.discount_rate * fut_fq
-            energy = (1 / self.info_cost_weight) * fq + torch.log(pi0)
-            energy = (energy.t() - torch.max(energy, dim=1)[0]).t()
-            pi = torch.exp(energy)
-            pi = (1 - pi_eps)*pi + pi_eps/len(aa)
-            z = pi.sum(dim=1)
-            pi = torch.einsum("sa,s->sa",pi,1/z)
-            new_fev = er - self.info_cost_weight*torch.log(pi/pi0) + \
-                      self.discount_rate * fut_fq
-            if (new_fev > 100).any():
-                print(list(zip(ss, new_fev)))
-                print(list(zip(ss, pi/pi0)))
+        with np.errstate(under='ignore'):
+            for i in range(self.max_iterations):
+                fut_fq = next_sa_val(fev)
+                fq = er + self.discount_rate * fut_fq
+                energy = (1 / self.info_cost_weight) * fq + bk.log(pi0)
+                energy = energy - bk.max(energy, axis=1, keepdims=True)
+                pi = bk.exp(energy)
+                pi = (1 - pi_eps)*pi + pi_eps/len(aa)
+                z = bk.sum(pi, axis=1)
+                pi = bk.einsum("sa,s->sa",pi,1/z)
+                new_fev = er - self.info_cost_weight*bk.log(pi/pi0) + \
+                          self.discount_rate * fut_fq
+                if logger.isEnabledFor(logging.DEBUG) and \
+                        (new_fev > 100).any():
+                    logger.debug('free energy > 100: %s'
+                                 % list(zip(ss, new_fev)))
+                    logger.debug('pi/pi0: %s' % list(zip(ss, pi/pi0)))
 
-            new_fev = torch.einsum("sa,sa->s", new_fev, pi)
-            diff = torch.abs(new_fev - fev).max()
-            if diff < self.converge_delta:
-                break
-            fev = new_fev
+                new_fev = bk.einsum("sa,sa->s", new_fev, pi)
+                diff = bk.max(bk.abs(new_fev - fev))
+                if diff < self.converge_delta:
+                    break
+                fev = new_fev
         fev = new_fev
 
-        pol = pi.data.numpy()
-        fev = fev.data.numpy()
-        fq = fq.data.numpy()
+        pol = bk.to_numpy(pi)
+        fev = bk.to_numpy(fev)
+        fq = bk.to_numpy(fq)
 
         self.optimal_policy = \
-            {s: dict(zip(mats['aa'], adist)) for s, adist in zip(mats['ss'], pol)}
-        self.value_function = dict(zip(mats['ss'], fev))
+            {s: dict(zip(mats.aa, adist)) for s, adist in zip(mats.ss, pol)}
+        self.value_function = dict(zip(mats.ss, fev))
         self.action_value_function =\
-            {s: dict(zip(mats['aa'], aq)) for s, aq in zip(mats['ss'], fq)}
+            {s: dict(zip(mats.aa, aq)) for s, aq in zip(mats.ss, fq)}
@@ -0,0 +1,193 @@
+import logging
+import warnings
+import time
+
+import numpy as np
+
+from pyrlap.algorithms.valueiteration import initial_values
+from pyrlap.core.agent import Planner
+from pyrlap.core.linalg import solve_policy_system
+from pyrlap.core.instrumentation import phase
+from pyrlap.core.sparse_model import SparseTransitionModel
+from pyrlap.core.util import calc_esoftmax_dist, calc_esoftmax_policy
+
+logger = logging.getLogger(__name__)
+
+class PolicyIteration(Planner):
+    """
+    Policy iteration over the compiled sparse model of an MDP. Each
+    iteration evaluates the current deterministic policy and then makes it
+    greedy with respect to that evaluation.
+
+    With eval_iterations=None the policy is evaluated exactly with a sparse
+    linear solve. Otherwise (modified policy iteration) the value function
+    gets eval_iterations backups under the current policy, and iteration
+    stops once the policy is stable and the Bellman error is below
+    converge_delta.
+
+    Exact evaluation with discount_rate=1 needs every policy (starting
+    with the greedy policy of the initial values) to reach a terminal
+    state from every state, and raises ValueError otherwise.
+    """
+    def __init__(self, mdp,
+                 transition_function=None,
+                 discount_rate=.99,
+                 converge_delta=.001,
+                 max_iterations=100,
+                 eval_iterations : "None for exact policy evaluation, or "
+                                   "the number of backups per evaluation"
+                                   = None,
+                 softmax_temp=0.0,
+                 randchoose=0.0,
+                 init_val=0.0,
+                 init_value_function : "{s: v} or {s: {a: q}} from a "
+                                       "previous solve to start from" = None,
+                 metrics : "a pyrlap.core.instrumentation.Metrics that "
+                           "records phase times and per-iteration Bellman "
+                           "errors and backups" = None):
+        Planner.__init__(self, mdp)
+        self.discount_rate = discount_rate
+        self.converge_delta = converge_delta
+        self.max_iterations = max_iterations
+        self.eval_iterations = eval_iterations
+        self.softmax_temp = softmax_temp
+        self.randchoose = randchoose
+        self.init_val = init_val
+        self.init_value_function = init_value_function
+        self.tf = transition_function
+        self.sparse_model = None
+        self.metrics = metrics
+
+    def build_sparse_model(self):
+        if self.tf is None:
+            self.tf, _ = self.mdp.get_reachable_transition_reward_functions()
+        logger.debug('Compiling sparse transition and reward model')
+        start = time.time()
+        with phase(self.metrics, 'model build'):
+            self.sparse_model = \
+                SparseTransitionModel.from_transition_function(
+                    self.tf, self.mdp.reward)
+        self.terminal = np.array([self.mdp.is_terminal(s)
+                                  for s in self.sparse_model.states])
+        logger.debug('Model compiled: %.2fs' % (time.time() - start))
+
+    def _policy_matrices(self, rows):
+        """
+        Next-state distribution and expected reward of each state under
+        the policy that takes the (state, action) row rows[s] in state s
+        """
+        from scipy.sparse import csr_matrix
+        model = self.sparse_model
+        tp = model.tp[rows]
+        row_rewards = csr_matrix(
+            (model.tp.data*model.rewards, model.tp.indices, model.tp.indptr),
+            shape=model.tp.shape)[rows]
+        r_pi = np.asarray(row_rewards.sum(axis=1)).ravel()
+        return tp, r_pi
+
+    def _evaluate(self, rows, v):
+        tp, r_pi = self._policy_matrices(rows)
+        if self.eval_iterations is None and self.discount_rate == 1:
+            # terminal states loop on themselves, which would make the
+            # undiscounted system singular, so they are given a value of 0
+            from scipy.sparse import diags
+            tp = diags((~self.terminal).astype(np.float64)).dot(tp)
+            r_pi = np.where(self.terminal, 0.0, r_pi)
+        if self.eval_iterations is None:
+            try:
+                return solve_policy_system(tp, r_pi, self.discount_rate)
+            except np.linalg.LinAlgError:
+                raise ValueError(
+                    "Cannot evaluate the policy exactly: with "
+                    "discount_rate=%g it does not reach a terminal state "
+                    "from every state. Use discount_rate < 1, "
+                    "eval_iterations or an init_value_function whose "
+                    "greedy policy does." % self.discount_rate)
+        for _ in range(self.eval_iterations):
+            v = r_pi + self.discount_rate*tp.dot(v)
+        return v
+
+    def _greedy_rows(self, q, v_greedy):
+        """
+        Maximizing row of each state, treating actions whose values are
+        within floating point error of the maximum as tied (ties go to the
+        action that comes first in sorted order, as in ValueIteration)
+        """
+        model = self.sparse_model
+        tol = 1e-12*max(1.0, np.max(np.abs(v_greedy)))
+        v_sa = v_greedy[model.sa_state]
+        return model.state_argmax(np.where(q >= v_sa - tol, v_sa, q),
+                                  v_greedy)
+
+    def _improve(self, q, v_greedy, rows):
+        """
+        Greedy policy rows for q, keeping the current action wherever it
+        is still maximal so that ties do not cause cycling
+        """
+        tol = 1e-12*max(1.0, np.max(np.abs(v_greedy)))
+        keep = q[rows] >= v_greedy - tol
+        return np.where(keep, rows, self._greedy_rows(q, v_greedy))
+
+    def solve(self):
+        if self.sparse_model is None:
+            self.build_sparse_model()
+        with phase(self.metrics, 'solve'):
+            self._solve()
+
+    def _solve(self):
+        model = self.sparse_model
+        v = np.array(initial_values(model.states, self.init_val,
+                                    self.init_value_function),
+                     dtype=np.float64)
+        q = model.backup(v, self.discount_rate)
+        rows = model.state_argmax(q)
+        logger.debug('Running Policy Iteration')
+
+        for i in range(self.max_iterations):
+            v = self._evaluate(rows, v)
+            q = model.backup(v, self.discount_rate)
+            v_greedy = model.state_max(q)
+            change = np.max(np.abs(v_greedy - v))
+            new_rows = self._improve(q, v_greedy, rows)
+            n_changed = np.sum(new_rows != rows)
+            rows = new_rows
+            logger.debug('iteration: %d   policy changes: %d   change: %.2f'
+                         % (i, n_changed, change))
+            if self.metrics is not None:
+                n_evals = 1 if self.eval_iterations is None \
+                    else self.eval_iterations + 1
+                self.metrics.iteration('PolicyIteration', i, change,
+                                       n_evals*model.n_states)
+            if n_changed == 0 and (self.eval_iterations is None or
+                                   change < self.converge_delta):
+                break
+        else:
+            warnings.warn(
+                "PI did not converge after %d iterations (delta=%.2f)" \
+                % (i, change))
+        max_rows = self._greedy_rows(q, v_greedy)
+        self.optimal_policy = \
+            dict(zip(model.states, [model.sa_action[r] for r in max_rows]))
+        self.value_function = model.to_state_dict(v_greedy)
+        self.action_value_function = model.to_state_action_dict(q)
+        self.iterations_run = i
+
+    def act_dist(self, s, softmax_temp=None, randchoose=None):
+        if softmax_temp is None:
+            softmax_temp = self.softmax_temp
+        if randchoose is None:
+            randchoose = self.randchoose
+
+        return calc_esoftmax_dist(self.action_value_function[s],
+                                  temp=softmax_temp,
+                                  randchoose=randchoose)
+
+    def to_dict(self, softmax_temp=None, randchoose=None):
+        if softmax_temp is None:
+            softmax_temp = self.softmax_temp
+        if randchoose is None:
+            randchoose = self.randchoose
+
+        return calc_esoftmax_policy(self.action_value_function,
+                                    temp=softmax_temp,
+                                    randchoose=randchoose)
@@ -1,3 +1,5 @@
+import numpy as np
+
 from pyrlap.core.util import calc_esoftmax_dist
 from pyrlap.core.agent import Learner
 
@@ -106,4 +108,204 @@ class Qlearning(Learner):
         self.eligibility_traces = {}
 
     def change_learning_rate(self, new):
-        self.learning_rate = new
\ No newline at end of file
+        self.learning_rate = new
+
+class ArrayQlearning(Learner):
+    """
+    Q-learning with the same updates as Qlearning, but with Q-values and
+    eligibility traces stored in |S| x |A| arrays that grow as new states
+    (and actions) are encountered.
+
+    Traces are only kept for the rows of states that have been traced since
+    they were last cleared, and are decayed and applied to the Q-values with
+    one vectorized operation over those rows per step.
+    """
+    def __init__(self, mdp,
+                 randchoose=.2,
+                 softmax_temp=1,
+                 discount_rate=.99,
+                 learning_rate=.1,
+                 eligibility_trace_method='replacement',
+                 eligibility_trace_decay=0,
+                 initial_qvalue=0,
+
+                 init_state=None,
+                 initial_capacity=64):
+        Learner.__init__(self, mdp)
+
+        self.randchoose = randchoose
+        self.softmax_temp = softmax_temp
+        self.learning_rate = learning_rate
+        self.eligibility_trace_method = eligibility_trace_method
+        self.eligiblity_trace_decay = eligibility_trace_decay
+        self.initial_qvalue = initial_qvalue
+
+        if init_state is None:
+            init_state = mdp.get_init_state()
+        self.init_state = init_state
+        if discount_rate is None:
+            discount_rate = mdp.discount_rate
+        self.discount_rate = discount_rate
+
+        self.states = []
+        self.state_index = {}
+        self.actions = []
+        self.action_index = {}
+        self.state_actions = []
+
+        # unavailable actions have a q-value of -inf so that row maxima
+        # are over available actions only
+        initial_capacity = max(1, initial_capacity)
+        self._q = np.full((initial_capacity, 0), -np.inf)
+        self._traces = np.zeros((initial_capacity, 0))
+        self._traced = np.zeros(initial_capacity, dtype=bool)
+        self._traced_rows = np.zeros(initial_capacity, dtype=int)
+        self._n_traced = 0
+
+    # ================================= #
+    #          Array management         #
+    # ================================= #
+
+    def _action_col(self, a):
+        if a not in self.action_index:
+            self.action_index[a] = len(self.actions)
+            self.actions.append(a)
+            n_rows = self._q.shape[0]
+            self._q = np.hstack([self._q, np.full((n_rows, 1), -np.inf)])
+            self._traces = np.hstack([self._traces, np.zeros((n_rows, 1))])
+        return self.action_index[a]
+
+    def _grow_rows(self):
+        n_rows, n_cols = self._q.shape
+        self._q = np.vstack([self._q, np.full((n_rows, n_cols), -np.inf)])
+        self._traces = np.vstack([self._traces, np.zeros((n_rows, n_cols))])
+        self._traced = np.concatenate(
+            [self._traced, np.zeros(n_rows, dtype=bool)])
+        self._traced_rows = np.concatenate(
+            [self._traced_rows, np.zeros(n_rows, dtype=int)])
+
+    def _state_row(self, s):
+        try:
+            return self.state_index[s]
+        except KeyError:
+            pass
+        si = len(self.states)
+        if si == self._q.shape[0]:
+            self._grow_rows()
+        s_actions = []
+        for a in self.mdp.available_actions(s):
+            ai = self._action_col(a)
+            if self.mdp.is_terminal_action(a):
+                self._q[si, ai] = 0
+            else:
+                self._q[si, ai] = self.initial_qvalue
+            s_actions.append((a, ai))
+        self.states.append(s)
+        self.state_index[s] = si
+        self.state_actions.append(s_actions)
+        return si
+
+    # ================================= #
+    #         Eligibility traces        #
+    # ================================= #
+
+    def _active_rows(self):
+        return self._traced_rows[:self._n_traced]
+
+    def _clear_traces(self):
+        if self._n_traced == 0:
+            return
+        rows = self._active_rows()
+        self._traces[rows] = 0
+        self._traced[rows] = False
+        self._n_traced = 0
+
+    def _decay_traces(self):
+        if self._n_traced == 0:
+            return
+        decay = self.discount_rate*self.eligiblity_trace_decay
+        with np.errstate(under='ignore'):
+            self._traces[self._active_rows()] *= decay
+
+    def _set_trace(self, si, ai):
+        if not self._traced[si]:
+            self._traced[si] = True
+            self._traced_rows[self._n_traced] = si
+            self._n_traced += 1
+        original_trace_val = self._traces[si, ai]
+        self._traces[si] = 0
+        if self.eligibility_trace_method == 'replacement':
+            self._traces[si, ai] = 1
+        elif self.eligibility_trace_method == 'cumulative':
+            self._traces[si, ai] = original_trace_val + 1
+
+    # ================================= #
+    #           Learner methods         #
+    # ================================= #
+
+    def act_dist(self, s, softmax_temp=None, randchoose=None):
+        si = self._state_row(s)
+
+        if softmax_temp is None:
+            softmax_temp = self.softmax_temp
+        if randchoose is None:
+            randchoose = self.randchoose
+
+        q = self._q[si].tolist()
+        a_q = {a: q[ai] for a, ai in self.state_actions[si]}
+        return calc_esoftmax_dist(a_q, temp=softmax_temp,
+                                  randchoose=randchoose)
+
+    def process(self, s, a, ns, r):
+        nsi = self._state_row(ns)
+        si = self._state_row(s)
+        ai = self.action_index[a]
+        q = self._q
+
+        #calculate prediction error
+        max_s_q = q[si].max()
+        pred_error = r + self.discount_rate*q[nsi].max() - q[si, ai]
+
+        #update eligibility traces (invalid once a non-greedy action is
+        #taken, since we're off policy)
+        if q[si, ai] == max_s_q:
+            self._decay_traces()
+        else:
+            self._clear_traces()
+        if self.eligiblity_trace_decay > 0:
+            self._set_trace(si, ai)
+
+        #update q values
+        if self.eligiblity_trace_decay == 0:
+            q[si, ai] += self.learning_rate*pred_error
+        else:
+            rows = self._active_rows()
+            with np.errstate(under='ignore'):
+                q[rows] += self.learning_rate*pred_error*self._traces[rows]
+
+    def episode_reset(self):
+        self._clear_traces()
+
+    def change_learning_rate(self, new):
+        self.learning_rate = new
+
+    @property
+    def qvalues(self):
+        """
+        {s: {a: q}} copy of the Q-values
+        """
+        q = self._q.tolist()
+        return {s: {a: q[si][ai] for a, ai in self.state_actions[si]}
+                for s, si in self.state_index.items()}
+
+    @property
+    def eligibility_traces(self):
+        """
+        {s: {a: e}} copy of the traces of the states currently traced
+        """
+        traces = {}
+        for si in self._active_rows().tolist():
+            e = self._traces[si].tolist()
+            traces[self.states[si]] = \
+                {a: e[ai] for a, ai in self.state_actions[si]}
+        return traces
@@ -1,20 +1,91 @@
-import torch
+import numpy as np
 from pyrlap.core.agent import Planner
+from pyrlap.core.backend import get_backend, backend_of
+from pyrlap.core.instrumentation import phase
 
-def softmax(vals, temp, min_energy=.01):
-    norm_vals = (vals.t() - torch.max(vals, dim=1)[0]).t()
-    energy = torch.exp((norm_vals.t()*temp).t()) + torch.tensor(min_energy)
-    norm_energy = energy.sum(dim=1)
-    return (energy.t()/norm_energy).t()
+def softmax(vals, temp, min_energy=.01, backend=None):
+    """
+    Softmax over each row of temp*vals, where every action's energy is
+    padded by min_energy before normalizing
+    """
+    if backend is None:
+        backend = backend_of(vals)
+    norm_vals = vals - backend.max(vals, axis=1, keepdims=True)
+    energy = backend.exp(norm_vals*temp) + min_energy
+    norm_energy = backend.sum(energy, axis=1, keepdims=True)
+    return energy/norm_energy
+
+def logsumexp(vals, temp, backend=None):
+    """
+    log(sum(exp(temp*vals))) over each row (as a column), computed after
+    subtracting the row maxima so that it does not overflow
+    """
+    if backend is None:
+        backend = backend_of(vals)
+    energy = vals*temp
+    max_energy = backend.max(energy, axis=1, keepdims=True)
+    return max_energy + backend.log(
+        backend.sum(backend.exp(energy - max_energy), axis=1, keepdims=True))
+
+def _expected_reward_and_backup(mats, backend, dtype=np.float32):
+    """
+    Returns the expected immediate reward of each state-action and a
+    function mapping next-state values to expected next-state values for
+    each state-action, for either dense or sparse (CSR) matrices.
+
+    With float64 the compiled model's (cached) expected rewards are used.
+    """
+    tf, rf = mats.tf, mats.rf
+    sa_shape = (len(mats.ss), len(mats.aa))
+    if not mats.sparse:
+        tf = backend.asarray(tf, dtype=dtype)
+        if dtype == np.float64:
+            er = backend.asarray(mats.expected_reward(), dtype=dtype)
+        else:
+            er = backend.einsum("san,san->sa", tf, backend.asarray(rf))
+        return er, lambda v: backend.einsum("san,n->sa", tf, v)
+
+    if dtype == np.float64:
+        er = mats.expected_reward()
+        tf = tf.astype(np.float64)
+    else:
+        er = np.asarray(tf.multiply(rf).sum(axis=1), dtype=np.float32)
+    er = backend.asarray(er.reshape(sa_shape), dtype=dtype)
+    def next_sa_val(v):
+        nv = tf.dot(backend.to_numpy(v)).astype(dtype)
+        return backend.asarray(nv.reshape(sa_shape))
+    return er, next_sa_val
 
 class SoftValueIteration(Planner):
+    """
+    Value iteration with softmax policies over the q-values, where
+    softmax_temp multiplies the q-values. The modes differ in the backup:
+
+    - 'legacy': the value of a state is the expected q-value under the
+      softmax policy, E_pi[q(s, a)], where every action's energy is padded
+      by min_energy (see softmax). Iterates in float32.
+    - 'fast': the log-sum-exp (soft) backup
+      v(s) = logsumexp(softmax_temp*q(s, .))/softmax_temp with the policy
+      exp(softmax_temp*q(s, a) - softmax_temp*v(s)). Iterates in float64
+      and needs softmax_temp > 0.
+    """
     def __init__(self, mdp,
                  discount_rate=.99,
                  converge_delta=.0001,
                  max_iterations=100,
                  softmax_temp=0.0,
                  randchoose=0.0,
-                 init_val=0.0):
+                 init_val=0.0,
+                 sparse=False,
+                 backend : "'numpy', 'torch' (only imported when used) or "
+                           "a backend object from pyrlap.core.backend"
+                           = 'numpy',
+                 mode : "'legacy' backs up E_pi[q] in float32 with "
+                        "min_energy padding in the softmax; 'fast' backs "
+                        "up logsumexp(temp*q)/temp in float64" = 'legacy',
+                 metrics : "a pyrlap.core.instrumentation.Metrics that "
+                           "records phase times and per-iteration Bellman "
+                           "errors and backups" = None):
         Planner.__init__(self, mdp)
         self.discount_rate = discount_rate
         self.converge_delta = converge_delta
@@ -23,34 +94,63 @@ class SoftValueIteration(Planner):
         self.randchoose = randchoose
         self.init_val = init_val
         self.device = 'cpu'
+        self.sparse = sparse
+        if mode not in ('legacy', 'fast'):
+            raise ValueError("Unknown mode: %s" % mode)
+        if mode == 'fast' and softmax_temp <= 0:
+            raise ValueError("mode='fast' needs softmax_temp > 0")
+        self.mode = mode
+        self.metrics = metrics
+        if backend == 'torch':
+            self.backend = get_backend(backend, device=self.device)
+        else:
+            self.backend = get_backend(backend)
+
+    def _soft_value(self, q):
+        """
+        Value of each state and the policy it comes from
+        """
+        bk = self.backend
+        if self.mode == 'legacy':
+            pol = softmax(q, self.softmax_temp, backend=bk)
+            return bk.einsum("sa->s", pol * q), pol
+        log_z = logsumexp(q, self.softmax_temp, backend=bk)
+        pol = bk.exp(q*self.softmax_temp - log_z)
+        return log_z[:, 0]/self.softmax_temp, pol
 
     def solve(self):
-        mats = self.mdp.as_matrices()
-        tf = torch.from_numpy(mats['tf']).to(self.device)
-        rf = torch.from_numpy(mats['rf']).to(self.device)
-
-        er = torch.einsum("san,san->sa", tf, rf)
-        q = torch.zeros(tf.shape[0:2])
-        for i in range(self.max_iterations):
-            # next step discounted softmax value
-            s_softval = torch.einsum("sa->s", softmax(q, self.softmax_temp) * q)
-            disc_ns_softval = self.discount_rate * s_softval
-
-            # future state-action value
-            fq = torch.einsum("san,n->sa", tf, disc_ns_softval)
-
-            diff = torch.abs((er + fq) - q).max()
-            if diff < self.converge_delta:
-                break
-            # sa-val is the expected r + discounted future value
-            q = er + fq
-        pol = softmax(q, self.softmax_temp)
-        v = torch.einsum("sa->s", pol * q)
-        pol = pol.data.numpy()
-        v = v.data.numpy()
-        q = q.data.numpy()
+        bk = self.backend
+        dtype = np.float32 if self.mode == 'legacy' else np.float64
+        with phase(self.metrics, 'model build'):
+            mats = self.mdp.get_compiled_model(sparse=self.sparse)
+            er, next_sa_val = _expected_reward_and_backup(mats, bk, dtype)
+        with phase(self.metrics, 'solve'):
+            q, pol, v = self._iterate(er, next_sa_val, dtype)
         self.optimal_policy = \
-            {s: dict(zip(mats['aa'], adist)) for s, adist in zip(mats['ss'], pol)}
-        self.value_function = dict(zip(mats['ss'], v))
+            {s: dict(zip(mats.aa, adist)) for s, adist in zip(mats.ss, pol)}
+        self.value_function = dict(zip(mats.ss, v))
         self.action_value_function =\
-            {s: dict(zip(mats['aa'], aq)) for s, aq in zip(mats['ss'], q)}
\ No newline at end of file
+            {s: dict(zip(mats.aa, aq)) for s, aq in zip(mats.ss, q)}
+
+    def _iterate(self, er, next_sa_val, dtype):
+        bk = self.backend
+        q = bk.zeros(er.shape, dtype=dtype)
+        with np.errstate(under='ignore'):
+            for i in range(self.max_iterations):
+                # next step discounted softmax value
+                s_softval, _ = self._soft_value(q)
+                disc_ns_softval = self.discount_rate * s_softval
+
+                # future state-action value
+                fq = next_sa_val(disc_ns_softval)
+
+                diff = bk.max(bk.abs((er + fq) - q))
+                if self.metrics is not None:
+                    self.metrics.iteration('SoftValueIteration', i,
+                                           float(diff), er.shape[0])
+                if diff < self.converge_delta:
+                    break
+                # sa-val is the expected r + discounted future value
+                q = er + fq
+            v, pol = self._soft_value(q)
+        return bk.to_numpy(q), bk.to_numpy(pol), bk.to_numpy(v)
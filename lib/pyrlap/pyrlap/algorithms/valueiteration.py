@@ -1,13 +1,44 @@
+import heapq
 import logging
 import warnings
 import time
+from collections import OrderedDict
+from collections.abc import Mapping
+from itertools import count
+
+import numpy as np
 
 from pyrlap.core.agent import Planner
+from pyrlap.core.instrumentation import phase
+from pyrlap.core.policy_table import PolicyTable
+from pyrlap.core.sampling import CategoricalTable, get_sampler
+from pyrlap.core.sparse_model import SparseTransitionModel
+from pyrlap.core.transition_function import TransitionFunction
 from pyrlap.core.util import argmax_dict, calc_esoftmax_dist, \
     calc_esoftmax_policy
 
 logger = logging.getLogger(__name__)
 
+def initial_values(states, init_val=0.0, init_value_function=None):
+    """
+    Starting value of each state for a warm-started solve.
+
+    :param init_value_function: value function {s: v} or action value
+    function {s: {a: q}} of a previous solve, possibly of a different MDP
+    with overlapping states
+    :return: list of values, init_val for states init_value_function
+    does not cover
+    """
+    if init_value_function is None:
+        return [init_val for _ in states]
+    vals = []
+    for s in states:
+        v = init_value_function.get(s, init_val)
+        if isinstance(v, Mapping):
+            v = max(v.values())
+        vals.append(v)
+    return vals
+
 class ValueIteration(Planner):
     def __init__(self, mdp,
                  transition_function=None,
@@ -16,7 +47,27 @@ class ValueIteration(Planner):
                  max_iterations=100,
                  softmax_temp=0.0,
                  randchoose=0.0,
-                 init_val=0.0):
+                 init_val=0.0,
+                 init_value_function : "{s: v} or {s: {a: q}} from a "
+                                       "previous solve to start from; states "
+                                       "it does not cover start at init_val"
+                                       = None,
+                 engine : "'dict' runs backups over the nested transition "
+                          "dictionary; 'sparse' compiles the transition "
+                          "function and rewards once and runs vectorized "
+                          "sweeps" = 'dict',
+                 sweep : "'jacobi' backs up every state from the previous "
+                         "sweep's values; 'gauss-seidel' updates values in "
+                         "place; 'prioritized' backs up states in order of "
+                         "Bellman error (dict engine only)" = 'jacobi',
+                 policy_tables : "serve act_dist, to_dict and as_matrix "
+                                 "from cached |S| x |A| policy matrices "
+                                 "(see PolicyTable)" = False,
+                 policy_cache_size=4,
+                 metrics : "a pyrlap.core.instrumentation.Metrics that "
+                           "records phase times, per-iteration Bellman "
+                           "errors and backups, and policy cache hits"
+                           = None):
         Planner.__init__(self, mdp)
         self.discount_rate = discount_rate
         self.converge_delta = converge_delta
@@ -24,20 +75,63 @@ class ValueIteration(Planner):
         self.softmax_temp = softmax_temp
         self.randchoose = randchoose
         self.init_val = init_val
+        self.init_value_function = init_value_function
         self.tf = transition_function
+        if engine not in ('dict', 'sparse'):
+            raise ValueError("Unknown engine: %s" % engine)
+        self.engine = engine
+        if sweep not in ('jacobi', 'gauss-seidel', 'prioritized'):
+            raise ValueError("Unknown sweep: %s" % sweep)
+        if engine == 'sparse' and sweep != 'jacobi':
+            raise ValueError("The sparse engine only runs jacobi sweeps")
+        self.sweep = sweep
+        self.sparse_model = None
+        self.policy_tables = policy_tables
+        self.policy_cache_size = policy_cache_size
+        self._policy_table = None
+        self._policy_table_avf = None
+        self._act_tables = OrderedDict()
+        self._act_tables_avf = None
+        self.metrics = metrics
 
     def build_model(self):
         logger.debug('Building transition and reward model')
         start = time.time()
-        tf, rf = self.mdp.get_reachable_transition_reward_functions()
+        with phase(self.metrics, 'model build'):
+            tf, rf = self.mdp.get_reachable_transition_reward_functions()
         self.tf = tf
         # self.rf = rf
         logger.debug('Model built: %.2fs' % (time.time() - start))
 
-    def solve(self):
+    def build_sparse_model(self):
         if self.tf is None:
             self.build_model()
-        vf = {s : self.init_val for s in self.tf}
+        logger.debug('Compiling sparse transition and reward model')
+        start = time.time()
+        with phase(self.metrics, 'model compile'):
+            self.sparse_model = \
+                SparseTransitionModel.from_transition_function(
+                    self.tf, self.mdp.reward)
+        logger.debug('Model compiled: %.2fs' % (time.time() - start))
+
+    def solve(self):
+        if self.engine == 'sparse':
+            if self.sparse_model is None:
+                self.build_sparse_model()
+            solver = self._solve_sparse
+        else:
+            if self.tf is None:
+                self.build_model()
+            solver = {
+                'jacobi': self._solve_jacobi,
+                'gauss-seidel': self._solve_gauss_seidel,
+                'prioritized': self._solve_prioritized
+            }[self.sweep]
+        with phase(self.metrics, 'solve'):
+            solver()
+
+    def _solve_jacobi(self):
+        vf = self._initial_value_dict(self.tf)
         optimal_pol = {}
         action_vals = {}
         logger.debug('Running Value Iteration')
@@ -63,6 +157,8 @@ class ValueIteration(Planner):
                 change = max(change, abs(vf_temp[s] - vf[s]))
             vf = vf_temp
             logger.debug('iteration: %d   change: %.2f' % (i, change))
+            if self.metrics is not None:
+                self.metrics.iteration('ValueIteration', i, change, len(vf))
             if change < self.converge_delta:
                 break
         if change >= self.converge_delta:
@@ -73,6 +169,172 @@ class ValueIteration(Planner):
         self.value_function = vf
         self.action_value_function = action_vals
         self.iterations_run = i
+        self.backups_run = (i + 1)*len(vf)
+
+    def _initial_value_dict(self, tf):
+        states = list(tf.keys())
+        return dict(zip(states, initial_values(states, self.init_val,
+                                               self.init_value_function)))
+
+    def _action_values(self, s, vf):
+        action_vals = {}
+        for a, ns_p in self.tf[s].items():
+            action_vals[a] = 0
+            for ns, p in ns_p.items():
+                r = self.mdp.reward(s, a, ns)
+                action_vals[a] += p*(r + self.discount_rate*vf[ns])
+        return action_vals
+
+    @staticmethod
+    def _best_action(action_vals):
+        max_actions = argmax_dict(action_vals, return_one=False)
+        max_actions.sort()
+        return max_actions[0]
+
+    def _solve_gauss_seidel(self):
+        vf = self._initial_value_dict(self.tf)
+        optimal_pol = {}
+        action_vals = {}
+        logger.debug('Running Value Iteration (Gauss-Seidel)')
+
+        for i in range(self.max_iterations):
+            change = 0
+            for s in self.tf:
+                action_vals[s] = self._action_values(s, vf)
+                optimal_pol[s] = self._best_action(action_vals[s])
+                v = action_vals[s][optimal_pol[s]]
+                change = max(change, abs(v - vf[s]))
+                vf[s] = v
+            logger.debug('iteration: %d   change: %.2f' % (i, change))
+            if self.metrics is not None:
+                self.metrics.iteration('ValueIteration', i, change, len(vf))
+            if change < self.converge_delta:
+                break
+        if change >= self.converge_delta:
+            warnings.warn(
+                "VI did not converge after %d iterations (delta=%.2f)" \
+                % (i, change))
+        self.optimal_policy = optimal_pol
+        self.value_function = vf
+        self.action_value_function = action_vals
+        self.iterations_run = i
+        self.backups_run = (i + 1)*len(vf)
+
+    def _solve_prioritized(self):
+        """
+        Prioritized sweeping: the state with the largest Bellman error is
+        backed up next and only its predecessors' errors are recomputed.
+        Stops once every state's Bellman error is below converge_delta, or
+        after max_iterations sweeps' worth of backups.
+        """
+        tf = self.tf
+        if not isinstance(tf, TransitionFunction):
+            tf = TransitionFunction(tf)
+        vf = self._initial_value_dict(tf)
+        action_vals = {}
+        logger.debug('Running Value Iteration (prioritized sweeping)')
+
+        # max-heap of Bellman errors; entries whose error has since been
+        # recomputed are skipped when popped
+        bellman_error = {}
+        queue = []
+        tiebreak = count()
+        def update_error(s):
+            action_vals[s] = self._action_values(s, vf)
+            err = abs(max(action_vals[s].values()) - vf[s])
+            bellman_error[s] = err
+            if err > 0 and err >= self.converge_delta:
+                heapq.heappush(queue, (-err, next(tiebreak), s))
+
+        for s in tf:
+            update_error(s)
+        max_backups = self.max_iterations*len(vf)
+        backups = 0
+        while len(queue) > 0 and backups < max_backups:
+            err, _, s = heapq.heappop(queue)
+            if -err != bellman_error[s]:
+                continue
+            vf[s] = max(action_vals[s].values())
+            bellman_error[s] = 0
+            backups += 1
+            for ps in tf.inv(s):
+                update_error(ps)
+            if backups % len(vf) == 0:
+                logger.debug('backups: %d   queued: %d' %
+                             (backups, len(queue)))
+                if self.metrics is not None:
+                    self.metrics.iteration(
+                        'ValueIteration', backups//len(vf) - 1,
+                        max(bellman_error.values()), len(vf))
+
+        change = max(bellman_error.values())
+        i = backups//len(vf)
+        if self.metrics is not None and backups % len(vf) != 0:
+            self.metrics.iteration('ValueIteration', i, change,
+                                   backups % len(vf))
+        if change >= self.converge_delta:
+            warnings.warn(
+                "VI did not converge after %d iterations (delta=%.2f)" \
+                % (i, change))
+        optimal_pol = {}
+        for s in tf:
+            optimal_pol[s] = self._best_action(action_vals[s])
+            vf[s] = action_vals[s][optimal_pol[s]]
+        self.optimal_policy = optimal_pol
+        self.value_function = vf
+        self.action_value_function = action_vals
+        self.iterations_run = i
+        self.backups_run = backups
+
+    def _solve_sparse(self):
+        if self.sparse_model is None:
+            self.build_sparse_model()
+        model = self.sparse_model
+        v = np.array(initial_values(model.states, self.init_val,
+                                    self.init_value_function),
+                     dtype=np.float64)
+        logger.debug('Running Value Iteration (sparse)')
+
+        for i in range(self.max_iterations):
+            q = model.backup(v, self.discount_rate)
+            v_temp = model.state_max(q)
+            change = np.max(np.abs(v_temp - v))
+            v = v_temp
+            logger.debug('iteration: %d   change: %.2f' % (i, change))
+            if self.metrics is not None:
+                self.metrics.iteration('ValueIteration', i, change,
+                                       model.n_states)
+            if change < self.converge_delta:
+                break
+        if change >= self.converge_delta:
+            warnings.warn(
+                "VI did not converge after %d iterations (delta=%.2f)" \
+                % (i, change))
+        max_rows = model.state_argmax(q, v)
+        self.optimal_policy = \
+            dict(zip(model.states, [model.sa_action[r] for r in max_rows]))
+        self.value_function = model.to_state_dict(v)
+        self.action_value_function = model.to_state_action_dict(q)
+        self.iterations_run = i
+        self.backups_run = (i + 1)*model.n_states
+
+    def get_policy_table(self) -> PolicyTable:
+        """
+        Array-backed copy of the current action_value_function. It is
+        rebuilt whenever action_value_function is replaced (e.g. by solve).
+        """
+        stale = self._policy_table is None or \
+            self._policy_table_avf is not self.action_value_function
+        if self.metrics is not None:
+            self.metrics.cache_access('policy table', hit=not stale)
+        if stale:
+            with phase(self.metrics, 'policy extraction'):
+                self._policy_table = PolicyTable(
+                    self.action_value_function,
+                    cache_size=self.policy_cache_size,
+                    metrics=self.metrics)
+            self._policy_table_avf = self.action_value_function
+        return self._policy_table
 
     def act_dist(self, s, softmax_temp=None, randchoose=None):
         if softmax_temp is None:
@@ -80,18 +342,66 @@ class ValueIteration(Planner):
         if randchoose is None:
             randchoose = self.randchoose
 
+        if self.policy_tables:
+            return self.get_policy_table().act_dist(
+                s, softmax_temp=softmax_temp, randchoose=randchoose)
         return calc_esoftmax_dist(self.action_value_function[s],
                                   temp=softmax_temp,
                                   randchoose=randchoose)
 
+    def act(self, s, softmax_temp=None, randchoose=None):
+        """
+        Samples from a cumulative table of act_dist that is kept for each
+        state until action_value_function is replaced. Like the policy
+        matrices of PolicyTable, tables are only kept for the
+        policy_cache_size most recently used (softmax_temp, randchoose)
+        settings.
+        """
+        if softmax_temp is None:
+            softmax_temp = self.softmax_temp
+        if randchoose is None:
+            randchoose = self.randchoose
+
+        if self._act_tables_avf is not self.action_value_function:
+            self._act_tables = OrderedDict()
+            self._act_tables_avf = self.action_value_function
+        key = (softmax_temp, randchoose)
+        if key in self._act_tables:
+            self._act_tables.move_to_end(key)
+            tables = self._act_tables[key]
+        else:
+            tables = {}
+            self._act_tables[key] = tables
+            while len(self._act_tables) > self.policy_cache_size:
+                self._act_tables.popitem(last=False)
+        try:
+            table = tables[s]
+        except KeyError:
+            table = CategoricalTable.from_dict(
+                self.act_dist(s, softmax_temp, randchoose))
+            tables[s] = table
+        return get_sampler().sample(table)
+
     def to_dict(self, softmax_temp=None, randchoose=None):
         if softmax_temp is None:
             softmax_temp = self.softmax_temp
         if randchoose is None:
             randchoose = self.randchoose
 
+        if self.policy_tables:
+            return self.get_policy_table().to_dict(
+                softmax_temp=softmax_temp, randchoose=randchoose)
         return calc_esoftmax_policy(self.action_value_function,
                                     temp=softmax_temp,
                                     randchoose=randchoose)
 
+    def as_matrix(self, sparse=False):
+        if not self.policy_tables:
+            return Planner.as_matrix(self, sparse=sparse)
+        model = self.mdp.get_compiled_model(sparse=sparse)
+        return self.get_policy_table().as_matrix(
+            model.ss, model.aa,
+            softmax_temp=self.softmax_temp,
+            randchoose=self.randchoose)
+
 
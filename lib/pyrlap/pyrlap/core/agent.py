@@ -9,6 +9,8 @@ import numpy as np
 
 from pyrlap.core.util import sample_prob_dict, calc_esoftmax_dist, SANSRTuple
 from pyrlap.core.mdp.mdp import MDP as MDPClass
+from pyrlap.core.rollouts import RolloutSimulator
+from pyrlap.core.linalg import solve_policy_system, small_residual
 
 logger = logging.getLogger(__name__)
 
@@ -50,10 +52,10 @@ class Agent(object):
             policy[s] = self.act_dist(s, **kwargs)
         return policy
 
-    def as_matrix(self):
-        mats = self.mdp.as_matrices()
-        ss = mats['ss']
-        aa = mats['aa']
+    def as_matrix(self, sparse=False):
+        model = self.mdp.get_compiled_model(sparse=sparse)
+        ss = model.ss
+        aa = model.aa
         policy = np.zeros((len(ss), len(aa)))
         pol_dict = self.to_dict()
         for si, s in enumerate(ss):
@@ -91,50 +93,148 @@ class Agent(object):
             i += 1
         return traj
 
-    def value(self, discount_rate=.99) -> ValueFunction:
+    def run_many(self,
+                 n_trajs,
+                 softmax_temp=None,
+                 randchoose=None,
+                 init_state=None,
+                 max_steps=100,
+                 as_tuples : "return lists of SANSRTuples (like run) "
+                             "instead of a Rollouts" = False):
+        """
+        n_trajs trajectories of this agent's current policy simulated at
+        once (see RolloutSimulator)
+        """
+        simulator = RolloutSimulator(self, softmax_temp=softmax_temp,
+                                     randchoose=randchoose)
+        rollouts = simulator.run(n_trajs, max_steps=max_steps,
+                                 init_state=init_state)
+        if as_tuples:
+            return rollouts.to_trajectories()
+        return rollouts
+
+    def value(self,
+              discount_rate=.99,
+              sparse=False,
+              solver='direct',
+              tol=1e-10,
+              max_iterations=10000) -> ValueFunction:
         """
         return the value function of this policy - basically just do
-        policy evaluation
+        policy evaluation (see evaluate, which also returns the occupancy)
         """
-        sr = self.successor_representation(
-            discount_rate=discount_rate,
-            discounted=True,
-            normalize=False,
-            return_matrix=True
-        )
-        mdp_mat = self.mdp.as_matrices()
-        rf = mdp_mat['rf']
-        tf = mdp_mat['tf']
-        ss = mdp_mat['ss']
-        pol = self.as_matrix()
-        s_rf = np.einsum("san,san,sa->s",tf,rf,pol)
-        v = np.einsum("sn,n->s",sr,s_rf)
-        return ValueFunction({s: val for s, val in zip(ss, v)})
+        model, mp, s_rf = self._policy_system(sparse=sparse)
+        v = solve_policy_system(mp, s_rf, discount_rate, solver=solver,
+                                tol=tol, max_iterations=max_iterations)
+        return ValueFunction({s: val for s, val in zip(model.ss, v)})
+
+    def evaluate(self,
+                 discount_rate=.99,
+                 sparse=False,
+                 solver : "'direct' factorizes (I - dr*P) once; 'iterative' "
+                          "repeats v = r + dr*P.v until the change is below "
+                          "tol" = 'direct',
+                 tol=1e-10,
+                 max_iterations=10000):
+        """
+        Policy evaluation by solving (I - dr*P)v = r and
+        (I - dr*P)^T d = s0 for the value function v and the discounted
+        state occupancy d, without forming the successor representation.
+
+        :return: (ValueFunction, occupancy array over the compiled
+        model's states)
+        """
+        model, mp, s_rf = self._policy_system(sparse=sparse)
+        kwargs = dict(discount_rate=discount_rate, solver=solver,
+                      tol=tol, max_iterations=max_iterations)
+        v = solve_policy_system(mp, s_rf, **kwargs)
+        occ = solve_policy_system(mp, model.s0.astype(np.float64),
+                                  transpose=True, **kwargs)
+        return ValueFunction({s: val for s, val in zip(model.ss, v)}), occ
 
     def calc_occupancy(self,
                        discount_rate=.99,
                        discounted=False,
-                       normalize=False):
-        sr = self.successor_representation(
-            discount_rate=discount_rate,
-            discounted=discounted,
-            normalize=normalize,
-            return_matrix=True
-        )
-        s0 = self.mdp.as_matrices()['s0']
-        ss = self.mdp.as_matrices()['ss']
-        occ = np.einsum("s,sn->n", s0, sr)
+                       normalize=False,
+                       sparse=False):
+        model, mp, _ = self._policy_system(sparse=sparse)
+        ss = model.ss
+        s0 = model.s0.astype(np.float64)
+
+        # once the undiscounted system turns out to be singular, later
+        # solves go straight to the discounted one (so it only warns once)
+        undiscounted = not discounted
+
+        def solve(b, transpose):
+            nonlocal undiscounted
+            if undiscounted:
+                try:
+                    return solve_policy_system(mp, b, 1.0,
+                                               transpose=transpose)
+                except (np.linalg.LinAlgError, FloatingPointError):
+                    warnings.warn(
+                        "Undiscounted transition matrix is singular. "+
+                        ("Calculating discounted occupancy dr = %.2f" %
+                         discount_rate)
+                    )
+                    undiscounted = False
+            return solve_policy_system(mp, b, discount_rate,
+                                       transpose=transpose)
+
+        # normalizing each row of the successor representation is the same
+        # as weighting each start state by its expected number of visits
+        if normalize:
+            s0 = s0/solve(np.ones(len(ss)), transpose=False)
+        occ = solve(s0, transpose=True)
         occ = {s: o for s, o in zip(ss, occ)}
         return occ
 
+    def _policy_system(self, sparse=False):
+        """
+        Compiled model, state-to-state transition matrix and expected
+        reward of each state under this policy
+        """
+        model = self.mdp.get_compiled_model(sparse=sparse)
+        pol = self.as_matrix(sparse=sparse)
+        s_rf = np.einsum("sa,sa->s", model.expected_reward(), pol)
+        if sparse:
+            from scipy.sparse import csr_matrix
+            n_s, n_a = pol.shape
+
+            # policy as an |S| x |S||A| matrix so that pol_mat.tf = P_pi
+            pol_mat = csr_matrix(
+                (pol.ravel(), np.arange(n_s*n_a),
+                 np.arange(0, n_s*n_a + 1, n_a)),
+                shape=(n_s, n_s*n_a)
+            )
+            mp = csr_matrix(pol_mat.dot(model.tf))
+        else:
+            mp = np.einsum("san,sa->sn", model.tf, pol)
+        return model, mp, s_rf
+
     def successor_representation(self,
                                  discount_rate=.99,
                                  discounted=False,
                                  normalize=False,
-                                 return_matrix=False):
-        mdp_mat = self.mdp.as_matrices()
-        tf = mdp_mat['tf']
-        ss = mdp_mat['ss']
+                                 return_matrix=False,
+                                 sparse=False):
+        """
+        If sparse is True, the MDP is compiled with sparse transition
+        matrices and the successor representation is solved for (and
+        returned as) a scipy.sparse CSR matrix, so the dense |S| x |A| x |S|
+        transition tensor is never built.
+        """
+        if sparse:
+            return self._sparse_successor_representation(
+                discount_rate=discount_rate,
+                discounted=discounted,
+                normalize=normalize,
+                return_matrix=return_matrix
+            )
+
+        model = self.mdp.get_compiled_model()
+        tf = model.tf
+        ss = model.ss
 
         mp = np.einsum("san,sa->sn", tf, self.as_matrix())
 
@@ -161,6 +261,53 @@ class Agent(object):
         sr = {s: dict(zip(ss, s_sr)) for s, s_sr in zip(ss, sr)}
         return sr
 
+    def _sparse_successor_representation(self,
+                                         discount_rate=.99,
+                                         discounted=False,
+                                         normalize=False,
+                                         return_matrix=False):
+        from scipy.sparse import csr_matrix, identity as sparse_identity
+        from scipy.sparse.linalg import spsolve, MatrixRankWarning
+        model, mp, _ = self._policy_system(sparse=True)
+        ss = model.ss
+        n_s = len(ss)
+        eye = sparse_identity(n_s, format='csc')
+
+        # Calculate discounted or undiscounted successor representation
+        sr = None
+        if not discounted:
+            try:
+                with warnings.catch_warnings():
+                    warnings.simplefilter('error', MatrixRankWarning)
+                    sr = spsolve((eye - mp).tocsc(), eye)
+            except (MatrixRankWarning, RuntimeError):
+                pass
+            # a nearly singular system solves without complaint, so check
+            # the residual too
+            if sr is not None and not small_residual(eye - mp, sr, eye):
+                sr = None
+            if sr is None:
+                warnings.warn(
+                    "Undiscounted transition matrix is singular. "+
+                    ("Calculating discounted occupancy dr = %.2f" % discount_rate)
+                )
+        if sr is None:
+            sr = spsolve((eye - discount_rate*mp).tocsc(), eye)
+        sr = csr_matrix(sr)
+
+        if normalize:
+            sr_norm = np.asarray(sr.sum(axis=1)).ravel()
+            sr = csr_matrix(sr.multiply(1/sr_norm[:, None]))
+
+        if return_matrix:
+            return sr
+
+        sr = sr.tocoo()
+        sr_dict = {s: {} for s in ss}
+        for si, ni, val in zip(sr.row, sr.col, sr.data):
+            sr_dict[ss[si]][ss[ni]] = val
+        return sr_dict
+
 class RandomAgent(Agent):
     def act_dist(self, s, softmax_temp=None, randchoose=None):
         aa = self.mdp.available_actions(s)
@@ -0,0 +1,126 @@
+import numpy as np
+
+'''
+Array backends for the matrix-based planners (SoftValueIteration and
+FreeEnergyValueIteration). A backend wraps the handful of array
+operations those planners use so that they can run on NumPy (the default)
+or on torch. torch is only imported when a torch backend is created.
+'''
+
+class NumpyBackend(object):
+    name = 'numpy'
+
+    def asarray(self, x, dtype=None):
+        return np.asarray(x, dtype=dtype)
+
+    def to_numpy(self, x):
+        return np.asarray(x)
+
+    def zeros(self, shape, dtype=np.float32):
+        return np.zeros(shape, dtype=dtype)
+
+    def ones(self, shape, dtype=np.float32):
+        return np.ones(shape, dtype=dtype)
+
+    def exp(self, x):
+        return np.exp(x)
+
+    def log(self, x):
+        return np.log(x)
+
+    def abs(self, x):
+        return np.abs(x)
+
+    def max(self, x, axis=None, keepdims=False):
+        return np.max(x, axis=axis, keepdims=keepdims)
+
+    def sum(self, x, axis=None, keepdims=False):
+        return np.sum(x, axis=axis, keepdims=keepdims)
+
+    def einsum(self, subscripts, *operands):
+        return np.einsum(subscripts, *operands)
+
+class TorchBackend(object):
+    name = 'torch'
+
+    def __init__(self, device='cpu'):
+        import torch
+        self.torch = torch
+        self.device = device
+
+    def _dtype(self, dtype):
+        if dtype is None:
+            return None
+        return self.torch.from_numpy(np.zeros(0, dtype=dtype)).dtype
+
+    def asarray(self, x, dtype=None):
+        if isinstance(x, self.torch.Tensor):
+            x = x.to(self.device)
+        else:
+            x = self.torch.from_numpy(np.asarray(x)).to(self.device)
+        if dtype is not None:
+            x = x.to(self._dtype(dtype))
+        return x
+
+    def to_numpy(self, x):
+        return x.detach().cpu().numpy()
+
+    def zeros(self, shape, dtype=np.float32):
+        return self.torch.zeros(shape, dtype=self._dtype(dtype),
+                                device=self.device)
+
+    def ones(self, shape, dtype=np.float32):
+        return self.torch.ones(shape, dtype=self._dtype(dtype),
+                               device=self.device)
+
+    def exp(self, x):
+        return self.torch.exp(x)
+
+    def log(self, x):
+        return self.torch.log(x)
+
+    def abs(self, x):
+        return self.torch.abs(x)
+
+    def max(self, x, axis=None, keepdims=False):
+        if axis is None:
+            return self.torch.max(x)
+        return self.torch.max(x, dim=axis, keepdim=keepdims)[0]
+
+    def sum(self, x, axis=None, keepdims=False):
+        if axis is None:
+            return self.torch.sum(x)
+        return self.torch.sum(x, dim=axis, keepdim=keepdims)
+
+    def einsum(self, subscripts, *operands):
+        return self.torch.einsum(subscripts, *operands)
+
+BACKENDS = {
+    'numpy': NumpyBackend,
+    'torch': TorchBackend
+}
+
+def register_backend(name, factory):
+    """
+    Makes get_backend(name, **kwargs) return factory(**kwargs)
+    """
+    BACKENDS[name] = factory
+
+def get_backend(backend='numpy', **kwargs):
+    """
+    :param backend: name of a registered backend, or a backend object
+    (which is returned as is)
+    """
+    if not isinstance(backend, str):
+        return backend
+    if backend not in BACKENDS:
+        raise ValueError("Unknown backend: %s" % backend)
+    return BACKENDS[backend](**kwargs)
+
+def backend_of(x):
+    """
+    Backend for the type of array x
+    """
+    if type(x).__module__.split('.')[0] == 'torch':
+        return get_backend('torch', device=x.device)
+    return get_backend('numpy')
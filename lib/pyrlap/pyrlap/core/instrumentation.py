@@ -0,0 +1,120 @@
+import copy
+import time
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+
+'''
+Instrumentation for planners and MDP builds. Pass a Metrics object as the
+metrics argument of a planner (or of an MDP that builds models, e.g.
+DiscretizedObserverBeliefMDPApproximation) and it will record:
+
+- phases: wall time (and number of calls) of named phases such as
+  'model build', 'solve' or 'policy extraction'
+- iterations: one record per planner iteration with the Bellman error and
+  the number of backups performed
+- caches: hits and misses of named caches
+
+Metrics.scoped(prefix) returns a view that records into the same totals
+with prefix/ in front of every name, which keeps e.g. the phases of
+several planners used by one model apart.
+
+Everything is opt-in: with metrics=None (the default) planners skip all of
+it, so the only cost is an `is None` check per phase or iteration. To
+stream events instead of (or as well as) storing them, subclass Metrics
+and override phase_done, iteration or cache_access.
+'''
+
+_NO_PHASE = nullcontext()
+
+def phase(metrics, name):
+    """
+    Context manager that times phase name if metrics is not None
+    """
+    if metrics is None:
+        return _NO_PHASE
+    return metrics.phase(name)
+
+class Metrics(object):
+    def __init__(self, keep_iterations=True):
+        """
+        :param keep_iterations: store every iteration record (otherwise
+        only the per-planner totals are kept)
+        """
+        self.keep_iterations = keep_iterations
+        self.phase_seconds = OrderedDict()
+        self.phase_calls = OrderedDict()
+        self.iterations = []
+        self.iteration_counts = OrderedDict()
+        self.backups = OrderedDict()
+        self.cache_hits = OrderedDict()
+        self.cache_misses = OrderedDict()
+        self.prefix = ''
+
+    def scoped(self, prefix):
+        scoped = copy.copy(self)
+        scoped.prefix = self.prefix + prefix + '/'
+        return scoped
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phase_done(name, time.perf_counter() - start)
+
+    def phase_done(self, name, seconds):
+        name = self.prefix + name
+        self.phase_seconds[name] = self.phase_seconds.get(name, 0.0) + seconds
+        self.phase_calls[name] = self.phase_calls.get(name, 0) + 1
+
+    def iteration(self, planner, iteration, bellman_error, backups):
+        """
+        :param planner: name of the planner (e.g. its class name)
+        :param bellman_error: max change in value over this iteration
+        :param backups: number of state backups in this iteration
+        """
+        planner = self.prefix + planner
+        if self.keep_iterations:
+            self.iterations.append({
+                'planner': planner,
+                'iteration': iteration,
+                'bellman_error': float(bellman_error),
+                'backups': int(backups)
+            })
+        self.iteration_counts[planner] = \
+            self.iteration_counts.get(planner, 0) + 1
+        self.backups[planner] = self.backups.get(planner, 0) + int(backups)
+
+    def cache_access(self, name, hit, n=1):
+        """
+        Records n hits (or misses) of cache name
+        """
+        name = self.prefix + name
+        if hit:
+            self.cache_hits[name] = self.cache_hits.get(name, 0) + n
+        else:
+            self.cache_misses[name] = self.cache_misses.get(name, 0) + n
+
+    def hit_rate(self, name):
+        hits = self.cache_hits.get(name, 0)
+        total = hits + self.cache_misses.get(name, 0)
+        if total == 0:
+            return None
+        return hits/total
+
+    def summary(self):
+        """
+        JSON-serializable totals (without the per-iteration records)
+        """
+        caches = sorted(set(self.cache_hits) | set(self.cache_misses))
+        return {
+            'phase_seconds': dict(self.phase_seconds),
+            'phase_calls': dict(self.phase_calls),
+            'iterations': dict(self.iteration_counts),
+            'backups': dict(self.backups),
+            'caches': {name: {'hits': self.cache_hits.get(name, 0),
+                              'misses': self.cache_misses.get(name, 0),
+                              'hit_rate': self.hit_rate(name)}
+                       for name in caches}
+        }
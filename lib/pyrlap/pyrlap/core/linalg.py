@@ -0,0 +1,72 @@
+import warnings
+
+import numpy as np
+
+'''
+Linear solves for policy evaluation, (I - dr*P)x = b for the state-to-state
+transition matrix P of a policy
+'''
+
+def solve_policy_system(mp, b, discount_rate,
+                        transpose=False,
+                        solver='direct',
+                        tol=1e-10,
+                        max_iterations=10000):
+    """
+    Solves (I - discount_rate*mp)x = b, or the transposed system, for a
+    dense or scipy.sparse state-to-state matrix mp. Raises LinAlgError if
+    the system is singular or too badly conditioned for the solution to
+    satisfy it (e.g. undiscounted and not absorbing).
+    """
+    if transpose:
+        mp = mp.T
+    if solver == 'iterative':
+        x = np.array(b, dtype=np.float64)
+        for i in range(max_iterations):
+            nx = b + discount_rate*mp.dot(x)
+            change = np.max(np.abs(nx - x))
+            x = nx
+            if change < tol:
+                break
+        if change >= tol:
+            warnings.warn(
+                "Policy evaluation did not converge after %d iterations "
+                "(delta=%g)" % (i, change))
+        return x
+    elif solver != 'direct':
+        raise ValueError("Unknown solver: %s" % solver)
+
+    from scipy.sparse import issparse
+    if issparse(mp):
+        from scipy.sparse import identity as sparse_identity
+        from scipy.sparse.linalg import spsolve, MatrixRankWarning
+        a = (sparse_identity(mp.shape[0], format='csc') -
+             discount_rate*mp).tocsc()
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', MatrixRankWarning)
+            try:
+                x = spsolve(a, b)
+            except (MatrixRankWarning, RuntimeError):
+                raise np.linalg.LinAlgError("Singular matrix")
+    else:
+        a = np.eye(mp.shape[0]) - discount_rate*mp
+        x = np.linalg.solve(a, b)
+    if not small_residual(a, x, b):
+        raise np.linalg.LinAlgError("Singular matrix")
+    return x
+
+def small_residual(a, x, b, rtol=1e-6):
+    """
+    Whether x is finite and max|ax - b| <= rtol*max|b|, for dense or
+    sparse a, x and b. The solution of a nearly singular system is huge
+    and its residual is of the order of b.
+    """
+    from scipy.sparse import issparse
+    if not np.all(np.isfinite(x.data if issparse(x) else x)):
+        return False
+    residual = a.dot(x) - b
+    if issparse(residual):
+        residual = residual.toarray()
+    if issparse(b):
+        b = b.toarray()
+    return np.max(np.abs(residual)) <= rtol*np.max(np.abs(b))
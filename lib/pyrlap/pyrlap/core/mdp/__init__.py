@@ -1,2 +1,3 @@
 from .mdp import MDP
+from .compiledmdp import CompiledMDP
 from .dictionarymdp import DictionaryMDP
\ No newline at end of file
@@ -0,0 +1,50 @@
+import numpy as np
+
+class CompiledMDP(object):
+    """
+    Matrix representation of an MDP together with its state and action
+    index maps. This is what MDP.as_matrices returns, packaged so that it
+    can be built once per MDP and shared by every matrix-based consumer
+    (see MDP.get_compiled_model).
+
+    tf, rf : dense |S| x |A| x |S| arrays, or (|S|*|A|) x |S| scipy.sparse
+             CSR matrices if sparse
+    s0 : initial state distribution over ss
+    ss, aa : state and action lists
+    nt_states : 1 for non-terminal states, 0 otherwise
+    """
+    def __init__(self, tf, rf, s0, ss, aa, nt_states):
+        self.tf = tf
+        self.rf = rf
+        self.s0 = s0
+        self.ss = ss
+        self.aa = aa
+        self.nt_states = nt_states
+        self.ss_i = {s: i for i, s in enumerate(ss)}
+        self.aa_i = {a: i for i, a in enumerate(aa)}
+        self.sparse = not isinstance(tf, np.ndarray)
+        self._expected_reward = None
+
+    def __getitem__(self, key):
+        return self.as_dict()[key]
+
+    def as_dict(self):
+        return {
+            'tf': self.tf, 'rf': self.rf, 's0': self.s0, 'ss': self.ss,
+            'aa': self.aa, 'nt_states': self.nt_states
+        }
+
+    def expected_reward(self):
+        """
+        |S| x |A| array of expected immediate rewards
+        """
+        if self._expected_reward is None:
+            if self.sparse:
+                tf = self.tf.astype(np.float64)
+                er = np.asarray(tf.multiply(self.rf).sum(axis=1))
+                er = er.reshape((len(self.ss), len(self.aa)))
+            else:
+                er = np.einsum("san,san->sa", self.tf, self.rf,
+                               dtype=np.float64)
+            self._expected_reward = er
+        return self._expected_reward
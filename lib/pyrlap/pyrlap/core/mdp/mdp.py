@@ -5,6 +5,7 @@ import copy
 
 from pyrlap.core.util import sample_prob_dict, SANSRTuple, SANSTuple
 from pyrlap.core.transition_function import TransitionFunction
+from pyrlap.core.mdp.compiledmdp import CompiledMDP
 
 class MDP(object):
     #=============================================#
@@ -233,19 +234,31 @@ class MDP(object):
                         frontier.add(tuple(new_pre_traj))
         return list(trajs)
 
-    def as_matrices(self):
+    def as_matrices(self, sparse=False):
+        """
+        Tabular representation of the MDP.
+
+        :param sparse: if False, 'tf' and 'rf' are dense float32 arrays of
+        shape |S| x |A| x |S|. If True, they are scipy.sparse CSR matrices
+        of shape (|S|*|A|) x |S|, where row s_i*|A| + a_i holds the
+        next-state distribution (or rewards) of state s_i and action a_i.
+        :return: dictionary with 'tf', 'rf', 's0', 'ss', 'aa', 'nt_states'
+        """
         aa = self.available_actions()
         aa_i = {a: i for i, a in enumerate(aa)}
         ss = self.get_states()
         ss_i = {s: i for i, s in enumerate(ss)}
-        tf = np.zeros((len(ss), len(aa), len(ss)), dtype=np.float32)
-        rf = np.zeros((len(ss), len(aa), len(ss)), dtype=np.float32)
-        for s in ss:
-            for a in aa:
-                ns_dist = self.transition_dist(s, a)
-                for ns, p in ns_dist.items():
-                    tf[ss_i[s], aa_i[a], ss_i[ns]] = p
-                    rf[ss_i[s], aa_i[a], ss_i[ns]] = self.reward(s, a, ns)
+        if sparse:
+            tf, rf = self._as_sparse_tf_rf(ss, ss_i, aa, aa_i)
+        else:
+            tf = np.zeros((len(ss), len(aa), len(ss)), dtype=np.float32)
+            rf = np.zeros((len(ss), len(aa), len(ss)), dtype=np.float32)
+            for s in ss:
+                for a in aa:
+                    ns_dist = self.transition_dist(s, a)
+                    for ns, p in ns_dist.items():
+                        tf[ss_i[s], aa_i[a], ss_i[ns]] = p
+                        rf[ss_i[s], aa_i[a], ss_i[ns]] = self.reward(s, a, ns)
         s0 = self.get_init_state_dist()
         s0 = np.array([s0.get(s, 0) for s in ss], dtype=np.float32)
         non_term = set(self.get_non_terminal_states())
@@ -255,6 +268,52 @@ class MDP(object):
             'nt_states': nt_states
         }
 
+    def get_compiled_model(self, sparse=False) -> CompiledMDP:
+        """
+        Returns the matrix representation of this MDP (see as_matrices),
+        building it on the first call and reusing it afterwards.
+        Consumers should treat the returned arrays as read-only.
+
+        The cached model is not checked against the MDP, so an MDP must not
+        be changed after it has been compiled. Code that does change one
+        has to call _invalidate_compiled() afterwards.
+        """
+        try:
+            cache = self._compiled_models
+        except AttributeError:
+            cache = {}
+            self._compiled_models = cache
+        if sparse not in cache:
+            cache[sparse] = CompiledMDP(**self.as_matrices(sparse=sparse))
+        return cache[sparse]
+
+    def _invalidate_compiled(self):
+        """
+        Drops the compiled models so that the next get_compiled_model call
+        rebuilds them
+        """
+        self._compiled_models = {}
+
+    def _as_sparse_tf_rf(self, ss, ss_i, aa, aa_i):
+        rows, cols, probs, rewards = [], [], [], []
+        for s in ss:
+            for a in aa:
+                row = ss_i[s]*len(aa) + aa_i[a]
+                for ns, p in self.transition_dist(s, a).items():
+                    rows.append(row)
+                    cols.append(ss_i[ns])
+                    probs.append(p)
+                    rewards.append(self.reward(s, a, ns))
+        from scipy.sparse import csr_matrix
+        shape = (len(ss)*len(aa), len(ss))
+        rows = np.array(rows, dtype=np.int64)
+        cols = np.array(cols, dtype=np.int64)
+        tf = csr_matrix((np.array(probs, dtype=np.float32), (rows, cols)),
+                        shape=shape)
+        rf = csr_matrix((np.array(rewards, dtype=np.float32), (rows, cols)),
+                        shape=shape)
+        return tf, rf
+
     def is_valid_transition(self, s, a, ns, *args, **kwargs):
         ns_dist = self.transition_dist(s, a)
         return ns in ns_dist
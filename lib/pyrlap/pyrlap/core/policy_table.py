@@ -0,0 +1,95 @@
+from collections import OrderedDict
+
+import numpy as np
+
+from pyrlap.core.util import calc_esoftmax_matrix
+
+class PolicyTable(object):
+    """
+    Action values held in a |S| x |A| array with state and action index
+    maps. Epsilon-softmax policy matrices are computed for all states at
+    once and the most recently used (softmax_temp, randchoose) settings are
+    kept, so that repeated act_dist calls are just lookups.
+    """
+    def __init__(self, action_value_function, cache_size=4, metrics=None):
+        """
+        :param action_value_function: {s: {a: q}}
+        :param cache_size: number of policy matrices to keep
+        :param metrics: pyrlap.core.instrumentation.Metrics that records
+        policy matrix cache hits
+        """
+        self.states = list(action_value_function.keys())
+        self.state_index = {s: i for i, s in enumerate(self.states)}
+        actions = set([])
+        for a_q in action_value_function.values():
+            actions.update(a_q.keys())
+        self.actions = sorted(actions)
+        self.action_index = {a: i for i, a in enumerate(self.actions)}
+
+        self.q = np.zeros((len(self.states), len(self.actions)))
+        self.available = np.zeros(self.q.shape, dtype=bool)
+
+        # available actions of each state in their original order, so that
+        # act_dist returns dictionaries ordered like the action values
+        self.state_actions = []
+        for si, s in enumerate(self.states):
+            s_actions = []
+            for a, q in action_value_function[s].items():
+                ai = self.action_index[a]
+                self.q[si, ai] = q
+                self.available[si, ai] = True
+                s_actions.append((a, ai))
+            self.state_actions.append(s_actions)
+
+        self.cache_size = cache_size
+        self._policies = OrderedDict()
+        self.metrics = metrics
+
+    def policy_matrix(self, softmax_temp=0.0, randchoose=0.0):
+        """
+        |S| x |A| array of action probabilities
+        """
+        key = (softmax_temp, randchoose)
+        if self.metrics is not None:
+            self.metrics.cache_access('policy matrix',
+                                      hit=key in self._policies)
+        if key in self._policies:
+            self._policies.move_to_end(key)
+            return self._policies[key]
+        pi = calc_esoftmax_matrix(self.q, self.available,
+                                  temp=softmax_temp,
+                                  randchoose=randchoose)
+        pi.setflags(write=False)
+        self._policies[key] = pi
+        while len(self._policies) > self.cache_size:
+            self._policies.popitem(last=False)
+        return pi
+
+    def act_dist(self, s, softmax_temp=0.0, randchoose=0.0):
+        si = self.state_index[s]
+        a_p = self.policy_matrix(softmax_temp, randchoose)[si].tolist()
+        return {a: a_p[ai] for a, ai in self.state_actions[si]}
+
+    def to_dict(self, softmax_temp=0.0, randchoose=0.0):
+        pi = self.policy_matrix(softmax_temp, randchoose).tolist()
+        policy = {}
+        for s, a_p, s_actions in zip(self.states, pi, self.state_actions):
+            policy[s] = {a: a_p[ai] for a, ai in s_actions}
+        return policy
+
+    def as_matrix(self, ss, aa, softmax_temp=0.0, randchoose=0.0):
+        """
+        Policy matrix reordered to the state and action lists ss and aa,
+        with zero rows for states that are not in the table
+        """
+        pi = self.policy_matrix(softmax_temp, randchoose)
+        policy = np.zeros((len(ss), len(aa)))
+        rows = [(si, self.state_index[s]) for si, s in enumerate(ss)
+                if s in self.state_index]
+        cols = [(ai, self.action_index[a]) for ai, a in enumerate(aa)
+                if a in self.action_index]
+        if len(rows) > 0 and len(cols) > 0:
+            to_r, from_r = map(np.array, zip(*rows))
+            to_c, from_c = map(np.array, zip(*cols))
+            policy[np.ix_(to_r, to_c)] = pi[np.ix_(from_r, from_c)]
+        return policy
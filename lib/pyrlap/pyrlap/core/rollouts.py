@@ -0,0 +1,132 @@
+import numpy as np
+
+from pyrlap.core.sampling import CategoricalTable, CompiledTransitions, \
+    get_sampler
+from pyrlap.core.util import SANSRTuple
+
+class Rollouts(object):
+    """
+    M trajectories as (M, T) arrays. s, a and ns hold indices into ss and
+    aa (-1 after the end of a trajectory) and r holds rewards (nan after
+    the end of a trajectory).
+    """
+    def __init__(self, s, a, ns, r, lengths, ss, aa):
+        self.s = s
+        self.a = a
+        self.ns = ns
+        self.r = r
+        self.lengths = lengths
+        self.ss = ss
+        self.aa = aa
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def returns(self, discount_rate=1.0):
+        """
+        (Discounted) sum of rewards of each trajectory
+        """
+        discounts = discount_rate**np.arange(self.r.shape[1])
+        return np.nansum(self.r*discounts, axis=1)
+
+    def trajectory(self, i):
+        """
+        Trajectory i as a list of SANSRTuples (like Agent.run returns)
+        """
+        n = self.lengths[i]
+        ss, aa = self.ss, self.aa
+        return [SANSRTuple(ss[s], aa[a], ss[ns], r) for s, a, ns, r in zip(
+            self.s[i, :n].tolist(), self.a[i, :n].tolist(),
+            self.ns[i, :n].tolist(), self.r[i, :n].tolist())]
+
+    def to_trajectories(self):
+        return [self.trajectory(i) for i in range(len(self))]
+
+class RolloutSimulator(object):
+    """
+    Runs many trajectories of an agent's (fixed) policy at once over the
+    integer-encoded states of its MDP's compiled model. Actions are sampled
+    from the agent's policy matrix and next states from CompiledTransitions,
+    so a step is a few array operations for all of the trajectories. The
+    policy and transition tables are built on construction, so reuse the
+    simulator for repeated calls.
+    """
+    def __init__(self, agent,
+                 softmax_temp : "overrides the agent's softmax_temp "
+                                "(with randchoose, see Agent.to_dict)"
+                                = None,
+                 randchoose=None):
+        self.agent = agent
+        self.mdp = agent.mdp
+        self.transitions = CompiledTransitions(self.mdp)
+        model = self.transitions.model
+        self.ss, self.aa = model.ss, model.aa
+        self.ss_i = model.ss_i
+        self.terminal = np.array([self.mdp.is_terminal(s) for s in model.ss])
+
+        if softmax_temp is None and randchoose is None:
+            policy = agent.as_matrix(sparse=True)
+        else:
+            policy = np.zeros((len(self.ss), len(self.aa)))
+            pol_dict = agent.to_dict(softmax_temp=softmax_temp,
+                                     randchoose=randchoose)
+            for si, s in enumerate(self.ss):
+                for a, p in pol_dict.get(s, {}).items():
+                    policy[si, model.aa_i[a]] = p
+        self.has_policy = policy.sum(axis=1) > 0
+        cdf = np.cumsum(policy, axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            cdf = cdf/cdf[:, -1:]
+        cdf[:, -1] = 1.0
+        self.policy_cdf = cdf
+
+    def _init_states(self, n_trajs, init_state, sampler):
+        if init_state is not None:
+            return np.full(n_trajs, self.ss_i[init_state])
+        s0 = self.mdp.get_init_state_dist()
+        table = CategoricalTable([self.ss_i[s] for s in s0], s0.values())
+        return np.array(table.outcomes)[sampler.sample_indices(table, n_trajs)]
+
+    def run(self, n_trajs, max_steps=100, init_state=None, sampler=None):
+        """
+        n_trajs trajectories that end when they reach a terminal state or
+        after max_steps steps (the same stopping rule as Agent.run)
+
+        :param sampler: pyrlap.core.sampling.Sampler to draw from (the
+        current one by default)
+        :return: Rollouts
+        """
+        if sampler is None:
+            sampler = get_sampler()
+        shape = (n_trajs, max_steps)
+        s_arr = np.full(shape, -1)
+        a_arr = np.full(shape, -1)
+        ns_arr = np.full(shape, -1)
+        r_arr = np.full(shape, np.nan)
+        lengths = np.zeros(n_trajs, dtype=int)
+
+        trajs = np.arange(n_trajs)
+        s = self._init_states(n_trajs, init_state, sampler)
+        for t in range(max_steps):
+            if not self.has_policy[s].all():
+                missing = s[~self.has_policy[s]][0]
+                raise ValueError("No policy for state %s"
+                                 % (self.ss[missing], ))
+            u = sampler.random_n(len(trajs))
+            a = (self.policy_cdf[s] <= u[:, None]).sum(axis=1)
+            a = np.minimum(a, len(self.aa) - 1)
+            ns, r = self.transitions.sample(s, a, sampler)
+            s_arr[trajs, t] = s
+            a_arr[trajs, t] = a
+            ns_arr[trajs, t] = ns
+            r_arr[trajs, t] = r
+            lengths[trajs] += 1
+            running = ~self.terminal[ns]
+            trajs, s = trajs[running], ns[running]
+            if len(trajs) == 0:
+                break
+
+        n_steps = lengths.max() if n_trajs > 0 else 0
+        return Rollouts(s_arr[:, :n_steps], a_arr[:, :n_steps],
+                        ns_arr[:, :n_steps], r_arr[:, :n_steps],
+                        lengths, self.ss, self.aa)
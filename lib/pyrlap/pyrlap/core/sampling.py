@@ -0,0 +1,165 @@
+from bisect import bisect_right
+from itertools import accumulate
+
+import numpy as np
+
+'''
+Categorical sampling for simulation loops. A CategoricalTable holds the
+outcomes of a distribution with their cumulative probabilities, so that a
+draw is one uniform number and a bisection, and tables can be built once
+per (s, a) or policy state and reused.
+
+Draws come from the current Sampler (see set_random_generator). By
+default this uses NumPy's global random state, one uniform per draw, and
+returns exactly what np.random.choice(len(p), p=p) would have, so
+np.random.seed keeps controlling simulations. Given an
+np.random.Generator (or a seed), uniforms are instead generated in blocks
+of buffer_size.
+'''
+
+# tolerance of np.random.choice on the sum of p
+PROB_ATOL = np.sqrt(np.finfo(np.float64).eps)
+
+class CategoricalTable(object):
+    """
+    Outcomes of a discrete distribution and their (normalized) cumulative
+    probabilities
+    """
+    __slots__ = ('outcomes', 'cdf', '_cdf_array')
+
+    def __init__(self, outcomes, probs):
+        # same checks and arithmetic as np.random.choice (a sequential
+        # cumsum that is divided by its last entry)
+        probs = [float(p) for p in probs]
+        if min(probs) < 0:
+            raise ValueError("probabilities are not non-negative")
+        cdf = list(accumulate(probs))
+        total = cdf[-1]
+        if abs(total - 1) > PROB_ATOL:
+            raise ValueError("probabilities do not sum to 1")
+        self.outcomes = tuple(outcomes)
+        self.cdf = [c/total for c in cdf]
+        self._cdf_array = None
+
+    @classmethod
+    def from_dict(cls, pdict):
+        return cls(pdict.keys(), pdict.values())
+
+    def __len__(self):
+        return len(self.outcomes)
+
+    def index(self, u):
+        """
+        Index of the outcome of uniform number u in [0, 1)
+        """
+        return bisect_right(self.cdf, u)
+
+    def indices(self, u):
+        """
+        Indices of the outcomes of an array of uniform numbers
+        """
+        if self._cdf_array is None:
+            self._cdf_array = np.array(self.cdf)
+        return np.searchsorted(self._cdf_array, u, side='right')
+
+class CompiledTransitions(object):
+    """
+    Next-state tables for every (s, a) of an MDP's sparse compiled model,
+    for sampling transitions of many integer-encoded states at once.
+    Outcomes of row s*|A| + a are entries indptr[row]:indptr[row + 1] and
+    their keys are row + (cumulative probability), so the outcome of u in
+    [0, 1) is the first key greater than row + u.
+    """
+    def __init__(self, mdp):
+        model = mdp.get_compiled_model(sparse=True)
+        self.model = model
+        self.n_actions = len(model.aa)
+        tf = model.tf
+        rows = np.repeat(np.arange(tf.shape[0]), np.diff(tf.indptr))
+        cdf = np.cumsum(tf.data.astype(np.float64))
+        row_start = np.concatenate([[0.0], cdf])[tf.indptr[:-1]]
+        row_total = cdf[tf.indptr[1:] - 1] - row_start
+        cdf = (cdf - row_start[rows])/row_total[rows]
+        cdf[tf.indptr[1:] - 1] = 1.0
+        self.keys = rows + cdf
+        self.next_states = tf.indices.copy()
+
+        # rewards are recomputed since the compiled ones are float32
+        ss, aa = model.ss, model.aa
+        self.rewards = np.array(
+            [mdp.reward(ss[r//self.n_actions], aa[r % self.n_actions],
+                        ss[nsi])
+             for r, nsi in zip(rows.tolist(), self.next_states.tolist())],
+            dtype=np.float64)
+
+    def sample(self, s, a, sampler=None):
+        """
+        Next state indices and rewards for arrays of state and action
+        indices
+        """
+        if sampler is None:
+            sampler = _sampler
+        rows = s*self.n_actions + a
+        u = sampler.random_n(len(rows))
+        k = np.searchsorted(self.keys, rows + u, side='right')
+        return self.next_states[k], self.rewards[k]
+
+class Sampler(object):
+    def __init__(self, rng=None, buffer_size=1024):
+        """
+        :param rng: np.random.Generator (or seed for one) to draw from.
+        None uses NumPy's global random state.
+        :param buffer_size: number of uniforms generated at a time by rng
+        """
+        if rng is not None and not isinstance(rng, np.random.Generator):
+            rng = np.random.default_rng(rng)
+        self.rng = rng
+        self.buffer_size = buffer_size
+        self._buffer = []
+
+    def random(self):
+        if self.rng is None:
+            return np.random.random_sample()
+        if len(self._buffer) == 0:
+            self._buffer = self.rng.random(self.buffer_size).tolist()
+            self._buffer.reverse()
+        return self._buffer.pop()
+
+    def random_n(self, n):
+        if self.rng is None:
+            return np.random.random_sample(n)
+        return self.rng.random(n)
+
+    def sample(self, table):
+        return table.outcomes[table.index(self.random())]
+
+    def sample_indices(self, table, n):
+        return table.indices(self.random_n(n))
+
+    def sample_n(self, table, n):
+        outcomes = table.outcomes
+        return [outcomes[i] for i in self.sample_indices(table, n).tolist()]
+
+    def sample_dict(self, pdict):
+        return self.sample(CategoricalTable.from_dict(pdict))
+
+_sampler = Sampler()
+
+def get_sampler():
+    return _sampler
+
+def set_random_generator(rng=None, buffer_size=1024):
+    """
+    Draw every sample from rng (an np.random.Generator or a seed) from now
+    on, or from NumPy's global random state again if rng is None. Returns
+    the new Sampler.
+    """
+    global _sampler
+    _sampler = Sampler(rng, buffer_size=buffer_size)
+    return _sampler
+
+def sample(table):
+    return _sampler.sample(table)
+
+def sample_n(table, n):
+    return _sampler.sample_n(table, n)
@@ -0,0 +1,143 @@
+import numpy as np
+
+class SparseTransitionModel(object):
+    """
+    Compiled (CSR) representation of a tabular transition function and the
+    rewards on each of its transitions.
+
+    Rows index the available (state, action) pairs, grouped by state in the
+    order the transition function iterates them. Columns index next states.
+    Rewards are stored alongside each transition probability so that a
+    Bellman backup never has to call back into the MDP.
+    """
+    def __init__(self, states, sa_state, sa_action, state_ptr, tp, rewards,
+                 action_rank):
+        self.states = states
+        self.state_index = {s: i for i, s in enumerate(states)}
+        self.sa_state = sa_state
+        self.sa_action = sa_action
+        self.state_ptr = state_ptr
+        self.tp = tp
+        self.rewards = rewards
+        self.action_rank = action_rank
+
+        # positions of the j-th transition of every row that has one, used
+        # to accumulate row sums in the same order as the dictionary solver
+        row_len = np.diff(tp.indptr)
+        self._row_terms = []
+        for j in range(row_len.max() if len(row_len) > 0 else 0):
+            rows = np.nonzero(row_len > j)[0]
+            self._row_terms.append((rows, tp.indptr[rows] + j))
+
+    @classmethod
+    def from_transition_function(cls, tf, reward):
+        """
+        :param tf: nested dictionary (or TransitionFunction) {s: {a: {ns: p}}}
+        :param reward: callable reward(s, a, ns)
+        """
+        states = list(tf.keys())
+        s_i = {s: i for i, s in enumerate(states)}
+        sa_state, sa_action, action_rank = [], [], []
+        state_ptr = [0, ]
+        indptr = [0, ]
+        indices, probs, rewards = [], [], []
+        for s, a_ns_p in tf.items():
+            if len(a_ns_p) == 0:
+                raise ValueError("State %s has no available actions" % (s,))
+            a_rank = {a: i for i, a in enumerate(sorted(a_ns_p.keys()))}
+            for a, ns_p in a_ns_p.items():
+                for ns, p in ns_p.items():
+                    indices.append(s_i[ns])
+                    probs.append(p)
+                    rewards.append(reward(s, a, ns))
+                indptr.append(len(indices))
+                sa_state.append(s_i[s])
+                sa_action.append(a)
+                action_rank.append(a_rank[a])
+            state_ptr.append(len(sa_action))
+
+        from scipy.sparse import csr_matrix
+        tp = csr_matrix(
+            (np.array(probs, dtype=np.float64),
+             np.array(indices, dtype=np.int64),
+             np.array(indptr, dtype=np.int64)),
+            shape=(len(sa_action), len(states))
+        )
+        return cls(states=states,
+                   sa_state=np.array(sa_state, dtype=np.int64),
+                   sa_action=sa_action,
+                   state_ptr=np.array(state_ptr, dtype=np.int64),
+                   tp=tp,
+                   rewards=np.array(rewards, dtype=np.float64),
+                   action_rank=np.array(action_rank, dtype=np.int64))
+
+    @property
+    def n_states(self):
+        return len(self.states)
+
+    @property
+    def n_state_actions(self):
+        return len(self.sa_action)
+
+    def transition_rewards(self, reward):
+        """
+        Rewards of every stored transition under a different reward
+        function over the same transition structure.
+
+        :param reward: callable reward(s, a, ns)
+        """
+        rewards = np.zeros(len(self.tp.data))
+        indptr, indices = self.tp.indptr, self.tp.indices
+        for row, (si, a) in enumerate(zip(self.sa_state, self.sa_action)):
+            s = self.states[si]
+            for j in range(indptr[row], indptr[row + 1]):
+                rewards[j] = reward(s, a, self.states[indices[j]])
+        return rewards
+
+    def backup(self, v, discount_rate, rewards=None):
+        """
+        Expected return of every (state, action) row given next-state
+        values v. Each row is summed term by term in transition order, so
+        results are identical to summing over the dictionary model.
+
+        v can also be a (K, |S|) stack of value functions, in which case
+        discount_rate is a length K array and rewards a (K, n_transitions)
+        array, and a (K, n_state_actions) array is returned.
+        """
+        if rewards is None:
+            rewards = self.rewards
+        discount_rate = np.asarray(discount_rate)
+        if discount_rate.ndim > 0:
+            discount_rate = discount_rate[..., None]
+        ev = self.tp.data*(rewards + discount_rate*v[..., self.tp.indices])
+        q = np.zeros(v.shape[:-1] + (self.n_state_actions, ))
+        for rows, pos in self._row_terms:
+            q[..., rows] += ev[..., pos]
+        return q
+
+    def state_max(self, q):
+        return np.maximum.reduceat(q, self.state_ptr[:-1], axis=-1)
+
+    def state_argmax(self, q, v=None):
+        """
+        Row index of the maximizing action for each state. Ties are broken
+        in favor of the action that comes first in sorted order.
+        """
+        if v is None:
+            v = self.state_max(q)
+        rank = np.where(q == v[self.sa_state],
+                        self.action_rank,
+                        np.iinfo(np.int64).max)
+        best_rank = np.minimum.reduceat(rank, self.state_ptr[:-1])
+        return np.nonzero(rank == best_rank[self.sa_state])[0]
+
+    def to_state_dict(self, v):
+        return dict(zip(self.states, v.tolist()))
+
+    def to_state_action_dict(self, q):
+        q = q.tolist()
+        sa_dict = {}
+        for si, s in enumerate(self.states):
+            start, end = self.state_ptr[si], self.state_ptr[si + 1]
+            sa_dict[s] = dict(zip(self.sa_action[start:end], q[start:end]))
+        return sa_dict
@@ -5,6 +5,8 @@ from collections import namedtuple
 
 import numpy as np
 
+from pyrlap.core.sampling import get_sampler
+
 logger = logging.getLogger(__name__)
 
 
@@ -89,6 +91,43 @@ def calc_esoftmax_dist(a_vals, temp=0.0, randchoose=0.0):
             a_p[a] = act_randchoose + rand_smp
     return a_p
 
+def calc_esoftmax_matrix(q, available=None, temp=0.0, randchoose=0.0):
+    """
+    Array version of calc_esoftmax_dist for a |S| x |A| array of action
+    values. available is a boolean array of the same shape marking the
+    actions that can be taken in each state (all of them by default).
+
+    Returns a |S| x |A| array of action probabilities, with 0 for
+    unavailable actions. Probabilities that underflow are set to 0 and
+    states with a single available action choose it with probability 1,
+    as in calc_esoftmax_dist.
+    """
+    q = np.asarray(q, dtype=np.float64)
+    if available is None:
+        available = np.ones(q.shape, dtype=bool)
+    n_avail = available.sum(axis=-1, keepdims=True)
+    tiny = np.finfo(np.float64).tiny
+    with np.errstate(all='ignore'):
+        q = np.where(available, q, -np.inf)
+        maxval = q.max(axis=-1, keepdims=True)
+        act_randchoose = randchoose/n_avail
+        if temp == 0.0:
+            maxacts = available & (q == maxval)
+            act_maxchoose = (1 - randchoose)/maxacts.sum(axis=-1,
+                                                         keepdims=True)
+            a_p = act_randchoose + np.where(maxacts, act_maxchoose, 0.0)
+        else:
+            p = np.exp((q - maxval)/temp)
+            p[p < tiny] = 0
+            sm = p/p.sum(axis=-1, keepdims=True)
+            sm[sm < tiny] = 0
+            rand_smp = (1 - randchoose)*sm
+            rand_smp[rand_smp < tiny] = 0
+            a_p = act_randchoose + rand_smp
+    a_p = np.where(available, a_p, 0.0)
+    a_p = np.where(n_avail == 1, available.astype(np.float64), a_p)
+    return a_p
+
 def calc_esoftmax_policy(sa_vals, temp=0.0, randchoose=0.0):
     policy = {}
     for s, a_q in sa_vals.items():
@@ -102,9 +141,7 @@ def calc_egreedy_dist(action_vals, rand_choose=0.0):
     return calc_esoftmax_dist(action_vals, randchoose=rand_choose, temp=0.0)
 
 def sample_prob_dict(pdict):
-    outs, p_s = zip(*pdict.items())
-    out_i = np.random.choice(range(len(outs)), p=p_s)
-    return outs[out_i]
+    return get_sampler().sample_dict(pdict)
 
 
 def calc_traj_probability(policy, traj, get_log=False):
@@ -0,0 +1,97 @@
+import weakref
+
+import numpy as np
+
+from pyrlap.core.sampling import CategoricalTable
+
+'''
+Compiled GridWorld dynamics. Transitions only depend on the geometry of a
+GridWorld (its size, walls, absorbing states, non-standard transition
+states and actions) and not on its rewards, so GridWorlds that only differ
+in their rewards (e.g. a set of reward hypotheses) share one GridDynamics,
+compiled when the first of them is constructed.
+'''
+
+_shared = weakref.WeakValueDictionary()
+
+def shared_dynamics(geometry, compile_dynamics):
+    """
+    The GridDynamics of geometry (a hashable key), compiled with
+    compile_dynamics() if no live GridWorld has it yet
+    """
+    try:
+        return _shared[geometry]
+    except KeyError:
+        pass
+    dynamics = compile_dynamics()
+    _shared[geometry] = dynamics
+    return dynamics
+
+class GridDynamics(object):
+    """
+    Transition distributions of every state and action as |S| x |A| x K
+    arrays of next state indices (-1 for padding) and probabilities, where
+    K is the largest number of outcomes of any (s, a). Outcomes keep the
+    order of the distributions they were compiled from.
+
+    dist and table raise KeyError for states and actions that were not
+    compiled.
+    """
+    def __init__(self, states, actions, transition_dist):
+        self.states = list(states)
+        self.actions = list(actions)
+        self.state_index = {s: i for i, s in enumerate(self.states)}
+        self.action_index = {a: i for i, a in enumerate(self.actions)}
+
+        dists = [[transition_dist(s, a) for a in self.actions]
+                 for s in self.states]
+        self.n_compiled = len(self.states)
+        # next states that are not among states get an index but no row
+        for s_dists in dists:
+            for dist in s_dists:
+                for ns in dist:
+                    if ns not in self.state_index:
+                        self.state_index[ns] = len(self.states)
+                        self.states.append(ns)
+
+        n_outcomes = max(len(d) for s_dists in dists for d in s_dists)
+        shape = (self.n_compiled, len(self.actions), n_outcomes)
+        self.next_states = np.full(shape, -1, dtype=np.int32)
+        self.probs = np.zeros(shape)
+        for si, s_dists in enumerate(dists):
+            for ai, dist in enumerate(s_dists):
+                for k, (ns, p) in enumerate(dist.items()):
+                    self.next_states[si, ai, k] = self.state_index[ns]
+                    self.probs[si, ai, k] = p
+
+        # dictionary and sampling views are built the first time an (s, a)
+        # is queried
+        self._dists = {}
+        self._tables = {}
+
+    def dist(self, s, a):
+        try:
+            return self._dists[(s, a)]
+        except KeyError:
+            pass
+        si, ai = self.state_index[s], self.action_index[a]
+        if si >= self.n_compiled:
+            raise KeyError(s)
+        states = self.states
+        dist = {}
+        for nsi, p in zip(self.next_states[si, ai].tolist(),
+                          self.probs[si, ai].tolist()):
+            if nsi < 0:
+                break
+            dist[states[nsi]] = p
+        self._dists[(s, a)] = dist
+        return dist
+
+    def table(self, s, a):
+        try:
+            return self._tables[(s, a)]
+        except KeyError:
+            pass
+        table = CategoricalTable.from_dict(self.dist(s, a))
+        self._tables[(s, a)] = table
+        return table
@@ -10,6 +10,8 @@ from pyrlap.core.mdp import MDP
 from pyrlap.core.reward_function import RewardFunction
 from pyrlap.algorithms.valueiteration import ValueIteration
 from pyrlap.core.util import sample_prob_dict, bidict
+from pyrlap.core.sampling import CategoricalTable, get_sampler
+from pyrlap.domains.gridworld.dynamics import GridDynamics, shared_dynamics
 class GridWorld(MDP):
     def __init__(self,
                  width=None,
@@ -186,8 +188,34 @@ class GridWorld(MDP):
 
         self.reward_cache = {}
         self.transition_cache = {}
+        self.transition_table_cache = {}
         self.available_action_cache = {}
         self.solved = False
+        self.dynamics = self._get_dynamics()
+
+    def _geometry(self):
+        """
+        Everything transition_dist depends on
+        """
+        return (
+            self.width,
+            self.height,
+            frozenset(self.walls),
+            self.absorbing_states,
+            frozenset([(s, tuple(nst)) for s, nst in
+                       self.non_std_t_states.items()]),
+            self.include_intermediate_terminal,
+            tuple(self.ACTION_LIST)
+        )
+
+    def _get_dynamics(self):
+        compile_dynamics = lambda: GridDynamics(
+            self.states, self.ACTION_LIST, self._compile_transition_dist)
+        try:
+            geometry = self._geometry()
+        except TypeError: #unhashable walls
+            return compile_dynamics()
+        return shared_dynamics(geometry, compile_dynamics)
 
     def __hash__(self):
         try:
@@ -202,8 +230,9 @@ class GridWorld(MDP):
             self.wall_action,
             self.reward_function,
             self.absorbing_states,
-            frozenset([(s, nst) for s, nst in self.non_std_t_states.items()]),
-            self.starting_states,
+            frozenset([(s, tuple(nst)) for s, nst in
+                       self.non_std_t_states.items()]),
+            frozenset(self.init_state_dist.items()),
             self.include_intermediate_terminal,
             self.intermediate_terminal,
             self.terminal_state
@@ -215,6 +244,19 @@ class GridWorld(MDP):
             return hash(self) == hash(other)
         return False
 
+    def _invalidate_compiled(self):
+        """
+        Also drops the cached hash, transitions and rewards and recompiles
+        the dynamics (call after changing the GridWorld's attributes)
+        """
+        MDP._invalidate_compiled(self)
+        self.__dict__.pop('hash', None)
+        self.reward_cache = {}
+        self.transition_cache = {}
+        self.transition_table_cache = {}
+        self.available_action_cache = {}
+        self.dynamics = self._get_dynamics()
+
     # ============================================== #
     #                                                #
     #                                                #
@@ -405,11 +447,20 @@ class GridWorld(MDP):
             return a
 
     def transition_dist(self, s, a):
+        try:
+            return self.dynamics.dist(s, a)
+        except KeyError:
+            pass
+        # states or actions outside of the compiled dynamics
         try:
             return self.transition_cache[(s, a)]
         except KeyError:
             pass
+        dist = self._compile_transition_dist(s, a)
+        self.transition_cache[(s, a)] = dist
+        return dist
 
+    def _compile_transition_dist(self, s, a):
         dist = {}
 
         # handle absorbing, terminal, and intermediate terminal states
@@ -493,16 +544,36 @@ class GridWorld(MDP):
             ns = self._normal_transition(s, a)
             dist = {ns :1}
 
-        self.transition_cache[(s, a)] = dist
         return dist
 
+    def transition_table(self, s, a):
+        try:
+            return self.dynamics.table(s, a)
+        except KeyError:
+            pass
+        try:
+            return self.transition_table_cache[(s, a)]
+        except KeyError:
+            pass
+        table = CategoricalTable.from_dict(self.transition_dist(s, a))
+        self.transition_table_cache[(s, a)] = table
+        return table
+
     def transition(self, s, a):
-        dist = self.transition_dist(s, a)
-        ns, p = list(zip(*list(dist.items())))
-        return ns[np.random.choice(len(ns), p=p)]
+        return get_sampler().sample(self.transition_table(s, a))
+
+    def transition_n(self, s, a, n):
+        """
+        n next states sampled with one call
+        """
+        return get_sampler().sample_n(self.transition_table(s, a), n)
 
     def transition_reward(self, s, a):
-        return sample_prob_dict(self.transition_reward_dist(s, a))
+        # (ns, r) outcomes have the same order and probabilities as the
+        # next states, so this draws what sampling transition_reward_dist
+        # would
+        ns = self.transition(s, a)
+        return ns, self.reward(s, a, ns)
 
     def transition_reward_dist(self, s, a):
         tdist = self.transition_dist(s, a)
@@ -5,7 +5,6 @@ import numpy as np
 from pyrlap.core.mdp import MDP
 from pyrlap.core.util import sample_prob_dict
 from pyrlap.domains.gridworld import GridWorld
-from .vis import visualize_taxicab_transition
 
 default_walls = [((0, 0), '>'), ((1, 0), '<'),
                   ((0, 1), '>'), ((1, 1), '<'),
@@ -316,6 +315,8 @@ class TaxiCabMDP(MDP):
         )
 
     def plot(self, ax=None, figsize=(10, 10)):
+        #depends on matplotlib, which not every dist will have
+        from .vis import visualize_taxicab_transition
         return visualize_taxicab_transition(
             ax=ax, figsize=figsize,
             width=self.width, height=self.height,
@@ -0,0 +1,38 @@
+from pyrlap.domains.gridworld import GridWorld
+
+'''
+Small GridWorlds shared by the tests
+'''
+
+SLIPPERY_REWARDS = {'.': -.1, 'x': -1, 's': 0, 'y': 5}
+
+def slippery_gridworld(feature_rewards=None, slippery=True, **kwargs):
+    """
+    4 x 4 grid starting in the bottom left with an absorbing goal 'y' in
+    the top right, 'x' tiles to avoid and (if slippery) an 's' tile where
+    actions go forward with p=.6 and to either side with p=.2
+    """
+    if feature_rewards is None:
+        feature_rewards = SLIPPERY_REWARDS
+    if slippery:
+        kwargs['non_std_t_features'] = {'s': {'forward': .6, 'side': .4}}
+    return GridWorld(
+        gridworld_array=['...y',
+                         '.xx.',
+                         '.s..',
+                         '.x..'],
+        feature_rewards=feature_rewards,
+        absorbing_features=['y'],
+        init_state=(0, 0),
+        **kwargs)
+
+def open_gridworld():
+    """
+    4 x 3 grid without any absorbing states, so that no policy ever ends
+    """
+    return GridWorld(
+        gridworld_array=['....',
+                         '.x..',
+                         '....'],
+        feature_rewards={'.': -.1, 'x': -1},
+        init_state=(0, 0))
@@ -0,0 +1,45 @@
+import unittest
+
+import numpy as np
+
+from pyrlap.tests.gridworlds import slippery_gridworld
+from pyrlap.algorithms.qlearning import Qlearning
+from pyrlap.algorithms.batch_qlearning import BatchQlearning
+
+class BatchQlearningTestCase(unittest.TestCase):
+    def setUp(self):
+        self.mdp = slippery_gridworld()
+
+    def test_same_updates_as_qlearning(self):
+        # replaying each run's transitions through Qlearning gives the same
+        # q-values
+        for trace_kwargs in [
+            {},
+            {'eligibility_trace_decay': .9},
+            {'eligibility_trace_decay': .8,
+             'eligibility_trace_method': 'cumulative'}
+        ]:
+            np.random.seed(0)
+            batch = BatchQlearning(self.mdp, n_runs=4, softmax_temp=.5,
+                                   randchoose=.1, **trace_kwargs)
+            run_data = batch.train(episodes=20, max_steps=30,
+                                   run_ids=list('abcd'),
+                                   return_run_data=True)
+            for run, run_id in enumerate('abcd'):
+                records = [d for d in run_data if d['run_id'] == run_id]
+                learner = Qlearning(self.mdp, **trace_kwargs)
+                for i, d in enumerate(records):
+                    self.assertEqual(set(d), {'episode', 'timestep', 's',
+                                              'a', 'ns', 'r', 'run_id'})
+                    self.assertEqual(d['r'],
+                                     self.mdp.reward(d['s'], d['a'], d['ns']))
+                    if i > 0 and d['episode'] != records[i - 1]['episode']:
+                        learner.episode_reset()
+                    learner.process(d['s'], d['a'], d['ns'], d['r'])
+                self.assertEqual(records[-1]['episode'], 19)
+                batch_qvalues = batch.qvalues(run)
+                for s, a_q in learner.qvalues.items():
+                    self.assertEqual(a_q, batch_qvalues[s])
+
+if __name__ == '__main__':
+    unittest.main()
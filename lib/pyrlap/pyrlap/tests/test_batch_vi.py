@@ -0,0 +1,33 @@
+import unittest
+from itertools import product
+
+from pyrlap.tests.gridworlds import slippery_gridworld
+from pyrlap.algorithms.valueiteration import ValueIteration
+from pyrlap.algorithms.batch_vi import BatchValueIteration
+
+class BatchValueIterationTestCase(unittest.TestCase):
+    def setUp(self):
+        self.mdps = []
+        for rx, rs in product([0, -1], repeat=2):
+            self.mdps.append(slippery_gridworld(
+                {'.': -.1, 'x': rx, 's': rs, 'y': 5}))
+
+    def test_same_as_value_iteration(self):
+        discount_rates = [.95, .9, .95, .8]
+        batch_planners = BatchValueIteration(
+            self.mdps, discount_rates=discount_rates).solve()
+        for mdp, dr, batch_planner in \
+                zip(self.mdps, discount_rates, batch_planners):
+            planner = ValueIteration(mdp, discount_rate=dr, engine='sparse')
+            planner.solve()
+            self.assertEqual(planner.value_function,
+                             batch_planner.value_function)
+            self.assertEqual(planner.action_value_function,
+                             batch_planner.action_value_function)
+            self.assertEqual(planner.optimal_policy,
+                             batch_planner.optimal_policy)
+            self.assertEqual(planner.iterations_run,
+                             batch_planner.iterations_run)
+
+if __name__ == '__main__':
+    unittest.main()
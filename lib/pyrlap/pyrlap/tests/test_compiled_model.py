@@ -0,0 +1,63 @@
+import unittest
+
+import numpy as np
+
+from pyrlap.tests.gridworlds import slippery_gridworld
+from pyrlap.core.sparse_model import SparseTransitionModel
+
+class CompiledModelTestCase(unittest.TestCase):
+    def setUp(self):
+        self.mdp = slippery_gridworld()
+
+    def test_sparse_matrices_same_as_dense(self):
+        dense = self.mdp.as_matrices()
+        sparse = self.mdp.as_matrices(sparse=True)
+        n_s, n_a = len(dense['ss']), len(dense['aa'])
+        self.assertEqual(dense['ss'], sparse['ss'])
+        self.assertEqual(dense['aa'], sparse['aa'])
+        for m in ['tf', 'rf']:
+            self.assertTrue(np.array_equal(
+                sparse[m].toarray().reshape((n_s, n_a, n_s)), dense[m]))
+
+    def test_transition_rewards_and_backup(self):
+        tf, _ = self.mdp.get_reachable_transition_reward_functions()
+        model = SparseTransitionModel.from_transition_function(
+            tf, self.mdp.reward)
+        self.assertTrue(np.array_equal(
+            model.transition_rewards(self.mdp.reward), model.rewards))
+
+        # other rewards over the same transitions
+        other = slippery_gridworld({'.': 0, 'x': -2, 's': 1, 'y': 5})
+        rewards = model.transition_rewards(other.reward)
+
+        v = np.random.RandomState(0).normal(size=model.n_states)
+        vs = np.array([v, 2*v])
+        q = model.backup(vs, np.array([.9, .5]),
+                         rewards=np.array([model.rewards, rewards]))
+        for k, (mdp, dr) in enumerate([(self.mdp, .9), (other, .5)]):
+            v_k = dict(zip(model.states, vs[k]))
+            for row, (si, a) in enumerate(zip(model.sa_state,
+                                              model.sa_action)):
+                s = model.states[si]
+                q_sa = 0
+                for ns, p in tf[s][a].items():
+                    q_sa += p*(mdp.reward(s, a, ns) + dr*v_k[ns])
+                self.assertEqual(q[k, row], q_sa)
+
+    def test_invalidate_compiled(self):
+        model = self.mdp.get_compiled_model(sparse=True)
+        self.assertIs(self.mdp.get_compiled_model(sparse=True), model)
+        old_hash = hash(self.mdp)
+
+        other = slippery_gridworld({'.': 0, 'x': -2, 's': 1, 'y': 5})
+        self.mdp.reward_function = other.reward_function
+        self.mdp._invalidate_compiled()
+        self.assertNotEqual(hash(self.mdp), old_hash)
+        new_model = self.mdp.get_compiled_model(sparse=True)
+        self.assertIsNot(new_model, model)
+        self.assertTrue(np.array_equal(
+            new_model.rf.toarray(),
+            other.get_compiled_model(sparse=True).rf.toarray()))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,29 @@
+import unittest
+
+from pyrlap.tests.gridworlds import slippery_gridworld
+
+class GridDynamicsTestCase(unittest.TestCase):
+    def test_shared_across_equal_geometries(self):
+        mdps = [slippery_gridworld({'.': 0, 'x': rx, 's': 0, 'y': 5})
+                for rx in [0, -1, -2]]
+        self.assertIs(mdps[0].dynamics, mdps[1].dynamics)
+        self.assertIs(mdps[0].dynamics, mdps[2].dynamics)
+        self.assertEqual(mdps[0].transition_dist((1, 1), '^'),
+                         {(1, 2): .6, (0, 1): .2, (2, 1): .2})
+
+    def test_not_shared_across_different_geometries(self):
+        base = slippery_gridworld(slippery=False)
+        others = [
+            slippery_gridworld(),
+            slippery_gridworld(slippery=False, walls=[((0, 0), '^')]),
+            slippery_gridworld(slippery=False,
+                               include_intermediate_terminal=True),
+            slippery_gridworld(slippery=False, wait_action=True),
+        ]
+        for other in others:
+            self.assertIsNot(base.dynamics, other.dynamics)
+        self.assertEqual(base.transition_dist((0, 0), '^'), {(0, 1): 1})
+        self.assertEqual(others[1].transition_dist((0, 0), '^'), {(0, 0): 1})
+
+if __name__ == '__main__':
+    unittest.main()
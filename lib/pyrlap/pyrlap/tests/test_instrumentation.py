@@ -0,0 +1,67 @@
+import unittest
+
+from pyrlap.tests.gridworlds import slippery_gridworld
+from pyrlap.algorithms.valueiteration import ValueIteration
+from pyrlap.algorithms.policyiteration import PolicyIteration
+from pyrlap.algorithms.soft_vi import SoftValueIteration
+from pyrlap.core.instrumentation import Metrics
+
+class MetricsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.mdp = slippery_gridworld()
+        self.n_states = len(self.mdp.get_states())
+
+    def test_value_iteration_metrics(self):
+        for engine in ['dict', 'sparse']:
+            metrics = Metrics()
+            planner = ValueIteration(self.mdp, discount_rate=.95,
+                                     engine=engine, policy_tables=True,
+                                     metrics=metrics)
+            planner.solve()
+            s = self.mdp.get_init_state()
+            planner.act_dist(s)
+            planner.act_dist(s)
+
+            phases = ['model build', 'solve', 'policy extraction']
+            if engine == 'sparse':
+                phases.insert(1, 'model compile')
+            self.assertEqual(list(metrics.phase_seconds), phases)
+            self.assertEqual(set(metrics.phase_calls.values()), {1})
+
+            self.assertEqual([r['iteration'] for r in metrics.iterations],
+                             list(range(planner.iterations_run + 1)))
+            self.assertTrue(all(r['planner'] == 'ValueIteration' and
+                                r['backups'] == self.n_states
+                                for r in metrics.iterations))
+            self.assertLess(metrics.iterations[-1]['bellman_error'],
+                            planner.converge_delta)
+            self.assertEqual(metrics.backups['ValueIteration'],
+                             planner.backups_run)
+
+            self.assertEqual(metrics.hit_rate('policy table'), .5)
+            self.assertEqual(metrics.hit_rate('policy matrix'), .5)
+
+            unmetered = ValueIteration(self.mdp, discount_rate=.95,
+                                       engine=engine)
+            unmetered.solve()
+            self.assertEqual(unmetered.action_value_function,
+                             planner.action_value_function)
+
+    def test_scoped_planners(self):
+        metrics = Metrics()
+        PolicyIteration(self.mdp, discount_rate=.95,
+                        metrics=metrics.scoped('pi')).solve()
+        SoftValueIteration(self.mdp, discount_rate=.95, softmax_temp=1,
+                           metrics=metrics.scoped('soft')).solve()
+        self.assertEqual(set(metrics.iteration_counts),
+                         {'pi/PolicyIteration', 'soft/SoftValueIteration'})
+        self.assertIn('pi/solve', metrics.phase_seconds)
+        self.assertIn('soft/solve', metrics.phase_seconds)
+        summary = Metrics(keep_iterations=False)
+        ValueIteration(self.mdp, discount_rate=.95, metrics=summary).solve()
+        self.assertEqual(summary.iterations, [])
+        self.assertGreater(summary.summary()['iterations']['ValueIteration'],
+                           0)
+
+if __name__ == '__main__':
+    unittest.main()
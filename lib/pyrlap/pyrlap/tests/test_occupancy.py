@@ -0,0 +1,71 @@
+import unittest
+import warnings
+
+import numpy as np
+
+from pyrlap.tests.gridworlds import slippery_gridworld, open_gridworld
+from pyrlap.algorithms.valueiteration import ValueIteration
+
+class OccupancyTestCase(unittest.TestCase):
+    def setUp(self):
+        self.planner = ValueIteration(slippery_gridworld(), softmax_temp=.5)
+        self.planner.solve()
+
+    def test_singular_system_warns_once(self):
+        for sparse in [False, True]:
+            with warnings.catch_warnings(record=True) as caught:
+                warnings.simplefilter('always')
+                occ = self.planner.calc_occupancy(normalize=True,
+                                                  sparse=sparse)
+            self.assertEqual(len(caught), 1)
+            self.assertIn('singular', str(caught[0].message))
+            self.assertTrue(np.isclose(sum(occ.values()), 1))
+
+    def test_same_as_successor_representation(self):
+        for normalize in [False, True]:
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore')
+                occ = self.planner.calc_occupancy(normalize=normalize)
+                sr = self.planner.successor_representation(
+                    normalize=normalize, return_matrix=True)
+            model = self.planner.mdp.get_compiled_model()
+            expected = model.s0.astype(np.float64).dot(sr)
+            self.assertTrue(np.allclose(
+                [occ[s] for s in model.ss], expected, atol=1e-8))
+
+    def test_value_same_as_evaluate(self):
+        for sparse in [False, True]:
+            vf, _ = self.planner.evaluate(sparse=sparse)
+            self.assertEqual(dict(self.planner.value(sparse=sparse)),
+                             dict(vf))
+
+class NonAbsorbingOccupancyTestCase(unittest.TestCase):
+    def setUp(self):
+        self.planner = ValueIteration(open_gridworld(), softmax_temp=1,
+                                      max_iterations=1000)
+        self.planner.solve()
+
+    def test_falls_back_to_discounted(self):
+        # I - P is singular up to rounding, so the undiscounted solve
+        # "succeeds" with huge occupancies unless its residual is checked
+        for sparse in [False, True]:
+            with warnings.catch_warnings(record=True) as caught:
+                warnings.simplefilter('always')
+                occ = self.planner.calc_occupancy(sparse=sparse)
+                sr = self.planner.successor_representation(
+                    sparse=sparse, return_matrix=True)
+            self.assertEqual(len(caught), 2)
+            for w in caught:
+                self.assertIn('singular', str(w.message))
+            self.assertEqual(
+                occ, self.planner.calc_occupancy(discounted=True,
+                                                 sparse=sparse))
+            discounted_sr = self.planner.successor_representation(
+                discounted=True, sparse=sparse, return_matrix=True)
+            if sparse:
+                sr, discounted_sr = sr.toarray(), discounted_sr.toarray()
+            self.assertTrue(np.array_equal(sr, discounted_sr))
+            self.assertTrue(np.isclose(sum(occ.values()), 1/(1 - .99)))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import unittest
+
+from pyrlap.tests.gridworlds import slippery_gridworld, open_gridworld
+from pyrlap.algorithms.valueiteration import ValueIteration
+from pyrlap.algorithms.policyiteration import PolicyIteration
+
+class PolicyIterationTestCase(unittest.TestCase):
+    def setUp(self):
+        self.mdp = slippery_gridworld()
+        self.discount_rate = .95
+        self.vi = ValueIteration(self.mdp, discount_rate=self.discount_rate,
+                                 converge_delta=1e-8, max_iterations=1000)
+        self.vi.solve()
+
+    def _assert_same_as_vi(self, planner, tol):
+        for s, v in self.vi.value_function.items():
+            self.assertAlmostEqual(planner.value_function[s], v, delta=tol)
+        self.assertEqual(planner.optimal_policy, self.vi.optimal_policy)
+
+    def test_exact_evaluation(self):
+        planner = PolicyIteration(self.mdp,
+                                  discount_rate=self.discount_rate)
+        planner.solve()
+        self._assert_same_as_vi(planner, tol=1e-6)
+
+    def test_modified_policy_iteration(self):
+        planner = PolicyIteration(self.mdp,
+                                  discount_rate=self.discount_rate,
+                                  converge_delta=1e-8,
+                                  eval_iterations=5)
+        planner.solve()
+        self._assert_same_as_vi(planner, tol=1e-6)
+
+    def test_undiscounted_exact_evaluation(self):
+        vi = ValueIteration(self.mdp, discount_rate=1, converge_delta=1e-10,
+                            max_iterations=1000)
+        vi.solve()
+        # start from a policy that reaches the goal
+        planner = PolicyIteration(
+            self.mdp, discount_rate=1,
+            init_value_function=self.vi.value_function)
+        planner.solve()
+        for s, v in vi.value_function.items():
+            self.assertAlmostEqual(planner.value_function[s], v, delta=1e-8)
+        self.assertEqual(planner.optimal_policy, vi.optimal_policy)
+
+        planner = PolicyIteration(open_gridworld(), discount_rate=1)
+        with self.assertRaises(ValueError):
+            planner.solve()
+
+if __name__ == '__main__':
+    unittest.main()
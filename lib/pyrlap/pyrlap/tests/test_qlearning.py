@@ -0,0 +1,34 @@
+import unittest
+
+import numpy as np
+
+from pyrlap.tests.gridworlds import slippery_gridworld
+from pyrlap.algorithms.qlearning import Qlearning, ArrayQlearning
+
+class ArrayQlearningTestCase(unittest.TestCase):
+    def setUp(self):
+        self.mdp = slippery_gridworld(slippery=False)
+
+    def _train(self, learner_class, seed=0, **kwargs):
+        np.random.seed(seed)
+        learner = learner_class(self.mdp, softmax_temp=.5, randchoose=.1,
+                                **kwargs)
+        run_data = learner.train(episodes=30, max_steps=50,
+                                 return_run_data=True)
+        return run_data, learner.qvalues
+
+    def test_same_as_qlearning(self):
+        for trace_kwargs in [
+            {},
+            {'eligibility_trace_decay': .9},
+            {'eligibility_trace_decay': .8,
+             'eligibility_trace_method': 'cumulative'}
+        ]:
+            run_data, qvalues = self._train(Qlearning, **trace_kwargs)
+            array_run_data, array_qvalues = \
+                self._train(ArrayQlearning, **trace_kwargs)
+            self.assertEqual(run_data, array_run_data)
+            self.assertEqual(qvalues, array_qvalues)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import unittest
+
+import numpy as np
+
+from pyrlap.tests.gridworlds import slippery_gridworld
+from pyrlap.core.rollouts import RolloutSimulator
+from pyrlap.core.sampling import Sampler
+from pyrlap.core.util import SANSRTuple
+
+class RolloutSimulatorTestCase(unittest.TestCase):
+    def setUp(self):
+        mdp = slippery_gridworld()
+        self.mdp = mdp
+        self.planner = mdp.solve(discount_rate=.95, softmax_temp=.5,
+                                 randchoose=.1)
+
+    def test_seeded_reproducibility(self):
+        simulator = RolloutSimulator(self.planner)
+        rollouts = [simulator.run(50, max_steps=20, sampler=Sampler(1))
+                    for _ in range(2)]
+        for m in ['s', 'a', 'ns', 'r', 'lengths']:
+            self.assertTrue(np.array_equal(getattr(rollouts[0], m),
+                                           getattr(rollouts[1], m),
+                                           equal_nan=(m == 'r')))
+
+        trajs = []
+        for _ in range(2):
+            np.random.seed(2)
+            trajs.append(self.planner.run_many(50, max_steps=20,
+                                               as_tuples=True))
+        self.assertEqual(trajs[0], trajs[1])
+
+    def test_trajectories(self):
+        rollouts = RolloutSimulator(self.planner).run(
+            200, max_steps=20, sampler=Sampler(0))
+        self.assertEqual(rollouts.s.shape[1], rollouts.lengths.max())
+        for traj in rollouts.to_trajectories():
+            self.assertTrue(1 <= len(traj) <= 20)
+            self.assertEqual(traj[0].s, (0, 0))
+            for i, step in enumerate(traj):
+                self.assertIsInstance(step, SANSRTuple)
+                self.assertIn(step.ns,
+                              self.mdp.transition_dist(step.s, step.a))
+                self.assertEqual(step.r,
+                                 self.mdp.reward(step.s, step.a, step.ns))
+                if i < len(traj) - 1:
+                    self.assertEqual(step.ns, traj[i + 1].s)
+                    self.assertFalse(self.mdp.is_terminal(step.ns))
+            if len(traj) < 20:
+                self.assertTrue(self.mdp.is_terminal(traj[-1].ns))
+
+if __name__ == '__main__':
+    unittest.main()
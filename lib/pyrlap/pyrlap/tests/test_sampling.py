@@ -0,0 +1,52 @@
+import unittest
+
+import numpy as np
+
+from pyrlap.core import sampling
+from pyrlap.core.sampling import CategoricalTable, Sampler
+
+class SamplingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.pdict = {'a': .1, 'b': 0, 'c': .25, 'd': .65}
+        self.table = CategoricalTable.from_dict(self.pdict)
+
+    def tearDown(self):
+        sampling.set_random_generator(None)
+
+    def test_same_draws_as_np_random_choice(self):
+        outcomes, probs = zip(*self.pdict.items())
+        np.random.seed(0)
+        expected = [outcomes[np.random.choice(len(outcomes), p=probs)]
+                    for _ in range(500)]
+        np.random.seed(0)
+        sampler = Sampler()
+        self.assertEqual([sampler.sample(self.table) for _ in range(500)],
+                         expected)
+        np.random.seed(0)
+        self.assertEqual(sampler.sample_n(self.table, 500), expected)
+
+    def test_seeded_generator(self):
+        draws = []
+        for _ in range(2):
+            sampling.set_random_generator(3, buffer_size=7)
+            draws.append([sampling.sample(self.table) for _ in range(50)] +
+                         sampling.sample_n(self.table, 50))
+        self.assertEqual(draws[0], draws[1])
+        self.assertNotIn('b', draws[0])
+
+        counts = Sampler(0).sample_indices(self.table, 100000)
+        freqs = np.bincount(counts, minlength=4)/100000
+        self.assertTrue(np.allclose(freqs, list(self.pdict.values()),
+                                    atol=.01))
+
+    def test_invalid_probabilities(self):
+        from pyrlap.core.util import sample_prob_dict
+        for pdict in [{'a': .5, 'b': .6}, {'a': -.5, 'b': 1.5}]:
+            with self.assertRaises(ValueError):
+                CategoricalTable.from_dict(pdict)
+            with self.assertRaises(ValueError):
+                sample_prob_dict(pdict)
+        CategoricalTable.from_dict({'a': 1/3, 'b': 1/3, 'c': 1/3})
+
+if __name__ == '__main__':
+    unittest.main()
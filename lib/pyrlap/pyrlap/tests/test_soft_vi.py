@@ -0,0 +1,70 @@
+import unittest
+
+import numpy as np
+from scipy.special import logsumexp
+
+from pyrlap.tests.gridworlds import slippery_gridworld
+from pyrlap.algorithms.soft_vi import SoftValueIteration
+
+class SoftBackupTestCase(unittest.TestCase):
+    def test_fast_mode_logsumexp_backup(self):
+        mdp = slippery_gridworld()
+        temp, discount_rate = 2, .9
+        planner = SoftValueIteration(mdp, softmax_temp=temp,
+                                     discount_rate=discount_rate,
+                                     converge_delta=1e-12,
+                                     max_iterations=1000, mode='fast')
+        planner.solve()
+        v, q = planner.value_function, planner.action_value_function
+        for s, a_q in q.items():
+            q_s = np.array(list(a_q.values()))
+            self.assertAlmostEqual(v[s], logsumexp(temp*q_s)/temp,
+                                   places=10)
+            pol = np.array([planner.optimal_policy[s][a] for a in a_q])
+            self.assertTrue(np.allclose(pol, np.exp(temp*(q_s - v[s]))))
+            # the compiled transition probabilities are float32
+            for a, q_sa in a_q.items():
+                expected = sum(
+                    p*(mdp.reward(s, a, ns) + discount_rate*v[ns])
+                    for ns, p in mdp.transition_dist(s, a).items())
+                self.assertAlmostEqual(q_sa, expected, places=6)
+
+        with self.assertRaises(ValueError):
+            SoftValueIteration(mdp, softmax_temp=0, mode='fast')
+
+try:
+    import torch
+except ImportError:
+    torch = None
+
+@unittest.skipIf(torch is None, "torch is not installed")
+class TorchBackendTestCase(unittest.TestCase):
+    def setUp(self):
+        self.mdp = slippery_gridworld()
+
+    def assertPlannersClose(self, p1, p2, tol):
+        for s, v in p1.value_function.items():
+            self.assertAlmostEqual(v, p2.value_function[s], delta=tol)
+            for a, q in p1.action_value_function[s].items():
+                self.assertAlmostEqual(
+                    q, p2.action_value_function[s][a], delta=tol)
+                self.assertAlmostEqual(
+                    p1.optimal_policy[s][a], p2.optimal_policy[s][a],
+                    delta=tol)
+
+    def test_torch_same_as_numpy(self):
+        # legacy iterates in float32, so the backends only agree up to
+        # float32 rounding
+        for mode, tol in [('legacy', 1e-5), ('fast', 1e-12)]:
+            for sparse in [False, True]:
+                planners = []
+                for backend in ['numpy', 'torch']:
+                    planner = SoftValueIteration(
+                        self.mdp, softmax_temp=2, sparse=sparse,
+                        backend=backend, mode=mode)
+                    planner.solve()
+                    planners.append(planner)
+                self.assertPlannersClose(*planners, tol=tol)
+
+if __name__ == '__main__':
+    unittest.main()
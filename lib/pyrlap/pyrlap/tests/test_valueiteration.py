@@ -0,0 +1,115 @@
+import unittest
+
+import numpy as np
+
+from pyrlap.tests.gridworlds import slippery_gridworld, open_gridworld
+from pyrlap.algorithms.valueiteration import ValueIteration
+
+class SparseEngineTestCase(unittest.TestCase):
+    def setUp(self):
+        self.mdp = slippery_gridworld()
+
+    def test_sparse_same_as_dict(self):
+        planners = {}
+        for engine in ['dict', 'sparse']:
+            planners[engine] = ValueIteration(self.mdp, discount_rate=.95,
+                                              engine=engine)
+            planners[engine].solve()
+        self.assertEqual(planners['dict'].value_function,
+                         planners['sparse'].value_function)
+        self.assertEqual(planners['dict'].action_value_function,
+                         planners['sparse'].action_value_function)
+        self.assertEqual(planners['dict'].optimal_policy,
+                         planners['sparse'].optimal_policy)
+
+class PolicyTableTestCase(unittest.TestCase):
+    def setUp(self):
+        self.mdp = slippery_gridworld()
+
+    def test_policy_tables_same_as_act_dist(self):
+        planners = {}
+        for policy_tables in [False, True]:
+            planners[policy_tables] = ValueIteration(
+                self.mdp, discount_rate=.95, softmax_temp=.5, randchoose=.1,
+                policy_tables=policy_tables)
+            planners[policy_tables].solve()
+        for temp, randchoose in [(None, None), (0.0, 0.0), (0.0, .2),
+                                 (1.0, 0.0)]:
+            kwargs = dict(softmax_temp=temp, randchoose=randchoose)
+            for s in self.mdp.get_states():
+                a_p = planners[False].act_dist(s, **kwargs)
+                table_a_p = planners[True].act_dist(s, **kwargs)
+                self.assertEqual(list(a_p), list(table_a_p))
+                for a, p in a_p.items():
+                    self.assertAlmostEqual(p, table_a_p[a], places=12)
+        self.assertTrue(np.allclose(planners[False].as_matrix(),
+                                    planners[True].as_matrix(),
+                                    rtol=0, atol=1e-12))
+
+    def test_act_tables_bounded(self):
+        planner = ValueIteration(self.mdp, discount_rate=.95,
+                                 policy_cache_size=2)
+        planner.solve()
+        s = self.mdp.get_init_state()
+        for temp in [.1, .2, .3, .2]:
+            planner.act(s, softmax_temp=temp)
+        self.assertEqual(list(planner._act_tables), [(.3, 0.0), (.2, 0.0)])
+        planner.solve()
+        planner.act(s)
+        self.assertEqual(list(planner._act_tables), [(0.0, 0.0)])
+
+class SweepTestCase(unittest.TestCase):
+    def setUp(self):
+        self.mdp = slippery_gridworld()
+
+    def test_sweeps_converge_to_jacobi(self):
+        discount_rate, converge_delta = .95, 1e-6
+        # every sweep stops within converge_delta*dr/(1 - dr) of the fixed
+        # point
+        tol = 2*converge_delta*discount_rate/(1 - discount_rate)
+        planners = {}
+        for sweep in ['jacobi', 'gauss-seidel', 'prioritized']:
+            planners[sweep] = ValueIteration(
+                self.mdp, discount_rate=discount_rate,
+                converge_delta=converge_delta, max_iterations=1000,
+                sweep=sweep)
+            planners[sweep].solve()
+        jacobi = planners['jacobi']
+        for sweep in ['gauss-seidel', 'prioritized']:
+            for s, v in jacobi.value_function.items():
+                self.assertAlmostEqual(planners[sweep].value_function[s], v,
+                                       delta=tol)
+            self.assertEqual(planners[sweep].optimal_policy,
+                             jacobi.optimal_policy)
+
+class WarmStartTestCase(unittest.TestCase):
+    def setUp(self):
+        # without absorbing states, the number of iterations depends on
+        # how far the initial values are from the fixed point
+        self.mdp = open_gridworld()
+
+    def test_warm_start_converges_faster(self):
+        discount_rate, converge_delta = .95, 1e-8
+        tol = 2*converge_delta*discount_rate/(1 - discount_rate)
+        kwargs = dict(discount_rate=discount_rate,
+                      converge_delta=converge_delta, max_iterations=1000)
+        for engine, sweep in [('dict', 'jacobi'), ('dict', 'gauss-seidel'),
+                              ('dict', 'prioritized'), ('sparse', 'jacobi')]:
+            cold = ValueIteration(self.mdp, engine=engine, sweep=sweep,
+                                  **kwargs)
+            cold.solve()
+            neighbor = ValueIteration(self.mdp, engine=engine, sweep=sweep,
+                                      **dict(kwargs, discount_rate=.9))
+            neighbor.solve()
+            for init_vf in [neighbor.value_function,
+                            neighbor.action_value_function]:
+                warm = ValueIteration(self.mdp, engine=engine, sweep=sweep,
+                                      init_value_function=init_vf, **kwargs)
+                warm.solve()
+                self.assertLess(warm.iterations_run, cold.iterations_run)
+                for s, v in cold.value_function.items():
+                    self.assertAlmostEqual(warm.value_function[s], v,
+                                           delta=tol)
+
+if __name__ == '__main__':
+    unittest.main()
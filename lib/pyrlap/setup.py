@@ -13,7 +13,8 @@ setup(name='pyrlap',
       author_email='mark.ho.cs@gmail.com',
       license='MIT',
       packages=['pyrlap'],
-      install_requires=['numpy', 'matplotlib', 'scipy', 'torch'],
+      install_requires=['numpy', 'matplotlib', 'scipy'],
+      extras_require={'torch': ['torch']},
       test_suite='nose.collector',
       tests_require=['nose'],
       zip_safe=False)